@@ -13,12 +13,14 @@ from nilearn import image
 import nibabel as nib
 import plotly.express as px
 import shape_utils
+from superpixels import SuperpixelIndex, SliceMaskCache
 from sys import exit
 import io
 import base64
 import skimage
 import time
 import os
+from functools import lru_cache
 
 DEBUG_MASK = False
 DEFAULT_STROKE_COLOR = px.colors.qualitative.Light24[0]
@@ -168,6 +170,10 @@ if len(SAVE_SUPERPIXEL) > 0:
     exit(0)
 
 seg_img = img_as_ubyte(segl)
+# voxels of each superpixel, to select whole superpixels beneath the shapes
+seg_index = SuperpixelIndex(seg)
+# masks of the shapes drawn on each slice, rasterized again only when they change
+slice_masks = SliceMaskCache()
 img_slices, seg_slices = [
     [
         # top
@@ -501,6 +507,9 @@ app.layout = html.Div(
                                 ),
                                 # This store has to be put here so dcc.Loading sees that it is updating.
                                 dcc.Store(id="found-segs", data=found_seg_slices),
+                                # Only the slices of "found-segs" that changed,
+                                # merged into it clientside
+                                dcc.Store(id="found-segs-update", data=None),
                             ],
                         ),
                         html.Div(
@@ -520,6 +529,8 @@ app.layout = html.Div(
         ),
         dcc.Store(id="fig-3d-scene", data=default_3d_layout,),
         dcc.Store(id="current-render-id", data=0),
+        # the labels of the superpixels shown in "found-segs"
+        dcc.Store(id="found-labels", data=[]),
         dcc.Store(id="last-render-id", data=0),
     ],
 )
@@ -687,10 +698,11 @@ undo_data)
 )
 
 
-def shapes_to_segs(
+# Yields the view, the slice index and the (cached) mask of the shapes of
+# every slice with shapes drawn on it
+def iter_shape_masks(
     drawn_shapes_data, image_display_top_figure, image_display_side_figure,
 ):
-    masks = np.zeros_like(img)
     for j, (graph_figure, (hscale, wscale)) in enumerate(
         zip([image_display_top_figure, image_display_side_figure], hwscales)
     ):
@@ -699,38 +711,84 @@ def shapes_to_segs(
         # one of the images of the brain) to get the bounding box of the SVG that we
         # want to rasterize
         width, height = [fig.layout.images[0][sz] for sz in ["sizex", "sizey"]]
+
+        def rasterize(shapes, width, height):
+            mask = shape_utils.shapes_to_mask(
+                [dict(width=width, height=height, shape=s) for s in shapes],
+                # we only have one label class, so the mask is given value 1
+                1,
+            )
+            # TODO: Maybe there's a more elegant way to downsample the mask?
+            return mask[::hscale, ::wscale] == 1
+
         for i in range(seg_img.shape[j]):
-            shape_args = [
-                dict(width=width, height=height, shape=s)
-                for s in drawn_shapes_data[j][i]
-            ]
-            if len(shape_args) > 0:
-                mask = shape_utils.shapes_to_mask(
-                    shape_args,
-                    # we only have one label class, so the mask is given value 1
-                    1,
-                )
-                # TODO: Maybe there's a more elegant way to downsample the mask?
-                np.moveaxis(masks, 0, j)[i, :, :] = mask[::hscale, ::wscale]
-    found_segs_tensor = np.zeros_like(img)
+            shapes = drawn_shapes_data[j][i]
+            if len(shapes) > 0:
+                yield j, i, slice_masks.get(j, i, shapes, width, height, rasterize)
+
+
+def shapes_to_labels(
+    drawn_shapes_data, image_display_top_figure, image_display_side_figure,
+):
+    """ Returns the sorted labels of the superpixels beneath the shapes """
+    # find labels beneath the masks
+    labels = [
+        np.unique(np.moveaxis(seg, 0, j)[i][mask])
+        for j, i, mask in iter_shape_masks(
+            drawn_shapes_data, image_display_top_figure, image_display_side_figure,
+        )
+    ]
+    if len(labels) == 0:
+        return np.array([], dtype=np.int64)
+    return np.unique(np.concatenate(labels))
+
+
+def shapes_to_segs(
+    drawn_shapes_data, image_display_top_figure, image_display_side_figure,
+):
     if DEBUG_MASK:
-        found_segs_tensor[masks == 1] = 1
-    else:
-        # find labels beneath the mask
-        labels = set(seg[1 == masks])
-        # for each label found, select all of the segment with that label
-        for l in labels:
-            found_segs_tensor[seg == l] = 1
-    return found_segs_tensor
+        masks = np.zeros_like(img)
+        for j, i, mask in iter_shape_masks(
+            drawn_shapes_data, image_display_top_figure, image_display_side_figure,
+        ):
+            np.moveaxis(masks, 0, j)[i][mask] = 1
+        return masks
+    labels = shapes_to_labels(
+        drawn_shapes_data, image_display_top_figure, image_display_side_figure,
+    )
+    # select all of the segments with the labels found
+    return seg_index.select(labels, dtype=img.dtype)
+
+
+def found_slice_to_data_url(found_slice, j):
+    if not np.any(found_slice):
+        return blank_seg_slices[j]
+    # convert to a colored image
+    colored = image_utils.label_to_colors(
+        found_slice,
+        colormap=["#8A2BE2"],
+        alpha=[128],
+        # we map label 0 to the color #000000 using no_map_zero, so we start at
+        # color_class 1
+        color_class_offset=1,
+        labels_contiguous=True,
+        no_map_zero=True,
+    )
+    return array_to_data_url(colored)
 
 
 @app.callback(
-    [Output("found-segs", "data"), Output("current-render-id", "data")],
+    [
+        Output("found-segs-update", "data"),
+        Output("found-labels", "data"),
+        Output("current-render-id", "data"),
+    ],
     [Input("drawn-shapes", "data")],
     [
         State("image-display-graph-top", "figure"),
         State("image-display-graph-side", "figure"),
         State("current-render-id", "data"),
+        State("found-labels", "data"),
     ],
 )
 def draw_shapes_react(
@@ -738,6 +796,7 @@ def draw_shapes_react(
     image_display_top_figure,
     image_display_side_figure,
     current_render_id,
+    found_labels,
 ):
     if any(
         [
@@ -751,35 +810,68 @@ def draw_shapes_react(
     ):
         return dash.no_update
     t1 = time.time()
-    found_segs_tensor = shapes_to_segs(
-        drawn_shapes_data, image_display_top_figure, image_display_side_figure,
-    )
+    if DEBUG_MASK:
+        # the masks don't follow the superpixels, so every slice may have changed
+        labels = None
+        found_volume = shapes_to_segs(
+            drawn_shapes_data, image_display_top_figure, image_display_side_figure,
+        )
+        table = np.array([0, 1], dtype="uint8")
+        dirty_slices = [range(img.shape[j]) for j in range(NUM_DIMS_DISPLAYED)]
+    else:
+        labels = shapes_to_labels(
+            drawn_shapes_data, image_display_top_figure, image_display_side_figure,
+        )
+        # only the slices crossing the superpixels that were added or removed
+        # since the last call can have changed
+        changed = np.setxor1d(found_labels or [], labels)
+        found_volume = seg
+        table = seg_index.table(labels).astype("uint8")
+        dirty_slices = [seg_index.slices(changed, j) for j in range(NUM_DIMS_DISPLAYED)]
     t2 = time.time()
     PRINT("Time to convert shapes to segments:", t2 - t1)
-    # convert to a colored image
-    fst_colored = image_utils.label_to_colors(
-        found_segs_tensor,
-        colormap=["#8A2BE2"],
-        alpha=[128],
-        # we map label 0 to the color #000000 using no_map_zero, so we start at
-        # color_class 1
-        color_class_offset=1,
-        labels_contiguous=True,
-        no_map_zero=True,
-    )
-    t3 = time.time()
-    PRINT("Time to convert from labels to colored image:", t3 - t2)
-    fstc_slices = [
-        [
-            array_to_data_url(s) if np.any(s != 0) else blank_seg_slices[j]
-            for s in np.moveaxis(fst_colored, 0, j)
-        ]
+    found_segs_update = [
+        {
+            str(i): found_slice_to_data_url(
+                table[np.moveaxis(found_volume, 0, j)[i]], j
+            )
+            for i in dirty_slices[j]
+        }
         for j in range(NUM_DIMS_DISPLAYED)
     ]
-    t4 = time.time()
-    PRINT("Time to convert to data URLs:", t4 - t3)
-    PRINT("Total time to compute 2D annotations:", t4 - t1)
-    return fstc_slices, current_render_id + 1
+    t3 = time.time()
+    PRINT(
+        "Time to convert %d slices to data URLs:" % sum(len(d) for d in dirty_slices),
+        t3 - t2,
+    )
+    PRINT("Total time to compute 2D annotations:", t3 - t1)
+    return (
+        found_segs_update,
+        labels if labels is None else labels.tolist(),
+        current_render_id + 1,
+    )
+
+
+app.clientside_callback(
+    """
+function (found_segs_update, found_segs_data) {
+    if (!found_segs_update) {
+        return window.dash_clientside.no_update;
+    }
+    // replace the slices that changed, keeping the others
+    return found_segs_data.map(function (slices, j) {
+        let slices_ = slices.slice();
+        Object.keys(found_segs_update[j]).forEach(function (i) {
+            slices_[i] = found_segs_update[j][i];
+        });
+        return slices_;
+    });
+}
+""",
+    Output("found-segs", "data"),
+    [Input("found-segs-update", "data")],
+    [State("found-segs", "data")],
+)
 
 
 def _decode_b64_slice(s):
@@ -946,6 +1038,60 @@ def store_scene_data(graph_3d_relayoutData, last_3d_scene):
     return dash.no_update
 
 
+# The volume as displayed in the 3D graph
+def to_3d_display(volume):
+    return volume.transpose((1, 2, 0))[:, :, ::-1]
+
+
+# Runs marching cubes on the box lower:upper of a volume only. The box is
+# widened to the sampling grid of step_size, so the mesh is the same as over
+# the whole volume as long as the volume is zero outside of the box.
+def marching_cubes_box(volume, lower=None, upper=None, step_size=3):
+    lower = (0,) * volume.ndim if lower is None else lower
+    upper = volume.shape if upper is None else upper
+    start = [max((l - 1) // step_size * step_size, 0) for l in lower]
+    stop = [
+        min(-(-u // step_size) * step_size + 1, n) for u, n in zip(upper, volume.shape)
+    ]
+    box = volume[tuple(slice(a, b) for a, b in zip(start, stop))]
+    try:
+        verts, faces, normals, values = measure.marching_cubes(
+            box, 0, step_size=step_size
+        )
+    except RuntimeError:
+        return None
+    return verts + np.array(start), faces
+
+
+def mesh_trace(mesh, color):
+    verts, faces = mesh
+    x, y, z = verts.T
+    i, j, k = faces.T
+    return go.Mesh3d(x=x, y=y, z=z, color=color, opacity=0.5, i=i, j=j, k=k)
+
+
+# The mesh of the brain never changes, so it is only computed once
+@lru_cache(maxsize=1)
+def brain_mesh():
+    return marching_cubes_box(image_utils.combine_last_dim(to_3d_display(img)))
+
+
+# Mesh of the superpixels with the given labels, computed on the bounding box
+# of these superpixels only
+@lru_cache(maxsize=32)
+def found_segs_mesh(labels):
+    bounds = seg_index.bounds(labels)
+    if bounds is None:
+        return None
+    (z0, y0, x0), (z1, y1, x1) = bounds
+    n_slices = img.shape[0]
+    return marching_cubes_box(
+        to_3d_display(seg_index.select(labels, dtype=img.dtype)),
+        (y0, x0, n_slices - z1),
+        (y1, x1, n_slices - z0),
+    )
+
+
 @app.callback(
     [Output("image-display-graph-3d", "figure"), Output("last-render-id", "data")],
     [Input("dummy2", "children"), Input("show-hide-seg-3d", "children")],
@@ -955,6 +1101,7 @@ def store_scene_data(graph_3d_relayoutData, last_3d_scene):
         State("last-render-id", "data"),
         State("image-display-graph-top", "figure"),
         State("image-display-graph-side", "figure"),
+        State("found-labels", "data"),
     ],
 )
 def populate_3d_graph(
@@ -965,6 +1112,7 @@ def populate_3d_graph(
     last_render_id,
     image_display_top_figure,
     image_display_side_figure,
+    found_labels,
 ):
     # extract which graph shown and the current render id
     graph_shown, current_render_id = dummy2_children.split(",")
@@ -982,27 +1130,19 @@ def populate_3d_graph(
                 PRINT("not rendering 3D because it is up to date")
             return dash.no_update
     PRINT("rendering 3D")
-    segs_ndarray = shapes_to_segs(
-        drawn_shapes_data, image_display_top_figure, image_display_side_figure,
-    ).transpose((1, 2, 0))
-    # image, color
-    images = [
-        (img.transpose((1, 2, 0))[:, :, ::-1], "grey"),
-    ]
+    # mesh, color
+    meshes = [(brain_mesh(), "grey")]
     if show_hide_seg_3d == "show":
-        images.append((segs_ndarray[:, :, ::-1], "purple"))
-    data = []
-    for im, color in images:
-        im = image_utils.combine_last_dim(im)
-        try:
-            verts, faces, normals, values = measure.marching_cubes(im, 0, step_size=3)
-            x, y, z = verts.T
-            i, j, k = faces.T
-            data.append(
-                go.Mesh3d(x=x, y=y, z=z, color=color, opacity=0.5, i=i, j=j, k=k)
+        if found_labels is None:
+            # the found segments are the masks of the shapes (DEBUG_MASK)
+            segs_ndarray = shapes_to_segs(
+                drawn_shapes_data, image_display_top_figure, image_display_side_figure,
             )
-        except RuntimeError:
-            continue
+            mesh = marching_cubes_box(to_3d_display(segs_ndarray))
+        else:
+            mesh = found_segs_mesh(tuple(found_labels))
+        meshes.append((mesh, "purple"))
+    data = [mesh_trace(mesh, color) for mesh, color in meshes if mesh is not None]
     fig = go.Figure(data=data)
     fig.update_layout(**last_3d_scene)
     end_time = time.time()
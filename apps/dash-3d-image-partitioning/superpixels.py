@@ -0,0 +1,144 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SuperpixelIndex:
+    """
+    Inverted index of a superpixel volume: the flat offsets of the voxels of
+    each label.
+
+    The offsets of the voxels of label l are order[starts[l]:starts[l + 1]], so
+    selecting whole superpixels is a gather of these ranges and a scatter into
+    the volume, without comparing the volume with every label. The bounding
+    box of each label, lower[l]:upper[l], gives the slices and the region of
+    the volume a change of a selection touches.
+    """
+
+    def __init__(self, seg):
+        self.shape = seg.shape
+        flat = seg.ravel()
+        dtype = np.int32 if flat.size < 2 ** 31 else np.int64
+        # stable, the voxels of a label stay in memory order
+        self.order = np.argsort(flat, kind="stable").astype(dtype)
+        counts = np.bincount(flat)
+        self.starts = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.starts[1:])
+
+        present = np.flatnonzero(counts)
+        self.lower = np.zeros((len(counts), seg.ndim), dtype=np.int64)
+        self.upper = np.zeros((len(counts), seg.ndim), dtype=np.int64)
+        stride = flat.size
+        for axis, size in enumerate(self.shape):
+            stride //= size
+            coords = self.order // stride % size
+            self.lower[present, axis] = np.minimum.reduceat(
+                coords, self.starts[present]
+            )
+            self.upper[present, axis] = (
+                np.maximum.reduceat(coords, self.starts[present]) + 1
+            )
+
+    def _valid(self, labels):
+        labels = np.asarray(labels, dtype=np.int64)
+        labels = labels[(labels >= 0) & (labels < len(self.starts) - 1)]
+        # labels without voxels have no bounding box
+        return labels[self.starts[labels] < self.starts[labels + 1]]
+
+    def voxels(self, labels):
+        """Flat offsets of the voxels of the labels, label by label."""
+
+        labels = self._valid(labels)
+        starts, ends = self.starts[labels], self.starts[labels + 1]
+        lengths = ends - starts
+        # position in `order` of each voxel: the start of its range plus its
+        # rank in the range
+        ranks = np.arange(lengths.sum()) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths
+        )
+        return self.order[np.repeat(starts, lengths) + ranks]
+
+    def select(self, labels, dtype=np.uint8):
+        """Volume that is 1 on the voxels of the labels and 0 elsewhere."""
+
+        selected = np.zeros(self.shape, dtype=dtype)
+        selected.flat[self.voxels(labels)] = 1
+        return selected
+
+    def table(self, labels):
+        """
+        Lookup table of the labels: table[seg] is True on the voxels of the
+        labels, for any part of the volume.
+        """
+
+        table = np.zeros(len(self.starts) - 1, dtype=bool)
+        table[self._valid(labels)] = True
+        return table
+
+    def bounds(self, labels):
+        """
+        Lower and upper corners of the bounding box of the voxels of the
+        labels, None if they have none.
+        """
+
+        labels = self._valid(labels)
+        if len(labels) == 0:
+            return None
+        return self.lower[labels].min(axis=0), self.upper[labels].max(axis=0)
+
+    def slices(self, labels, axis):
+        """
+        Sorted indices of the slices along an axis that intersect the
+        bounding box of at least one of the labels.
+        """
+
+        labels = self._valid(labels)
+        covered = np.zeros(self.shape[axis] + 1, dtype=np.int64)
+        np.add.at(covered, self.lower[labels, axis], 1)
+        np.add.at(covered, self.upper[labels, axis], -1)
+        return np.flatnonzero(np.cumsum(covered[:-1]) > 0)
+
+
+class SliceMaskCache:
+    """
+    LRU cache of the masks of the shapes drawn on the slices of the views.
+
+    Masks are keyed by view, slice and a hash of the shapes and of the size
+    they are rasterized at, so only the slices whose shapes changed since the
+    last call are rasterized again.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(view, slice_index, shapes, width, height):
+        digest = hashlib.sha1(
+            json.dumps([width, height, shapes], sort_keys=True).encode()
+        )
+        return (view, slice_index, digest.hexdigest())
+
+    def get(self, view, slice_index, shapes, width, height, rasterize):
+        """
+        Returns the mask of the shapes of a slice, computed with
+        `rasterize(shapes, width, height)` on a miss.
+        """
+        key = self.key(view, slice_index, shapes, width, height)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+
+        mask = rasterize(shapes, width, height)
+        mask.flags.writeable = False
+        with self._lock:
+            self._masks[key] = mask
+            if len(self._masks) > self.max_size:
+                self._masks.popitem(last=False)
+        return mask
@@ -3,11 +3,13 @@ import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, ClientsideFunction
 
-import numpy as np
 import pandas as pd
 import datetime
 from datetime import datetime as dt
 import pathlib
+from functools import lru_cache
+
+from records import RecordStore
 
 app = dash.Dash(
     __name__,
@@ -56,6 +58,9 @@ day_list = [
 
 check_in_duration = df["Check-In Time"].describe()
 
+# Records sorted by clinic and check-in time, shared by the heatmap and the table
+store = RecordStore(df)
+
 # Register all departments for callbacks
 all_departments = df["Department"].unique().tolist()
 wait_time_inputs = [
@@ -136,12 +141,7 @@ def generate_patient_volume_heatmap(start, end, clinic, hm_click, admit_type, re
     :return: Patient volume annotated heatmap.
     """
 
-    filtered_df = df[
-        (df["Clinic Name"] == clinic) & (df["Admit Source"].isin(admit_type))
-    ]
-    filtered_df = filtered_df.sort_values("Check-In Time").set_index("Check-In Time")[
-        start:end
-    ]
+    selection = store.select(clinic, admit_type, start, end)
 
     x_axis = [datetime.time(i).strftime("%I %p") for i in range(24)]  # 24hr time list
     y_axis = day_list
@@ -175,16 +175,13 @@ def generate_patient_volume_heatmap(start, end, clinic, hm_click, admit_type, re
 
     # Get z value : sum(number of records) based on x, y,
 
-    z = np.zeros((7, 24))
+    # float, annotations read like "12.0" as when z was summed from the dataframe
+    z = selection.volume().astype(float)
     annotations = []
 
     for ind_y, day in enumerate(y_axis):
-        filtered_day = filtered_df[filtered_df["Days of Wk"] == day]
         for ind_x, x_val in enumerate(x_axis):
-            sum_of_record = filtered_day[filtered_day["Check-In Hour"] == x_val][
-                "Number of Records"
-            ].sum()
-            z[ind_y][ind_x] = sum_of_record
+            sum_of_record = z[ind_y][ind_x]
 
             annotation_dict = dict(
                 showarrow=False,
@@ -447,32 +444,16 @@ def generate_patient_table(figure_list, departments, wait_time_xrange, score_xra
     return header
 
 
-def create_table_figure(
-    department, filtered_df, category, category_xrange, selected_index
-):
+def create_table_figure(department, grouped, category, category_xrange, selected_index):
     """Create figures.
 
     :param department: Name of department.
-    :param filtered_df: Filtered dataframe.
+    :param grouped: Records of the department aggregated by encounter.
     :param category: Defining category of figure, either 'wait time' or 'care score'.
     :param category_xrange: x axis range for this figure.
     :param selected_index: selected point index.
     :return: Plotly figure dictionary.
     """
-    aggregation = {
-        "Wait Time Min": "mean",
-        "Care Score": "mean",
-        "Days of Wk": "first",
-        "Check-In Time": "first",
-        "Check-In Hour": "first",
-    }
-
-    df_by_department = filtered_df[
-        filtered_df["Department"] == department
-    ].reset_index()
-    grouped = (
-        df_by_department.groupby("Encounter Number").agg(aggregation).reset_index()
-    )
     patient_id_list = grouped["Encounter Number"]
 
     x = grouped[category]
@@ -533,6 +514,31 @@ def create_table_figure(
     return {"data": [trace], "layout": layout}
 
 
+@lru_cache(maxsize=512)
+def department_figure(
+    selection_key, cell, department, category, category_xrange, selected_index
+):
+    """Cached figure of a department.
+
+    :param selection_key: Key of the Selection of the records from the filters.
+    :param cell: (weekday, hour) clicked on the heatmap, or None.
+    :param department: Name of department.
+    :param category: Defining category of figure, either 'wait time' or 'care score'.
+    :param category_xrange: x axis range for this figure, as a tuple.
+    :param selected_index: selected point index, as a tuple, or "" for none.
+    :return: Plotly figure dictionary.
+    """
+    # keyed by the selection key, the cache doesn't keep evicted selections alive
+    selection = store.select(*selection_key)
+    return create_table_figure(
+        department,
+        selection.encounters(cell)[department],
+        category,
+        list(category_xrange),
+        selected_index if selected_index == "" else list(selected_index),
+    )
+
+
 app.layout = html.Div(
     id="app-container",
     children=[
@@ -648,89 +654,65 @@ def update_table(start, end, clinic, admit_type, heatmap_click, reset_click, *ar
         triggered_value = ctx.triggered[0]["value"]
 
     # filter data
-    filtered_df = df[
-        (df["Clinic Name"] == clinic) & (df["Admit Source"].isin(admit_type))
-    ]
-    filtered_df = filtered_df.sort_values("Check-In Time").set_index("Check-In Time")[
-        start:end
-    ]
+    selection = store.select(clinic, admit_type, start, end)
+    filtered_df = selection.records()
     departments = filtered_df["Department"].unique()
 
     # Highlight click data's patients in this table
+    cell = None
     if heatmap_click is not None and prop_id != "reset-btn":
         hour_of_day = heatmap_click["points"][0]["x"]
         weekday = heatmap_click["points"][0]["y"]
-        clicked_df = filtered_df[
-            (filtered_df["Days of Wk"] == weekday)
-            & (filtered_df["Check-In Hour"] == hour_of_day)
-        ]  # slice based on clicked weekday and hour
-        departments = clicked_df["Department"].unique()
-        filtered_df = clicked_df
+        # slice based on clicked weekday and hour
+        cell = (weekday, hour_of_day)
+        filtered_df = selection.records(cell)
+        departments = filtered_df["Department"].unique()
 
     # range_x for all plots
-    wait_time_xrange = [
+    wait_time_xrange = (
         filtered_df["Wait Time Min"].min() - 2,
         filtered_df["Wait Time Min"].max() + 2,
-    ]
-    score_xrange = [
+    )
+    score_xrange = (
         filtered_df["Care Score"].min() - 0.5,
         filtered_df["Care Score"].max() + 0.5,
-    ]
-
-    figure_list = []
-
-    if prop_type != "selectedData" or (
-        prop_type == "selectedData" and triggered_value is None
-    ):  # Default condition, all ""
-
-        for department in departments:
-            department_wait_time_figure = create_table_figure(
-                department, filtered_df, "Wait Time Min", wait_time_xrange, ""
-            )
-            figure_list.append(department_wait_time_figure)
-
-        for department in departments:
-            department_score_figure = create_table_figure(
-                department, filtered_df, "Care Score", score_xrange, ""
-            )
-            figure_list.append(department_score_figure)
+    )
 
-    elif prop_type == "selectedData":
-        selected_patient = ctx.triggered[0]["value"]["points"][0]["customdata"]
-        selected_index = [ctx.triggered[0]["value"]["points"][0]["pointIndex"]]
-
-        # [] turn on un-selection for all other plots, [index] for this department
-        for department in departments:
-            wait_selected_index = []
-            if prop_id.split("_")[0] == department:
-                wait_selected_index = selected_index
-
-            department_wait_time_figure = create_table_figure(
-                department,
-                filtered_df,
-                "Wait Time Min",
-                wait_time_xrange,
-                wait_selected_index,
-            )
-            figure_list.append(department_wait_time_figure)
+    # "" for no selection, () to turn on un-selection for all plots but the one of
+    # the department with the selected point
+    selected_department = None
+    selected_index = ""
+    if prop_type == "selectedData" and triggered_value is not None:
+        selected_department = prop_id.split("_")[0]
+        selected_index = ()
 
+    # Figures are cached, so a selection only rebuilds the figures of the
+    # department it changed
+    figure_list = []
+    for category, category_xrange in [
+        ("Wait Time Min", wait_time_xrange),
+        ("Care Score", score_xrange),
+    ]:
         for department in departments:
-            score_selected_index = []
-            if department == prop_id.split("_")[0]:
-                score_selected_index = selected_index
-
-            department_score_figure = create_table_figure(
-                department,
-                filtered_df,
-                "Care Score",
-                score_xrange,
-                score_selected_index,
+            department_selected_index = selected_index
+            if department == selected_department:
+                department_selected_index = (
+                    triggered_value["points"][0]["pointIndex"],
+                )
+            figure_list.append(
+                department_figure(
+                    selection.key,
+                    cell,
+                    department,
+                    category,
+                    category_xrange,
+                    department_selected_index,
+                )
             )
-            figure_list.append(department_score_figure)
 
     # Put figures in table
     table = generate_patient_table(
-        figure_list, departments, wait_time_xrange, score_xrange
+        figure_list, departments, list(wait_time_xrange), list(score_xrange)
     )
     return table
 
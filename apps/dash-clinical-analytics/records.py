@@ -0,0 +1,229 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+HOURS = 24
+
+# Aggregation of the records of an encounter
+ENCOUNTER_AGGREGATION = {
+    "Wait Time Min": "mean",
+    "Care Score": "mean",
+    "Days of Wk": "first",
+    "Check-In Time": "first",
+    "Check-In Hour": "first",
+}
+
+
+class Selection:
+    """
+    Records of a clinic with an admit source in a list, checked in between two
+    dates: rows `rows` of the store for which `admitted` is True. `key` is the
+    (clinic, admit sources, start, end) key of the selection in the store.
+
+    The filtered dataframe, the patient volume and the encounters of each
+    department are computed the first time they are used, and shared by every
+    callback with the same inputs. A heatmap `cell` is a (weekday, hour) pair
+    of the "Days of Wk" and "Check-In Hour" columns.
+    """
+
+    def __init__(self, store, key, rows, admitted):
+        self.store = store
+        self.key = key
+        self.rows = rows
+        self.admitted = admitted  # lookup table of the admit source codes
+        self._frame = None
+        self._volume = None
+        self._cells = {}
+        self._encounters = {}
+        self._lock = threading.Lock()
+
+    @property
+    def frame(self):
+        """The records, indexed and sorted by check-in time."""
+
+        with self._lock:
+            if self._frame is None:
+                store = self.store
+                keep = self.admitted[store.admit_code[self.rows]]
+                self._frame = store.frame.iloc[self.rows][keep]
+            return self._frame
+
+    def records(self, cell=None):
+        """The records, only the ones checked in at a heatmap cell if given."""
+
+        if cell is None:
+            return self.frame
+        frame = self.frame
+        with self._lock:
+            if cell not in self._cells:
+                weekday, hour = cell
+                self._cells[cell] = frame[
+                    (frame["Days of Wk"] == weekday) & (frame["Check-In Hour"] == hour)
+                ]
+            return self._cells[cell]
+
+    def encounters(self, cell=None):
+        """
+        Records aggregated by encounter for each department, grouped in a
+        single pass over the records of a heatmap cell, or all the records.
+        """
+
+        frame = self.records(cell)
+        with self._lock:
+            if cell in self._encounters:
+                return self._encounters[cell]
+
+        grouped = (
+            frame.reset_index()
+            .groupby(["Department", "Encounter Number"])
+            .agg(ENCOUNTER_AGGREGATION)
+        )
+        encounters = {
+            department: group.reset_index(level="Department", drop=True).reset_index()
+            for department, group in grouped.groupby(level="Department")
+        }
+        with self._lock:
+            self._encounters[cell] = encounters
+        return encounters
+
+    def _add_rows(self, z, rows):
+        store = self.store
+        keep = self.admitted[store.admit_code[rows]]
+        np.add.at(
+            z,
+            (store.weekday[rows][keep], store.hour[rows][keep]),
+            store.records[rows][keep],
+        )
+
+    def volume(self):
+        """
+        Sum of the number of records by weekday (rows, Monday first) and by
+        hour of check-in (columns).
+        """
+
+        with self._lock:
+            if self._volume is not None:
+                return self._volume
+
+        store = self.store
+        z = np.zeros((len(DAYS), HOURS), dtype=store.records.dtype)
+        start, stop = self.rows.start, self.rows.stop
+        if start < stop:
+            clinic = store.clinic_code[start]
+            first_day, last_day = store.day[start], store.day[stop - 1]
+            if last_day - first_day < 2:
+                self._add_rows(z, self.rows)
+            else:
+                # whole days between the first and the last one come from the
+                # cube, the rows of the first and the last day are added one by one
+                clinic_rows = store.clinic_rows(clinic)
+                days = store.day[clinic_rows]
+                first_day_end = clinic_rows.start + np.searchsorted(days, first_day + 1)
+                last_day_start = clinic_rows.start + np.searchsorted(days, last_day)
+                by_day = store.cube[clinic, np.flatnonzero(self.admitted)][
+                    :, first_day + 1 : last_day
+                ].sum(axis=0)
+                np.add.at(z, store.day_weekday[first_day + 1 : last_day], by_day)
+                self._add_rows(z, slice(start, first_day_end))
+                self._add_rows(z, slice(last_day_start, stop))
+
+        with self._lock:
+            self._volume = z
+        return z
+
+
+class RecordStore:
+    """
+    Patient records sorted by clinic and check-in time, with clinics and
+    admit sources encoded as categorical codes.
+
+    The records of a clinic are contiguous, so the records checked in between
+    two dates are found with a binary search. `cube` holds the sum of the
+    number of records by (clinic, admit source, day, hour), for patient
+    volumes that don't look at the records of whole days.
+    """
+
+    def __init__(self, df, max_selections=32):
+        clinics = pd.Categorical(df["Clinic Name"])
+        admits = pd.Categorical(df["Admit Source"])
+        times = df["Check-In Time"]
+        # stable, records checked in at the same time stay in the order of the file
+        order = np.lexsort((times.values, clinics.codes))
+
+        self.clinics = list(clinics.categories)
+        self.admits = list(admits.categories)
+        self.frame = df.iloc[order].set_index("Check-In Time")
+        self.clinic_code = clinics.codes[order].astype(np.int64)
+        self.admit_code = admits.codes[order].astype(np.int64)
+        self.records = df["Number of Records"].values[order]
+        times = pd.DatetimeIndex(times.values[order])
+        self.weekday = times.weekday.values.astype(np.int64)  # Monday is 0
+        self.hour = times.hour.values.astype(np.int64)
+
+        first_day = times.normalize().min()
+        self.day = ((times.normalize() - first_day).days).values.astype(np.int64)
+        n_days = int(self.day.max()) + 1 if len(self.day) else 0
+        self.day_weekday = (first_day.weekday() + np.arange(n_days)) % len(DAYS)
+        self.clinic_offsets = np.searchsorted(
+            self.clinic_code, np.arange(len(self.clinics) + 1)
+        )
+
+        self.cube = np.zeros(
+            (len(self.clinics), len(self.admits), n_days, HOURS),
+            dtype=self.records.dtype,
+        )
+        np.add.at(
+            self.cube,
+            (self.clinic_code, self.admit_code, self.day, self.hour),
+            self.records,
+        )
+
+        self.max_selections = max_selections
+        self._selections = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clinic_rows(self, clinic_code):
+        return slice(
+            self.clinic_offsets[clinic_code], self.clinic_offsets[clinic_code + 1]
+        )
+
+    def _select(self, key):
+        clinic, admit_types, start, end = key
+        admitted = np.zeros(len(self.admits), dtype=bool)
+        admitted[[self.admits.index(a) for a in admit_types if a in self.admits]] = True
+        if clinic not in self.clinics:
+            return Selection(self, key, slice(0, 0), admitted)
+
+        rows = self.clinic_rows(self.clinics.index(clinic))
+        # same bounds as slicing the dataframe indexed by check-in time
+        dates = self.frame.index[rows].slice_indexer(start, end)
+        first, last, _ = dates.indices(rows.stop - rows.start)
+        return Selection(
+            self,
+            key,
+            slice(rows.start + first, rows.start + max(first, last)),
+            admitted,
+        )
+
+    def select(self, clinic, admit_types, start, end):
+        """
+        The Selection of the records of `clinic` with an admit source in
+        `admit_types`, checked in between `start` and `end` included.
+        """
+
+        key = (clinic, tuple(sorted(set(admit_types))), start, end)
+        with self._lock:
+            selection = self._selections.get(key)
+            if selection is not None:
+                self._selections.move_to_end(key)
+                return selection
+
+        selection = self._select(key)
+        with self._lock:
+            self._selections[key] = selection
+            if len(self._selections) > self.max_selections:
+                self._selections.popitem(last=False)
+        return selection
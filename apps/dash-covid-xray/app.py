@@ -1,3 +1,5 @@
+import logging
+
 import numpy as np
 import dash
 from dash.dependencies import Input, Output, State
@@ -8,15 +10,17 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.express._imshow import _array_to_b64str
 from nilearn import image
-from skimage import draw, filters, exposure, measure
-from scipy import ndimage
-from time import time
+from skimage import filters, exposure, measure
+
+from occlusion import OcclusionSegmenter, StageTimer
+
+logging.basicConfig(level=logging.INFO)
 
 app = dash.Dash(__name__)
 
 server = app.server
 
-t1 = time()
+timer = StageTimer("startup")
 # ------------- I/O and data massaging ---------------------------------------------------
 
 img = image.load_img("assets/radiopaedia_org_covid-19-pneumonia-7_85703_0-dcm.nii")
@@ -49,14 +53,8 @@ fig_mesh.add_trace(go.Mesh3d(x=z, y=y, z=x, opacity=0.2, i=k, j=j, k=i))
 
 hi = exposure.histogram(med_img)
 
-
-def path_to_indices(path):
-    """From SVG path to numpy array of coordinates, each row being a (row, col) point
-    """
-    indices_str = [
-        el.replace("M", "").replace("Z", "").split(",") for el in path.split("L")
-    ]
-    return np.array(indices_str, dtype=float)
+# regions of interest and segmentations of the annotations, cached
+segmenter = OcclusionSegmenter(med_img, size_factor)
 
 
 def make_figure(
@@ -115,20 +113,13 @@ def make_figure(
     return fig
 
 
-def largest_connected_component(mask):
-    labels, _ = ndimage.label(mask)
-    sizes = np.bincount(labels.ravel())[1:]
-    return labels == (np.argmax(sizes) + 1)
-
-
 def mask_to_color(img):
     mask = np.zeros(img.shape + (4,), dtype=np.uint8)
     mask[img] = [255, 0, 0, 100]
     return mask
 
 
-t2 = time()
-print("initial calculations", t2 - t1)
+timer.mark("initial calculations")
 
 
 app.layout = html.Div(
@@ -247,6 +238,7 @@ app.layout = html.Div(
         dcc.Store(id="z-pos", data=l_h // 2),
         dcc.Store(id="x-pos", data=l_lat // 2),
         dcc.Store(id="annotations", data={}),
+        dcc.Store(id="segmentation", data={}),
         dcc.Store(id="segmentation-slices", data={}),
         dcc.Store(id="segmentation-slices-2", data={}),
         dcc.Store(id="occlusion-surface", data={}),
@@ -254,34 +246,22 @@ app.layout = html.Div(
     className="twelve columns",
 )
 
-t3 = time()
-print("layout definition", t3 - t2)
+timer.mark("layout definition")
+timer.log()
 
 
 @app.callback(
     Output("graph-histogram", "figure"), [Input("annotations", "data")],
 )
 def update_histo(annotations):
-    if (
-        annotations is None
-        or annotations.get("x") is None
-        or annotations.get("z") is None
-    ):
-        return dash.no_update
-    # Horizontal mask
-    path = path_to_indices(annotations["z"]["path"])
-    rr, cc = draw.polygon(path[:, 1], path[:, 0])
-    if len(rr) == 0 or len(cc) == 0:
+    timer = StageTimer("histogram")
+    roi = segmenter.roi(annotations)
+    if roi is None:
         return dash.no_update
-    mask = np.zeros((l_lat, l_lat))
-    mask[rr, cc] = 1
-    mask = ndimage.binary_fill_holes(mask)
-    # top and bottom, the top is a lower number than the bottom because y values
-    # increase moving down the figure
-    top, bottom = sorted([int(annotations["x"][c] / size_factor) for c in ["y0", "y1"]])
-    intensities = med_img[top:bottom, mask].ravel()
+    intensities = roi.intensities()
     if len(intensities) == 0:
         return dash.no_update
+    timer.mark("roi")
     hi = exposure.histogram(intensities)
     fig = px.bar(
         x=hi[1],
@@ -290,18 +270,16 @@ def update_histo(annotations):
         labels={"x": "intensity", "y": "count"},
     )
     fig.update_layout(dragmode="select", title_font=dict(size=20, color="blue"))
+    timer.mark("figure")
+    timer.log()
     return fig
 
 
 @app.callback(
-    [
-        Output("segmentation-slices", "data"),
-        Output("segmentation-slices-2", "data"),
-        Output("occlusion-surface", "data"),
-    ],
+    [Output("segmentation", "data"), Output("occlusion-surface", "data")],
     [Input("graph-histogram", "selectedData"), Input("annotations", "data")],
 )
-def update_segmentation_slices(selected, annotations):
+def update_segmentation(selected, annotations):
     ctx = dash.callback_context
     # When shape annotations are changed, reset segmentation visualization
     if (
@@ -310,57 +288,66 @@ def update_segmentation_slices(selected, annotations):
         or annotations.get("x") is None
         or annotations.get("z") is None
     ):
-        return {}, {}, go.Mesh3d()
+        return {}, go.Mesh3d()
     elif selected is not None and "range" in selected:
         if len(selected["points"]) == 0:
-            return (dash.no_update,) * 3
+            return (dash.no_update,) * 2
         v_min, v_max = selected["range"]["x"]
-        t_start = time()
-        img_mask = np.logical_and(med_img > v_min, med_img <= v_max)
-        # Horizontal mask
-        path = path_to_indices(annotations["z"]["path"])
-        rr, cc = draw.polygon(path[:, 1], path[:, 0])
-        mask = np.zeros((l_lat, l_lat))
-        mask[rr, cc] = 1
-        mask = ndimage.binary_fill_holes(mask)
-        # top and bottom
-        # top and bottom, the top is a lower number than the bottom because y values
-        # increase moving down the figure
-        top, bottom = sorted(
-            [int(annotations["x"][c] / size_factor) for c in ["y0", "y1"]]
-        )
-        img_mask = np.logical_and(med_img > v_min, med_img <= v_max)
-        img_mask[:top] = False
-        img_mask[bottom:] = False
-        img_mask[top:bottom, np.logical_not(mask)] = False
-        img_mask = largest_connected_component(img_mask)
-        img_mask_color = mask_to_color(img_mask)
-        t_end = time()
-        print("build the mask", t_end - t_start)
-        t_start = time()
+        timer = StageTimer("segmentation")
+        segmentation = segmenter.segmentation(annotations, v_min, v_max, timer)
+        if segmentation is None:
+            return {}, go.Mesh3d()
         # Update 3d viz
-        verts, faces, _, _ = measure.marching_cubes(
-            filters.median(img_mask, selem=np.ones((1, 7, 7))), 0.5, step_size=3
-        )
-        t_end = time()
-        print("marching cubes", t_end - t_start)
+        mesh = segmenter.mesh(segmentation, timer)
+        timer.log()
+        if mesh is None:
+            return dict(range=[v_min, v_max]), go.Mesh3d()
+        verts, faces = mesh
         x, y, z = verts.T
         i, j, k = faces.T
         trace = go.Mesh3d(x=z, y=y, z=x, color="red", opacity=0.8, i=k, j=j, k=i)
-        t_start = time()
-        # Build lists of binary strings for segmented slices
-        slices_dict = {
-            str(i): _array_to_b64str(img_mask_color[i]) for i in range(top, bottom)
-        }
-        slices_dict_2 = {
-            str(i): _array_to_b64str(img_mask_color[:, i])
-            for i in range(img_mask_color.shape[1])
-        }
-        t_end = time()
-        print("binary string", t_end - t_start)
-        return (slices_dict, slices_dict_2, trace)
+        # the slices are encoded when displayed, see segmentation_slice
+        return dict(range=[v_min, v_max]), trace
     else:
-        return (dash.no_update,) * 3
+        return (dash.no_update,) * 2
+
+
+# Returns the binary string of the segmentation of the slice along an axis
+# which is displayed, an empty string if the occlusion doesn't cross it
+def segmentation_slice(segmentation_data, annotations, axis, index):
+    if not segmentation_data:
+        return {}
+    timer = StageTimer("segmentation slice")
+    segmentation = segmenter.segmentation(
+        annotations, *segmentation_data["range"], timer
+    )
+    if segmentation is None:
+        return {}
+    shape = [n for k, n in enumerate(med_img.shape) if k != axis]
+    encoded = segmentation.encoded_slice(
+        axis, index, shape, lambda mask: _array_to_b64str(mask_to_color(mask))
+    )
+    timer.mark("binary string")
+    timer.log()
+    return {str(index): encoded}
+
+
+@app.callback(
+    Output("segmentation-slices", "data"),
+    [Input("slider", "value"), Input("segmentation", "data")],
+    [State("annotations", "data")],
+)
+def update_segmentation_slices(n_slider, segmentation_data, annotations):
+    return segmentation_slice(segmentation_data, annotations, 0, n_slider)
+
+
+@app.callback(
+    Output("segmentation-slices-2", "data"),
+    [Input("slider-2", "value"), Input("segmentation", "data")],
+    [State("annotations", "data")],
+)
+def update_segmentation_slices_2(n_slider_2, segmentation_data, annotations):
+    return segmentation_slice(segmentation_data, annotations, 1, n_slider_2)
 
 
 @app.callback(
@@ -413,18 +400,21 @@ function(n_slider, n_slider_2, seg_slices, slices, fig, annotations){
         xpos = n_slider_2;
         let fig_ = {...fig};
         fig_.data[0].source = slices[zpos];
-        if (fig_.data.length  == 1 && zpos in seg_slices){
+        if (fig_.data.length  == 1 && seg_slices[zpos]){
             fig_.data.push({...fig.data[0]});
             fig_.data[1].source = seg_slices[zpos];
             fig_.data[1].hoverinfo = 'skip';
             fig_.data[1].hovertemplate = '';
         }
-        if (fig_.data.length  > 1 && zpos in seg_slices){
+        if (fig_.data.length  > 1 && seg_slices[zpos]){
             fig_.data[1].source = seg_slices[zpos];
             fig_.data[1].hoverinfo = 'skip';
             fig_.data[1].hovertemplate = '';
         }
-        if (fig_.data.length  > 1 && !(zpos in seg_slices)){
+        // An empty string is a slice without occlusion. A missing slice is
+        // still being encoded, the previous one is shown until it arrives.
+        if (fig_.data.length  > 1 && (seg_slices[zpos] === ""
+                || Object.keys(seg_slices).length == 0)){
             fig_.data = fig_.data.slice(0, 1);
         }
         fig_.layout.shapes[0].y0 = xpos;
@@ -462,17 +452,21 @@ function(n_slider, n_slider_2, seg_slices_2, slices_2, fig_2, annotations){
         xpos = n_slider_2;
         let fig_2_ = {...fig_2};
         fig_2_.data[0].source = slices_2[xpos];
-        if (fig_2_.data.length  == 1 && xpos in seg_slices_2){
+        if (fig_2_.data.length  == 1 && seg_slices_2[xpos]){
             fig_2_.data.push({...fig_2.data[0]});
             fig_2_.data[1].source = seg_slices_2[xpos];
             fig_2_.data[1].hoverinfo = 'skip';
             fig_2_.data[1].hovertemplate = '';
         }
-        if (fig_2_.data.length  > 1 && zpos in seg_slices_2){
+        if (fig_2_.data.length  > 1 && seg_slices_2[xpos]){
             fig_2_.data[1].source = seg_slices_2[xpos];
             fig_2_.data[1].hoverinfo = 'skip';
             fig_2_.data[1].hovertemplate = '';
         }
+        if (fig_2_.data.length  > 1 && (seg_slices_2[xpos] === ""
+                || Object.keys(seg_slices_2).length == 0)){
+            fig_2_.data = fig_2_.data.slice(0, 1);
+        }
         fig_2_.layout.shapes[0].y0 = zpos * size_factor;
         fig_2_.layout.shapes[0].y1 = zpos * size_factor;
         fig_2_.layout.shapes[1].y0 = zpos * size_factor;
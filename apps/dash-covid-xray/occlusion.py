@@ -0,0 +1,278 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from time import time
+
+import numpy as np
+from scipy import ndimage
+from skimage import draw, filters, measure
+
+logger = logging.getLogger(__name__)
+
+# Radius in pixels of the median filter smoothing the occlusion before its
+# surface is computed
+SMOOTHING_RADIUS = 3
+# Step of the grid the surface of the occlusion is sampled on
+MESH_STEP = 3
+
+
+class StageTimer:
+    """
+    Wall-clock time of the stages of a computation, logged as a single report
+    line when the computation is done.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self._last = time()
+
+    def mark(self, stage):
+        """Ends a stage, started at the previous mark or when the timer was made"""
+        now = time()
+        self.stages.append((stage, now - self._last))
+        self._last = now
+
+    def report(self):
+        total = sum(duration for _, duration in self.stages)
+        stages = ", ".join(
+            "{} {:.3f}s".format(stage, duration) for stage, duration in self.stages
+        )
+        return "{}: {} (total {:.3f}s)".format(self.name, stages, total)
+
+    def log(self):
+        logger.info(self.report())
+
+
+def path_to_indices(path):
+    """From SVG path to numpy array of coordinates, each row being a (row, col) point
+    """
+    indices_str = [
+        el.replace("M", "").replace("Z", "").split(",") for el in path.split("L")
+    ]
+    return np.array(indices_str, dtype=float)
+
+
+def largest_connected_component(mask):
+    labels, _ = ndimage.label(mask)
+    sizes = np.bincount(labels.ravel())[1:]
+    return labels == (np.argmax(sizes) + 1)
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, item):
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return item
+
+
+class ROI:
+    """
+    Region of interest of an annotation: the polygon drawn on the horizontal
+    slices, between the heights of the rectangle drawn on the vertical slices.
+
+    Only the bounding box of the region is kept: `box` is (top, bottom, row
+    start, row stop, col start, col stop) in the volume, `polygon` the mask of
+    the polygon inside the box and `volume` a copy of the box of the volume.
+    """
+
+    def __init__(self, key, box, polygon, volume):
+        self.key = key
+        self.box = box
+        self.polygon = polygon
+        self.volume = volume
+
+    @property
+    def slices(self):
+        top, bottom, r0, r1, c0, c1 = self.box
+        return slice(top, bottom), slice(r0, r1), slice(c0, c1)
+
+    def intensities(self):
+        return self.volume[:, self.polygon].ravel()
+
+
+class Segmentation:
+    """
+    Occlusion segmented in a region of interest, the largest connected
+    component of the voxels of the region with intensities in a range. The
+    PNGs of its slices are encoded the first time they are requested.
+    """
+
+    def __init__(self, roi, mask):
+        self.roi = roi
+        self.mask = mask  # inside the box of the ROI
+        self._slices = {}
+        self._lock = threading.Lock()
+
+    def slice_mask(self, axis, index, shape):
+        """
+        Mask of a whole slice of the volume along axis 0 (horizontal) or 1
+        (vertical), None if the occlusion doesn't cross the slice.
+        """
+
+        box = self.roi.slices
+        if not box[axis].start <= index < box[axis].stop:
+            return None
+        mask = np.take(self.mask, index - box[axis].start, axis=axis)
+        if not mask.any():
+            return None
+        out = np.zeros(shape, dtype=bool)
+        out[tuple(s for k, s in enumerate(box) if k != axis)] = mask
+        return out
+
+    def encoded_slice(self, axis, index, shape, encode):
+        """
+        `encode(mask)` of the mask of a slice, computed once per slice, or ""
+        if the occlusion doesn't cross the slice.
+        """
+
+        key = (axis, index)
+        with self._lock:
+            if key in self._slices:
+                return self._slices[key]
+        mask = self.slice_mask(axis, index, shape)
+        encoded = "" if mask is None else encode(mask)
+        with self._lock:
+            self._slices[key] = encoded
+        return encoded
+
+
+class OcclusionSegmenter:
+    """
+    Segmentation of occlusions of a volume from annotations.
+
+    The region of interest of each annotation is rasterized and cropped once,
+    and thresholding, labelling and meshing only look at its bounding box.
+    ROIs are cached by annotation and segmentations by annotation and range of
+    intensities, so dragging the range only thresholds the cropped volume.
+    """
+
+    def __init__(self, volume, size_factor, max_rois=16, max_segmentations=64):
+        self.volume = volume
+        self.size_factor = size_factor
+        self._rois = LRUCache(max_rois)
+        self._segmentations = LRUCache(max_segmentations)
+
+    def roi_key(self, annotations):
+        if (
+            annotations is None
+            or annotations.get("x") is None
+            or annotations.get("z") is None
+        ):
+            return None
+        # top and bottom, the top is a lower number than the bottom because y values
+        # increase moving down the figure
+        top, bottom = sorted(
+            [int(annotations["x"][c] / self.size_factor) for c in ["y0", "y1"]]
+        )
+        return json.dumps([annotations["z"]["path"], top, bottom])
+
+    def roi(self, annotations):
+        """The ROI of an annotation, None if it is empty."""
+
+        key = self.roi_key(annotations)
+        if key is None:
+            return None
+        roi = self._rois.get(key)
+        if roi is not None:
+            return roi or None
+
+        path, top, bottom = json.loads(key)
+        top, bottom = max(top, 0), min(bottom, self.volume.shape[0])
+        # Horizontal mask
+        path = path_to_indices(path)
+        rr, cc = draw.polygon(path[:, 1], path[:, 0], shape=self.volume.shape[1:])
+        if len(rr) == 0 or top >= bottom:
+            # empty ROIs are cached too, as False
+            self._rois.put(key, False)
+            return None
+        mask = np.zeros(self.volume.shape[1:], dtype=bool)
+        mask[rr, cc] = True
+        mask = ndimage.binary_fill_holes(mask)
+        r0, r1 = int(rr.min()), int(rr.max()) + 1
+        c0, c1 = int(cc.min()), int(cc.max()) + 1
+        roi = ROI(
+            key,
+            (top, bottom, r0, r1, c0, c1),
+            mask[r0:r1, c0:c1],
+            np.ascontiguousarray(self.volume[top:bottom, r0:r1, c0:c1]),
+        )
+        return self._rois.put(key, roi)
+
+    def segmentation(self, annotations, v_min, v_max, timer=None):
+        """
+        The occlusion of the ROI of an annotation with intensities in
+        (v_min, v_max], None if the ROI is empty.
+        """
+
+        timer = timer or StageTimer("segmentation")
+        roi = self.roi(annotations)
+        timer.mark("roi")
+        if roi is None:
+            return None
+        key = json.dumps([roi.key, v_min, v_max])
+        segmentation = self._segmentations.get(key)
+        if segmentation is not None:
+            return segmentation
+
+        mask = np.logical_and(roi.volume > v_min, roi.volume <= v_max)
+        mask &= roi.polygon
+        timer.mark("threshold")
+        if mask.any():
+            mask = largest_connected_component(mask)
+        timer.mark("label")
+        return self._segmentations.put(key, Segmentation(roi, mask))
+
+    def mesh(self, segmentation, timer=None):
+        """
+        Vertices and faces of the surface of the smoothed occlusion, the same
+        as over the whole volume, or None if it has no surface.
+        """
+
+        timer = timer or StageTimer("mesh")
+        if not segmentation.mask.any():
+            return None
+        top, bottom, r0, r1, c0, c1 = segmentation.roi.box
+        radius, step = SMOOTHING_RADIUS, MESH_STEP
+        # the smoothed occlusion is zero beyond `radius` of the box, and the
+        # surface is sampled on the grid of the whole volume
+        lower = [top, r0 - radius, c0 - radius]
+        upper = [bottom, r1 + radius, c1 + radius]
+        start = [max((l - 1) // step * step, 0) for l in lower]
+        stop = [
+            min(-(-u // step) * step + 1, n) for u, n in zip(upper, self.volume.shape)
+        ]
+        mask = np.zeros([b - a for a, b in zip(start, stop)], dtype=bool)
+        mask[
+            top - start[0] : bottom - start[0],
+            r0 - start[1] : r1 - start[1],
+            c0 - start[2] : c1 - start[2],
+        ] = segmentation.mask
+        side = 2 * radius + 1
+        mask = filters.median(mask, selem=np.ones((1, side, side)))
+        timer.mark("smooth")
+        if not mask.any():
+            return None
+        try:
+            verts, faces, _, _ = measure.marching_cubes(mask, 0.5, step_size=step)
+        except RuntimeError:
+            return None
+        finally:
+            timer.mark("marching cubes")
+        return verts + np.array(start), faces
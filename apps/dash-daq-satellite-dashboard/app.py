@@ -1,14 +1,19 @@
+import copy
 import time
 import pathlib
 import os
 
+import numpy as np
 import pandas as pd
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import State, Input, Output
+from dash.exceptions import PreventUpdate
 import dash_daq as daq
 
+from telemetry import TelemetryBuffer
+
 app = dash.Dash(
     __name__,
     meta_tags=[
@@ -234,6 +239,20 @@ minute_toggle = daq.ToggleSwitch(
     style={"color": "#black"},
 )
 
+# Choices of the number of samples in the histogram, the last one is the whole
+# history of the telemetry buffers
+HISTOGRAM_SAMPLES = [60, 300, 900, 1800]
+
+histogram_samples_dropdown = dcc.Dropdown(
+    id="histogram-samples-dropdown",
+    options=[
+        {"label": "Last {} samples".format(n), "value": n} for n in HISTOGRAM_SAMPLES
+    ],
+    value=HISTOGRAM_SAMPLES[0],
+    clearable=False,
+    searchable=False,
+)
+
 # Side panel
 
 satellite_dropdown = dcc.Dropdown(
@@ -325,6 +344,25 @@ map_graph = html.Div(
 
 # Histogram
 
+histogram_figure = {
+    "data": [
+        {
+            "x": [i for i in range(60)],
+            "y": [i for i in range(60)],
+            "type": "scatter",
+            "marker": {"color": "#fec036"},
+        }
+    ],
+    "layout": {
+        "margin": {"t": 30, "r": 35, "b": 40, "l": 50},
+        "xaxis": {"dtick": 5, "gridcolor": "#636363", "showline": False},
+        "yaxis": {"showgrid": False},
+        "plot_bgcolor": "#2b2b2b",
+        "paper_bgcolor": "#2b2b2b",
+        "font": {"color": "gray"},
+    },
+}
+
 histogram = html.Div(
     id="histogram-container",
     children=[
@@ -334,29 +372,13 @@ histogram = html.Div(
                 html.H1(
                     id="histogram-title", children=["Select A Property To Display"]
                 ),
+                histogram_samples_dropdown,
                 minute_toggle,
             ],
         ),
         dcc.Graph(
             id="histogram-graph",
-            figure={
-                "data": [
-                    {
-                        "x": [i for i in range(60)],
-                        "y": [i for i in range(60)],
-                        "type": "scatter",
-                        "marker": {"color": "#fec036"},
-                    }
-                ],
-                "layout": {
-                    "margin": {"t": 30, "r": 35, "b": 40, "l": 50},
-                    "xaxis": {"dtick": 5, "gridcolor": "#636363", "showline": False},
-                    "yaxis": {"showgrid": False},
-                    "plot_bgcolor": "#2b2b2b",
-                    "paper_bgcolor": "#2b2b2b",
-                    "font": {"color": "gray"},
-                },
-            },
+            figure=histogram_figure,
             config={"displayModeBar": False},
         ),
     ],
@@ -449,78 +471,78 @@ df_gps_h_1 = pd.read_csv(
     os.path.join(APP_PATH, os.path.join("data", "gps_data_h_1.csv"))
 )
 
+# Telemetry
+
+# Interval of the dashboard, the clock of the past minute telemetry
+TICK_SECONDS = 2
+# Ticks between two samples of the past hour telemetry
+HOUR_TICKS = 30
+# Samples kept for each satellite and resolution, the most the histogram shows
+HISTORY_SIZE = max(HISTOGRAM_SAMPLES)
+
+TELEMETRY_FIELDS = [
+    "elevation",
+    "temperature",
+    "speed",
+    "fuel",
+    "battery",
+    "latitude",
+    "longitude",
+]
+
+
+def telemetry_source(df_non_gps, df_gps):
+    # Recorded samples, the non GPS data repeated to the length of the GPS data
+    non_gps = df_non_gps[TELEMETRY_FIELDS[:5]].values
+    repeats = -(-len(df_gps) // len(non_gps))
+    non_gps = np.tile(non_gps, (repeats, 1))[: len(df_gps)]
+    return np.column_stack([non_gps, df_gps[["lat", "lon"]].values])
+
+
+# Recorded telemetry of each satellite and resolution, played in a loop
+telemetry_sources = {
+    (0, "minute"): telemetry_source(df_non_gps_m_0, df_gps_m_0),
+    (0, "hour"): telemetry_source(df_non_gps_h_0, df_gps_h_0),
+    (1, "minute"): telemetry_source(df_non_gps_m_1, df_gps_m_1),
+    (1, "hour"): telemetry_source(df_non_gps_h_1, df_gps_h_1),
+}
+
+# Last samples of each satellite and resolution, shared by all the sessions
+telemetry = {
+    key: TelemetryBuffer(TELEMETRY_FIELDS, HISTORY_SIZE) for key in telemetry_sources
+}
+
+
+# Advance the telemetry to the current tick, sessions only read the buffers
+def update_telemetry():
+    tick = int(time.time() // TICK_SECONDS)
+    for (sat, resolution), source in telemetry_sources.items():
+        position = tick if resolution == "minute" else tick // HOUR_TICKS
+        telemetry[sat, resolution].replay(source, position)
+
+
+# Index of the satellite of the dropdown, None if there is none
+def satellite_index(satellite_type):
+    return {"h45-k1": 0, "l12-5": 1}.get(satellite_type)
+
+
+update_telemetry()
+
 # Root
 root_layout = html.Div(
     id="root",
     children=[
         dcc.Store(id="store-placeholder"),
+        # For the case no components were clicked, we need to know what type of graph to preserve
         dcc.Store(
-            id="store-data",
+            id="store-data-config",
             data={
-                "hour_data_0": {
-                    "elevation": [df_non_gps_h_0["elevation"][i] for i in range(60)],
-                    "temperature": [
-                        df_non_gps_h_0["temperature"][i] for i in range(60)
-                    ],
-                    "speed": [df_non_gps_h_0["speed"][i] for i in range(60)],
-                    "latitude": [
-                        "{0:09.4f}".format(df_gps_h_0["lat"][i]) for i in range(60)
-                    ],
-                    "longitude": [
-                        "{0:09.4f}".format(df_gps_h_0["lon"][i]) for i in range(60)
-                    ],
-                    "fuel": [df_non_gps_h_0["fuel"][i] for i in range(60)],
-                    "battery": [df_non_gps_h_0["battery"][i] for i in range(60)],
-                },
-                "minute_data_0": {
-                    "elevation": [df_non_gps_m_0["elevation"][i] for i in range(60)],
-                    "temperature": [
-                        df_non_gps_m_0["temperature"][i] for i in range(60)
-                    ],
-                    "speed": [df_non_gps_m_0["speed"][i] for i in range(60)],
-                    "latitude": [
-                        "{0:09.4f}".format(df_gps_m_0["lat"][i]) for i in range(60)
-                    ],
-                    "longitude": [
-                        "{0:09.4f}".format(df_gps_m_0["lon"][i]) for i in range(60)
-                    ],
-                    "fuel": [df_non_gps_m_0["fuel"][i] for i in range(60)],
-                    "battery": [df_non_gps_m_0["battery"][i] for i in range(60)],
-                },
-                "hour_data_1": {
-                    "elevation": [df_non_gps_h_1["elevation"][i] for i in range(60)],
-                    "temperature": [
-                        df_non_gps_h_1["temperature"][i] for i in range(60)
-                    ],
-                    "speed": [df_non_gps_h_1["speed"][i] for i in range(60)],
-                    "latitude": [
-                        "{0:09.4f}".format(df_gps_h_1["lat"][i]) for i in range(60)
-                    ],
-                    "longitude": [
-                        "{0:09.4f}".format(df_gps_h_1["lon"][i]) for i in range(60)
-                    ],
-                    "fuel": [df_non_gps_h_1["fuel"][i] for i in range(60)],
-                    "battery": [df_non_gps_h_1["battery"][i] for i in range(60)],
-                },
-                "minute_data_1": {
-                    "elevation": [df_non_gps_m_1["elevation"][i] for i in range(60)],
-                    "temperature": [
-                        df_non_gps_m_1["temperature"][i] for i in range(60)
-                    ],
-                    "speed": [df_non_gps_m_1["speed"][i] for i in range(60)],
-                    "latitude": [
-                        "{0:09.4f}".format(df_gps_m_1["lat"][i]) for i in range(60)
-                    ],
-                    "longitude": [
-                        "{0:09.4f}".format(df_gps_m_1["lon"][i]) for i in range(60)
-                    ],
-                    "fuel": [df_non_gps_m_1["fuel"][i] for i in range(60)],
-                    "battery": [df_non_gps_m_1["battery"][i] for i in range(60)],
-                },
+                "info_type": "",
+                "satellite_type": 0,
+                "position": None,
+                "origin": None,
             },
         ),
-        # For the case no components were clicked, we need to know what type of graph to preserve
-        dcc.Store(id="store-data-config", data={"info_type": "", "satellite_type": 0}),
         side_panel_layout,
         main_panel_layout,
     ],
@@ -529,81 +551,13 @@ root_layout = html.Div(
 app.layout = root_layout
 
 
-# Callbacks Data
-
-# Add new data every second/minute
-@app.callback(
-    Output("store-data", "data"),
-    [Input("interval", "n_intervals")],
-    [State("store-data", "data")],
-)
-def update_data(interval, data):
-    new_data = data
-    # Update H45-K1 data when sat==0, update L12-5 data when sat==1
-    for sat in range(2):
-        if sat == 0:
-            gps_minute_file = df_gps_m_0
-            gps_hour_file = df_gps_h_0
-        else:
-            gps_minute_file = df_gps_m_1
-            gps_hour_file = df_gps_h_1
-
-        m_data_key = "minute_data_" + str(sat)
-        h_data_key = "hour_data_" + str(sat)
-
-        new_data[m_data_key]["elevation"].append(data[m_data_key]["elevation"][0])
-        new_data[m_data_key]["elevation"] = new_data[m_data_key]["elevation"][1:61]
-        new_data[m_data_key]["temperature"].append(data[m_data_key]["temperature"][0])
-        new_data[m_data_key]["temperature"] = new_data[m_data_key]["temperature"][1:61]
-        new_data[m_data_key]["speed"].append(data[m_data_key]["speed"][0])
-        new_data[m_data_key]["speed"] = new_data[m_data_key]["speed"][1:61]
-        new_data[m_data_key]["latitude"].append(
-            "{0:09.4f}".format(gps_minute_file["lat"][(60 + interval) % 3600])
-        )
-        new_data[m_data_key]["latitude"] = new_data[m_data_key]["latitude"][1:61]
-        new_data[m_data_key]["longitude"].append(
-            "{0:09.4f}".format(gps_minute_file["lon"][(60 + interval) % 3600])
-        )
-        new_data[m_data_key]["longitude"] = new_data[m_data_key]["longitude"][1:61]
-
-        new_data[m_data_key]["fuel"].append(data[m_data_key]["fuel"][0])
-        new_data[m_data_key]["fuel"] = new_data[m_data_key]["fuel"][1:61]
-        new_data[m_data_key]["battery"].append(data[m_data_key]["battery"][0])
-        new_data[m_data_key]["battery"] = new_data["minute_data_0"]["battery"][1:61]
-
-        if interval % 60000 == 0:
-            new_data[h_data_key]["elevation"].append(data[h_data_key]["elevation"][0])
-            new_data[h_data_key]["elevation"] = new_data[h_data_key]["elevation"][1:61]
-            new_data[h_data_key]["temperature"].append(
-                data[h_data_key]["temperature"][0]
-            )
-            new_data[h_data_key]["temperature"] = new_data[h_data_key]["temperature"][
-                1:61
-            ]
-            new_data[h_data_key]["speed"].append(data[h_data_key]["speed"][0])
-            new_data[h_data_key]["speed"] = new_data[h_data_key]["speed"][1:61]
-            new_data[h_data_key]["latitude"].append(
-                "{0:09.4f}".format(gps_hour_file["lat"][interval % 60])
-            )
-            new_data[h_data_key]["latitude"] = new_data[h_data_key]["latitude"][1:61]
-            new_data[h_data_key]["longitude"].append(
-                "{0:09.4f}".format(gps_hour_file["lon"][interval % 60])
-            )
-            new_data[h_data_key]["longitude"] = new_data[h_data_key]["longitude"][1:61]
-            new_data[h_data_key]["fuel"].append(data[h_data_key]["fuel"][0])
-            new_data[h_data_key]["fuel"] = new_data[h_data_key]["fuel"][1:61]
-            new_data[h_data_key]["battery"].append(data[h_data_key]["battery"][0])
-            new_data[h_data_key]["battery"] = new_data[h_data_key]["battery"]
-
-    return new_data
-
-
 # Callbacks Histogram
 
-# Update the graph
+# Update the graph, extending it with the new samples on each interval
 @app.callback(
     [
         Output("histogram-graph", "figure"),
+        Output("histogram-graph", "extendData"),
         Output("store-data-config", "data"),
         Output("histogram-title", "children"),
     ],
@@ -611,6 +565,7 @@ def update_data(interval, data):
         Input("interval", "n_intervals"),
         Input("satellite-dropdown-component", "value"),
         Input("control-panel-toggle-minute", "value"),
+        Input("histogram-samples-dropdown", "value"),
         Input("control-panel-elevation", "n_clicks"),
         Input("control-panel-temperature", "n_clicks"),
         Input("control-panel-speed", "n_clicks"),
@@ -619,18 +574,13 @@ def update_data(interval, data):
         Input("control-panel-fuel", "n_clicks"),
         Input("control-panel-battery", "n_clicks"),
     ],
-    [
-        State("store-data", "data"),
-        State("store-data-config", "data"),
-        State("histogram-graph", "figure"),
-        State("store-data-config", "data"),
-        State("histogram-title", "children"),
-    ],
+    [State("store-data-config", "data"), State("histogram-title", "children")],
 )
 def update_graph(
     interval,
     satellite_type,
     minute_mode,
+    samples,
     elevation_n_clicks,
     temperature_n_clicks,
     speed_n_clicks,
@@ -638,10 +588,7 @@ def update_graph(
     longitude_n_clicks,
     fuel_n_clicks,
     battery_n_clicks,
-    data,
     data_config,
-    old_figure,
-    old_data,
     old_title,
 ):
     new_data_config = data_config
@@ -655,12 +602,7 @@ def update_graph(
         trigger_input = ctx.triggered[0]["prop_id"].split(".")[0]
 
     # Update store-data-config['satellite_type']
-    if satellite_type == "h45-k1":
-        new_data_config["satellite_type"] = 0
-    elif satellite_type == "l12-5":
-        new_data_config["satellite_type"] = 1
-    else:
-        new_data_config["satellite_type"] = None
+    new_data_config["satellite_type"] = satellite_index(satellite_type)
 
     # Decide the range of Y given if minute_mode is on
     def set_y_range(data_key):
@@ -725,77 +667,66 @@ def update_graph(
                     "autorange": False,
                 }
 
+    # Telemetry of the satellite shown, in the resolution shown
+    def telemetry_buffer():
+        if new_data_config["satellite_type"] is None:
+            raise PreventUpdate
+        resolution = "minute" if minute_mode else "hour"
+        return telemetry[new_data_config["satellite_type"], resolution]
+
     # Function to update values
     def update_graph_data(data_key):
-        string_buffer = ""
-        if data_config["satellite_type"] == 0:
-            string_buffer = "_0"
-        elif data_config["satellite_type"] == 1:
-            string_buffer = "_1"
-
-        if minute_mode:
-            figure["data"][0]["y"] = list(
-                reversed(data["minute_data" + string_buffer][data_key])
-            )
-        else:
-            figure["data"][0]["y"] = list(
-                reversed(data["hour_data" + string_buffer][data_key])
-            )
+        positions, values = telemetry_buffer().window(data_key, samples)
+        # Samples are numbered from the most recent one when the graph is drawn,
+        # the absolute position is only kept to know which samples are new
+        origin = int(positions[-1]) if len(positions) else None
+        figure["data"][0]["x"] = positions - (origin or 0)
+        figure["data"][0]["y"] = values
+        # Most recent sample first, a tick every twelfth of the samples
+        figure["layout"]["xaxis"]["autorange"] = "reversed"
+        figure["layout"]["xaxis"]["dtick"] = max(samples // 12, 1)
+        new_data_config["position"] = origin
+        new_data_config["origin"] = origin
 
         # Graph title changes depending on graphed data
         new_title = data_key.capitalize() + " Histogram"
         return [data_key, new_title]
 
-    # A default figure option to base off everything else from
-    figure = old_figure
-
-    # First pass checks if a component has been selected
-    if trigger_input == "control-panel-elevation":
-        set_y_range("elevation")
-        info_type, new_title = update_graph_data("elevation")
-
-    elif trigger_input == "control-panel-temperature":
-        set_y_range("temperature")
-        info_type, new_title = update_graph_data("temperature")
+    # Samples of the graph newer than the ones it shows
+    def extend_graph_data(data_key):
+        positions, values = telemetry_buffer().window(
+            data_key, samples, after=data_config.get("position")
+        )
+        if not len(positions):
+            return dash.no_update
+        if data_config.get("origin") is None:
+            new_data_config["origin"] = int(positions[0])
+        new_data_config["position"] = int(positions[-1])
+        x = positions - new_data_config["origin"]
+        return dict(x=[x], y=[values]), [0], samples
 
-    elif trigger_input == "control-panel-speed":
-        set_y_range("speed")
-        info_type, new_title = update_graph_data("speed")
+    update_telemetry()
 
-    elif trigger_input == "control-panel-latitude":
-        set_y_range("latitude")
-        info_type, new_title = update_graph_data("latitude")
+    # A default figure option to base off everything else from
+    figure = copy.deepcopy(histogram_figure)
 
-    elif trigger_input == "control-panel-longitude":
-        set_y_range("longitude")
-        info_type, new_title = update_graph_data("longitude")
+    # First pass checks if a component has been selected
+    if trigger_input in ["control-panel-" + field for field in TELEMETRY_FIELDS]:
+        info_type = trigger_input[len("control-panel-") :]
 
-    elif trigger_input == "control-panel-fuel":
-        set_y_range("fuel")
-        info_type, new_title = update_graph_data("fuel")
+    # If no component has been selected, check for most recent info_type, to prevent graph from always resetting
+    elif info_type not in TELEMETRY_FIELDS:
+        return [dash.no_update, dash.no_update, new_data_config, old_title]
 
-    elif trigger_input == "control-panel-battery":
-        set_y_range("battery")
-        info_type, new_title = update_graph_data("battery")
+    # New samples only on interval, the whole graph on any other change
+    elif trigger_input == "interval":
+        extend_data = extend_graph_data(info_type)
+        return [dash.no_update, extend_data, new_data_config, old_title]
 
-    # If no component has been selected, check for most recent info_type, to prevent graph from always resetting
-    else:
-        if info_type in [
-            "elevation",
-            "temperature",
-            "speed",
-            "latitude",
-            "longitude",
-            "fuel",
-            "battery",
-        ]:
-            set_y_range(info_type)
-            nil, new_title = update_graph_data(info_type)
-            return [figure, new_data_config, new_title]
-        else:
-            return [old_figure, old_data, old_title]
+    set_y_range(info_type)
+    info_type, new_title = update_graph_data(info_type)
     new_data_config["info_type"] = info_type
-    return [figure, new_data_config, new_title]
+    return [figure, dash.no_update, new_data_config, new_title]
 
 
 # Callbacks Dropdown
@@ -848,55 +779,47 @@ def update_satellite_description(val):
 
 # Callbacks Map
 
-
+# Draw the map on a change of satellite or path toggle, then move the satellite
 @app.callback(
-    Output("world-map", "figure"),
+    [Output("world-map", "figure"), Output("world-map", "extendData")],
     [
         Input("interval", "n_intervals"),
         Input("control-panel-toggle-map", "value"),
         Input("satellite-dropdown-component", "value"),
     ],
-    [
-        State("world-map", "figure"),
-        State("store-data", "data"),
-        State("store-data-config", "data"),
-    ],
 )
-def update_word_map(clicks, toggle, satellite_type, old_figure, data, data_config):
-    figure = old_figure
-    string_buffer = ""
-
-    # Set string buffer as well as drawing the satellite path
-    if data_config["satellite_type"] == 0:
-        string_buffer = "_0"
-        figure["data"][0]["lat"] = [df_gps_m_0["lat"][i] for i in range(3600)]
-        figure["data"][0]["lon"] = [df_gps_m_0["lon"][i] for i in range(3600)]
+def update_word_map(clicks, toggle, satellite_type):
+    sat = satellite_index(satellite_type)
+    ctx = dash.callback_context
+    update_telemetry()
+
+    if ctx.triggered and ctx.triggered[0]["prop_id"] == "interval.n_intervals":
+        if sat is None or clicks % 2:
+            return [dash.no_update, dash.no_update]
+        buffer = telemetry[sat, "minute"]
+        position = dict(
+            lat=[[buffer.latest("latitude")]], lon=[[buffer.latest("longitude")]]
+        )
+        return [dash.no_update, (position, [1], 1)]
 
-    elif data_config["satellite_type"] == 1:
-        string_buffer = "_1"
-        figure["data"][0]["lat"] = [df_gps_m_1["lat"][i] for i in range(3600)]
-        figure["data"][0]["lon"] = [df_gps_m_1["lon"][i] for i in range(3600)]
-    else:
-        figure["data"][0]["lat"] = [df_gps_m["lat"][i] for i in range(3600)]
-        figure["data"][0]["lon"] = [df_gps_m["lon"][i] for i in range(3600)]
+    figure = {"data": copy.deepcopy(map_data), "layout": map_layout}
 
-    if not string_buffer:
+    # Draw the satellite path and position
+    if sat is None:
         figure["data"][1]["lat"] = [1.0]
         figure["data"][1]["lon"] = [1.0]
-
-    elif clicks % 2 == 0:
-        figure["data"][1]["lat"] = [
-            float(data["minute_data" + string_buffer]["latitude"][-1])
-        ]
-        figure["data"][1]["lon"] = [
-            float(data["minute_data" + string_buffer]["longitude"][-1])
-        ]
+    else:
+        df_gps_m = [df_gps_m_0, df_gps_m_1][sat]
+        figure["data"][0]["lat"] = df_gps_m["lat"].values
+        figure["data"][0]["lon"] = df_gps_m["lon"].values
+        figure["data"][1]["lat"] = [telemetry[sat, "minute"].latest("latitude")]
+        figure["data"][1]["lon"] = [telemetry[sat, "minute"].latest("longitude")]
 
     # If toggle is off, hide path
     if not toggle:
         figure["data"][0]["lat"] = []
         figure["data"][0]["lon"] = []
-    return figure
+    return [figure, dash.no_update]
 
 
 # Callbacks Components
@@ -914,6 +837,16 @@ def update_time(interval):
     return hour + ":" + minute
 
 
+# Last minute telemetry of the satellite of the dropdown
+def latest_telemetry(satellite_type, components):
+    sat = satellite_index(satellite_type)
+    if sat is None:
+        raise PreventUpdate
+    update_telemetry()
+    buffer = telemetry[sat, "minute"]
+    return [buffer.latest(component) for component in components]
+
+
 @app.callback(
     [
         Output("control-panel-elevation-component", "value"),
@@ -923,22 +856,11 @@ def update_time(interval):
         Output("control-panel-battery-component", "value"),
     ],
     [Input("interval", "n_intervals"), Input("satellite-dropdown-component", "value")],
-    [State("store-data-config", "data"), State("store-data", "data")],
 )
-def update_non_gps_component(clicks, satellite_type, data_config, data):
-    string_buffer = ""
-    if data_config["satellite_type"] == 0:
-        string_buffer = "_0"
-    if data_config["satellite_type"] == 1:
-        string_buffer = "_1"
-
-    new_data = []
+def update_non_gps_component(clicks, satellite_type):
     components_list = ["elevation", "temperature", "speed", "fuel", "battery"]
     # Update each graph value
-    for component in components_list:
-        new_data.append(data["minute_data" + string_buffer][component][-1])
-
-    return new_data
+    return latest_telemetry(satellite_type, components_list)
 
 
 @app.callback(
@@ -947,22 +869,15 @@ def update_non_gps_component(clicks, satellite_type, data_config, data):
         Output("control-panel-longitude-component", "value"),
     ],
     [Input("interval", "n_intervals"), Input("satellite-dropdown-component", "value")],
-    [State("store-data-config", "data"), State("store-data", "data")],
 )
-def update_gps_component(clicks, satellite_type, data_config, data):
-    string_buffer = ""
-    if data_config["satellite_type"] == 0:
-        string_buffer = "_0"
-    if data_config["satellite_type"] == 1:
-        string_buffer = "_1"
-
+def update_gps_component(clicks, satellite_type):
     new_data = []
-    for component in ["latitude", "longitude"]:
-        val = list(data["minute_data" + string_buffer][component][-1])
+    for value in latest_telemetry(satellite_type, ["latitude", "longitude"]):
+        val = "{0:09.4f}".format(value)
         if val[0] == "-":
-            new_data.append("0" + "".join(val[1::]))
+            new_data.append("0" + val[1:])
         else:
-            new_data.append("".join(val))
+            new_data.append(val)
     return new_data
 
 
@@ -972,19 +887,11 @@ def update_gps_component(clicks, satellite_type, data_config, data):
         Output("control-panel-longitude-component", "color"),
     ],
     [Input("interval", "n_intervals"), Input("satellite-dropdown-component", "value")],
-    [State("store-data-config", "data"), State("store-data", "data")],
 )
-def update_gps_color(clicks, satellite_type, data_config, data):
-    string_buffer = ""
-    if data_config["satellite_type"] == 0:
-        string_buffer = "_0"
-    if data_config["satellite_type"] == 1:
-        string_buffer = "_1"
-
+def update_gps_color(clicks, satellite_type):
     new_data = []
 
-    for component in ["latitude", "longitude"]:
-        value = float(data["minute_data" + string_buffer][component][-1])
+    for value in latest_telemetry(satellite_type, ["latitude", "longitude"]):
         if value < 0:
             new_data.append("#ff8e77")
         else:
@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+
+
+class TelemetryBuffer:
+    """
+    Ring buffer of the last `size` telemetry samples of a satellite, shared by
+    all the sessions.
+
+    Samples are numbered by position, the number of ticks of the clock of the
+    feed. Each field is a column of a fixed-size array written at `head`, so
+    adding a sample never moves the others.
+    """
+
+    def __init__(self, fields, size):
+        self.fields = list(fields)
+        self.index = {field: j for j, field in enumerate(self.fields)}
+        self.size = size
+        self.values = np.full((size, len(self.fields)), np.nan)
+        self.positions = np.full(size, -1, dtype=np.int64)
+        self.head = 0  # next slot to write
+        self.count = 0
+        self.position = None  # position of the last sample
+        self._lock = threading.Lock()
+
+    def _push(self, positions, rows):
+        slots = (self.head + np.arange(len(positions))) % self.size
+        self.positions[slots] = positions
+        self.values[slots] = rows
+        self.head = (self.head + len(positions)) % self.size
+        self.count = min(self.count + len(positions), self.size)
+        self.position = int(positions[-1])
+
+    def push(self, position, row):
+        """Add the sample of a position after the last one."""
+
+        with self._lock:
+            if self.position is not None and position <= self.position:
+                raise ValueError("positions of samples must increase")
+            self._push(np.array([position]), np.asarray(row, dtype=float)[None])
+
+    def replay(self, source, position):
+        """
+        Add the samples up to `position` of a recording played in a loop, the
+        sample of position p being row p % len(source) of `source`. Samples
+        that would be overwritten in the same call are skipped.
+        """
+
+        with self._lock:
+            start = position - self.size + 1
+            if self.position is not None:
+                start = max(start, self.position + 1)
+            if start > position:
+                return
+            positions = np.arange(start, position + 1)
+            self._push(positions, source[positions % len(source)])
+
+    def window(self, field, n=None, after=None):
+        """
+        Positions and values of a field of the last `n` samples, oldest first,
+        only the samples after position `after` if given.
+        """
+
+        with self._lock:
+            n = self.count if n is None else min(n, self.count)
+            slots = np.arange(self.head - n, self.head) % self.size
+            if after is not None:
+                slots = slots[self.positions[slots] > after]
+            return self.positions[slots], self.values[slots, self.index[field]]
+
+    def latest(self, field):
+        with self._lock:
+            return self.values[(self.head - 1) % self.size, self.index[field]]
+
+    def __len__(self):
+        return self.count
@@ -1,17 +1,19 @@
-from collections import OrderedDict
+from functools import lru_cache
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output
-import datashader as ds
-import datashader.transfer_functions as tf
 import pandas as pd
 import numpy as np
 
+from decimation import minmax_decimate
+from pyramid import AggregatePyramid
+
 # Data generation
 
 n = 1000000
 max_points = 100000
+line_buckets = 1000  # pixel columns of the min/max line, 4 points at most each
 
 np.random.seed(2)
 cols = ["Signal"]  # Column name of signal
@@ -43,19 +45,28 @@ df = pd.DataFrame(data)
 time_start = df["Time"].values[0]
 time_end = df["Time"].values[-1]
 
-cvs = ds.Canvas(x_range=x_range, y_range=y_range)
+# Aggregates at several zoom levels, the overview is the coarsest one
+pyramid = AggregatePyramid(df, "Time", "Signal", x_range, y_range)
+x, y, z = pyramid.heatmap()
 
-aggs = OrderedDict((c, cvs.line(df, "Time", c)) for c in cols)
-img = tf.shade(aggs["Signal"])
 
-arr = np.array(img)
-z = arr.tolist()
+# Returns the zoomed time range and its row positions, shared by the callbacks
+@lru_cache(maxsize=64)
+def selected_range(x0, x1):
+    i0, i1 = pyramid.index(x0, x1)
+    return x0, x1, i0, i1
 
-# axes
-dims = len(z[0]), len(z)
 
-x = np.linspace(x_range[0], x_range[1], dims[0])
-y = np.linspace(y_range[0], y_range[1], dims[0])
+# Returns selected range of graph-1 relayoutData, None if nothing is selected
+def get_selection(selection):
+    if (
+        selection is not None
+        and "xaxis.range[0]" in selection
+        and "xaxis.range[1]" in selection
+    ):
+        return selected_range(selection["xaxis.range[0]"], selection["xaxis.range[1]"])
+    return None
+
 
 # Layout
 
@@ -170,6 +181,15 @@ app.layout = html.Div(
              selected data",
                             id="header-1",
                         ),
+                        dcc.RadioItems(
+                            id="decimation-mode",
+                            options=[
+                                {"label": "Datashader heatmap", "value": "heatmap"},
+                                {"label": "Min/max line", "value": "minmax"},
+                            ],
+                            value="heatmap",
+                            labelStyle={"display": "inline-block"},
+                        ),
                         dcc.Graph(
                             id="graph-1", figure=fig1, config={"doubleClick": "reset"}
                         ),
@@ -211,26 +231,14 @@ app.layout = html.Div(
     [Input("graph-1", "relayoutData")],
 )
 def selectionRange(selection):
-    if (
-        selection is not None
-        and "xaxis.range[0]" in selection
-        and "xaxis.range[1]" in selection
-    ):
-        x0 = selection["xaxis.range[0]"]
-        x1 = selection["xaxis.range[1]"]
-        sub_df = df[(df.Time >= x0) & (df.Time <= x1)]
-        num_pts = len(sub_df)
+    selected = get_selection(selection)
+    if selected is not None:
+        x0, x1, i0, i1 = selected
+        num_pts = i1 - i0
+        number = "{:,}".format(abs(int(x1) - int(x0)))
         if num_pts < max_points:
-            number = "{:,}".format(
-                abs(int(selection["xaxis.range[1]"]) - int(selection["xaxis.range[0]"]))
-            )
-            number_print = " points selected between {0:,.4} and {1:,.4}".format(
-                selection["xaxis.range[0]"], selection["xaxis.range[1]"]
-            )
+            number_print = " points selected between {0:,.4} and {1:,.4}".format(x0, x1)
         else:
-            number = "{:,}".format(
-                abs(int(selection["xaxis.range[1]"]) - int(selection["xaxis.range[0]"]))
-            )
             number_print = " points selected. Select less than {0:}k \
             points to invoke high-res scattergl trace".format(
                 max_points / 1000
@@ -244,68 +252,59 @@ def selectionRange(selection):
 @app.callback(Output("graph-2", "figure"), [Input("graph-1", "relayoutData")])
 def selectionHighlight(selection):
     new_fig2 = fig2.copy()
-    if (
-        selection is not None
-        and "xaxis.range[0]" in selection
-        and "xaxis.range[1]" in selection
-    ):
-        x0 = selection["xaxis.range[0]"]
-        x1 = selection["xaxis.range[1]"]
-        sub_df = df[(df.Time >= x0) & (df.Time <= x1)]
-        num_pts = len(sub_df)
-        if num_pts < max_points:
-            shape = dict(
-                type="rect",
-                xref="x",
-                yref="paper",
-                y0=0,
-                y1=1,
-                x0=x0,
-                x1=x1,
-                line={"width": 0},
-                fillcolor="rgba(165, 131, 226, 0.10)",
-            )
+    selected = get_selection(selection)
+    if selected is not None and selected[3] - selected[2] < max_points:
+        x0, x1, i0, i1 = selected
+        shape = dict(
+            type="rect",
+            xref="x",
+            yref="paper",
+            y0=0,
+            y1=1,
+            x0=x0,
+            x1=x1,
+            line={"width": 0},
+            fillcolor="rgba(165, 131, 226, 0.10)",
+        )
 
-            new_fig2["layout"]["shapes"] = [shape]
-        else:
-            new_fig2["layout"]["shapes"] = []
+        new_fig2["layout"]["shapes"] = [shape]
     else:
         new_fig2["layout"]["shapes"] = []
     return new_fig2
 
 
-@app.callback(Output("graph-1", "figure"), [Input("graph-1", "relayoutData")])
-def draw_undecimated_data(selection):
-    if (
-        selection is not None
-        and "xaxis.range[0]" in selection
-        and "xaxis.range[1]" in selection
-        and len(
-            df[
-                (df.Time >= selection["xaxis.range[0]"])
-                & (df.Time <= selection["xaxis.range[1]"])
-            ]
+@app.callback(
+    Output("graph-1", "figure"),
+    [Input("graph-1", "relayoutData"), Input("decimation-mode", "value")],
+)
+def draw_undecimated_data(selection, mode):
+    selected = get_selection(selection)
+    if selected is None:
+        if mode != "minmax":
+            return fig1.copy()
+        x0, x1, i0, i1 = x_range[0], x_range[1], 0, len(df)
+    else:
+        x0, x1, i0, i1 = selected
+
+    new_fig1 = fig1.copy()
+    if mode == "minmax" or i1 - i0 < max_points:
+        # line of the selected points, downsampled to a few thousand points
+        x, y = minmax_decimate(
+            df["Time"].values[i0:i1], df["Signal"].values[i0:i1], line_buckets
         )
-        < max_points
-    ):
-        x0 = selection["xaxis.range[0]"]
-        x1 = selection["xaxis.range[1]"]
-        sub_df = df[(df.Time >= x0) & (df.Time <= x1)]
-        num_pts = len(sub_df)
-        new_fig1 = fig1.copy()
         high_res_data = [
             dict(
-                x=sub_df["Time"],
-                y=sub_df["Signal"],
+                x=x,
+                y=y,
                 type="scattergl",
                 marker=dict(sizemin=1, sizemax=30, color="#a3a7b0"),
             )
         ]
-        high_res_layout = new_fig1["layout"]
-        high_res = dict(data=high_res_data, layout=high_res_layout)
     else:
-        high_res = fig1.copy()
-    return high_res
+        # zoomed heatmap at screen resolution, from the aggregate pyramid
+        x, y, z = pyramid.heatmap(x0, x1)
+        high_res_data = [dict(fig1["data"][0], x=x, y=y, z=z)]
+    return dict(data=high_res_data, layout=new_fig1["layout"])
 
 
 if __name__ == "__main__":
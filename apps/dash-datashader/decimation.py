@@ -0,0 +1,39 @@
+import numpy as np
+
+
+def minmax_decimate(x, y, n_buckets):
+    """
+    Downsample a line to at most 4 points per bucket of equal x width.
+
+    Each bucket, typically one pixel column, keeps its first, last, minimum and
+    maximum points in their original order (M4 aggregation), so the line
+    rasterized from the result covers the same pixels as the full line.
+    `x` must be sorted.
+    """
+
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= 4 * n_buckets:
+        return x, y
+
+    # first point of each bucket, buckets without points are skipped
+    edges = np.linspace(x[0], x[-1], n_buckets + 1)
+    bounds = np.searchsorted(x, edges, side="left")
+    bounds[-1] = len(x)
+    non_empty = bounds[1:] > bounds[:-1]
+    starts = bounds[:-1][non_empty]
+    stops = bounds[1:][non_empty]
+
+    # offset of the minimum and maximum of each bucket from its start
+    offsets = np.arange(len(x)) - np.repeat(starts, stops - starts)
+    sizes = np.repeat(stops - starts, stops - starts)
+    y_min = np.minimum.reduceat(y, starts)
+    y_max = np.maximum.reduceat(y, starts)
+    is_min = y == np.repeat(y_min, stops - starts)
+    is_max = y == np.repeat(y_max, stops - starts)
+    first_min = np.minimum.reduceat(np.where(is_min, offsets, sizes), starts)
+    first_max = np.minimum.reduceat(np.where(is_max, offsets, sizes), starts)
+
+    keep = np.concatenate([starts, stops - 1, starts + first_min, starts + first_max])
+    keep = np.unique(keep)
+    return x[keep], y[keep]
@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+import datashader as ds
+import datashader.transfer_functions as tf
+import numpy as np
+
+
+class TimeRangeIndex:
+    """Row positions of a time range in a signal sorted by time."""
+
+    def __init__(self, time):
+        self.time = np.asarray(time)
+
+    def __call__(self, x0, x1):
+        i0 = int(np.searchsorted(self.time, x0, side="left"))
+        i1 = int(np.searchsorted(self.time, x1, side="right"))
+        return i0, i1
+
+
+class AggregatePyramid:
+    """
+    Datashader line aggregates of a signal at several zoom levels.
+
+    Level k covers the whole time range with `width * 2 ** k` columns. A zoom
+    window is served by slicing the columns of the first level that has at
+    least `width` columns in it. Windows narrower than the deepest level allows
+    are rasterized on the fly, using only the rows inside the window.
+    """
+
+    def __init__(
+        self, df, x, y, x_range, y_range, width=600, height=600, levels=4, cache=32
+    ):
+        self.df = df
+        self.x = x
+        self.y = y
+        self.x_range = x_range
+        self.y_range = y_range
+        self.width = width
+        self.height = height
+        self.index = TimeRangeIndex(df[x].values)
+        self.levels = [
+            ds.Canvas(
+                plot_width=width * 2 ** k,
+                plot_height=height,
+                x_range=x_range,
+                y_range=y_range,
+            ).line(df, x, y)
+            for k in range(levels)
+        ]
+        self._cache_size = cache
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _columns(self, level, x0, x1):
+        n_columns = self.width * 2 ** level
+        span = self.x_range[1] - self.x_range[0]
+        c0 = int(np.floor((x0 - self.x_range[0]) / span * n_columns))
+        c1 = int(np.ceil((x1 - self.x_range[0]) / span * n_columns))
+        return max(c0, 0), min(c1, n_columns)
+
+    def _rasterize(self, x0, x1):
+        i0, i1 = self.index(x0, x1)
+        # keep the points just outside the window so lines reach its borders
+        rows = self.df.iloc[max(i0 - 1, 0) : i1 + 1]
+        canvas = ds.Canvas(
+            plot_width=self.width,
+            plot_height=self.height,
+            x_range=(x0, x1),
+            y_range=self.y_range,
+        )
+        return canvas.line(rows, self.x, self.y)
+
+    def aggregate(self, x0=None, x1=None):
+        """Aggregate of the window [x0, x1], about `width` columns wide."""
+
+        x0 = self.x_range[0] if x0 is None else max(x0, self.x_range[0])
+        x1 = self.x_range[1] if x1 is None else min(x1, self.x_range[1])
+
+        for level, agg in enumerate(self.levels):
+            c0, c1 = self._columns(level, x0, x1)
+            if c1 - c0 >= self.width:
+                return agg.isel({self.x: slice(c0, c1)})
+
+        key = (x0, x1)
+        with self._lock:
+            if key in self._windows:
+                self._windows.move_to_end(key)
+                return self._windows[key]
+
+        agg = self._rasterize(x0, x1)
+        with self._lock:
+            self._windows[key] = agg
+            if len(self._windows) > self._cache_size:
+                self._windows.popitem(last=False)
+        return agg
+
+    def heatmap(self, x0=None, x1=None):
+        """Shaded window as heatmap x, y and z values."""
+
+        agg = self.aggregate(x0, x1)
+        z = np.array(tf.shade(agg))
+        return agg.coords[self.x].values, agg.coords[self.y].values, z
@@ -2,21 +2,18 @@ import json
 import os
 import time
 import uuid
-from copy import deepcopy
-import csv
-import sys
 import pathlib
 
 import boto3
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-import requests
 from dash.dependencies import Input, Output, State
-from flask_caching import Cache
 
 import dash_reusable_components as drc
 import utils
+from image_engine import HALO, CheckpointCache, TiledImage, TileStore
+from storage import CachedStorage, S3Storage, SQLiteStorage, b64_chunks
 
 DEBUG = True
 LOCAL = False
@@ -25,21 +22,9 @@ APP_PATH = str(pathlib.Path(__file__).parent.resolve())
 app = dash.Dash(__name__)
 server = app.server
 
-if "BUCKET_NAME" in os.environ:
-    # Change caching to redis if hosted on dds
-    cache_config = {
-        "CACHE_TYPE": "redis",
-        "CACHE_REDIS_URL": os.environ["REDIS_URL"],
-        "CACHE_THRESHOLD": 400,
-    }
 # Local Conditions
-else:
+if "BUCKET_NAME" not in os.environ:
     LOCAL = True
-    # Caching with filesystem when served locally
-    cache_config = {
-        "CACHE_TYPE": "filesystem",
-        "CACHE_DIR": os.path.join(APP_PATH, "data"),
-    }
 
 # S3 Client. It is used to store user images. The bucket name
 # is stored inside the utils file, the key is
@@ -49,63 +34,34 @@ access_key_id = os.environ.get("ACCESS_KEY_ID")
 secret_access_key = os.environ.get("SECRET_ACCESS_KEY")
 bucket_name = os.environ.get("BUCKET_NAME")
 
-# Empty cache directory before running the app
-folder = os.path.join(APP_PATH, "data")
-for the_file in os.listdir(folder):
-    file_path = os.path.join(folder, the_file)
-    try:
-        if os.path.isfile(file_path):
-            os.unlink(file_path)
-    except Exception as e:
-        print(e)
-
-# If local, image data is stored locally in image_string.csv
+# If local, image data is stored locally in an SQLite database, shared by the
+# workers of the app
 if LOCAL:
-    f = open("image_string.csv", "w+")
-    f.close()
-
-    # Store images are very long strings, so allowed csv
-    # reading length is increased to its maximum allowed value
-    maxInt = sys.maxsize
-    while True:
-        # decrease the maxInt value by factor 10
-        # as long as the OverflowError occurs.
-        try:
-            csv.field_size_limit(maxInt)
-            break
-        except OverflowError:
-            maxInt = int(maxInt / 10)
-
-if not LOCAL:
+    blob_storage = SQLiteStorage(os.path.join(APP_PATH, "data", "images.sqlite"))
+
+else:
     s3 = boto3.client(
         "s3",
         endpoint_url="https://storage.googleapis.com",
         aws_access_key_id=access_key_id,
         aws_secret_access_key=secret_access_key,
     )
+    blob_storage = S3Storage(s3, bucket_name)
+
+# Images are stored as raw bytes, the last ones used are kept in memory
+image_storage = CachedStorage(blob_storage, max_bytes=256 << 20)
 
-# Caching
-cache = Cache()
-cache.init_app(app.server, config=cache_config)
+# Caching. Images are kept decoded as tiles, and the image of each prefix of
+# the action stacks as a checkpoint sharing the tiles it did not change
+tile_store = TileStore()
+checkpoints = CheckpointCache(max_size=256)
 
 
-# Store key value value (session_id, stringed_image)
-def store_image_string(string_image, key_name):
+# Store key value (session_id, image bytes), the bytes given in chunks
+def store_image(chunks, key_name):
     if DEBUG:
         print(key_name)
-    # If local, the string is stored in image_string.csv
-    if LOCAL:
-        with open("image_string.csv", mode="w+") as image_file:
-            image_writer = csv.DictWriter(image_file, fieldnames=["key", "image"])
-            image_writer.writeheader()
-            image_writer.writerow(dict(key=key_name, image=string_image))
-    # Generate the POST attributes
-    else:
-        post = s3.generate_presigned_post(Bucket=bucket_name, Key=key_name)
-
-        files = {"file": string_image}
-        # Post the string file using requests
-        requests.post(post["url"], data=post["fields"], files=files)
+    image_storage.write(key_name, chunks)
 
 
 def serve_layout():
@@ -114,7 +70,7 @@ def serve_layout():
 
     # Post the image to the right key, inside the bucket named after the
     # session ID
-    store_image_string(utils.IMAGE_STRING_PLACEHOLDER, session_id)
+    image_storage.put(session_id, utils.IMAGE_PLACEHOLDER)
 
     # App Layout
     return html.Div(
@@ -322,86 +278,84 @@ def undo_last_action(n_clicks, storage):
     return storage
 
 
-# Recursively retrieve the previous versions of the image by popping the
-# action stack
-@cache.memoize()
-def apply_actions_on_image(session_id, action_stack, filename, image_signature):
-    action_stack = deepcopy(action_stack)
-
-    # If we have arrived to the original image
-    if len(action_stack) == 0 and LOCAL:
-        with open("image_string.csv", mode="r") as image_file:
-            image_reader = csv.DictReader(image_file)
-            for row in image_reader:
-                im_pil = drc.b64_to_pil(row["image"])
-                return im_pil
-
-    if len(action_stack) == 0 and not LOCAL:
-        # Retrieve the url in which the image string is stored inside s3,
-        # using the session ID
-
-        url = s3.generate_presigned_url(
-            ClientMethod="get_object", Params={"Bucket": bucket_name, "Key": session_id}
-        )
-
-        # A key replacement is required for URL pre-sign in gcp
-
-        url = url.replace("AWSAccessKeyId", "GoogleAccessId")
-
-        response = requests.get(url)
-        if DEBUG:
-            print("IMAGE STRING LENGTH: " + str(len(response.text)))
-        im_pil = drc.b64_to_pil(response.text)
-        return im_pil
-
-    # Pop out the last action
-    last_action = action_stack.pop()
-    # Apply all the previous action_stack recursively, and gets the image PIL
-    im_pil = apply_actions_on_image(session_id, action_stack, filename, image_signature)
-    im_size = im_pil.size
-
-    # Apply the rest of the action_stack
-    operation = last_action["operation"]
-    selected_data = last_action["selectedData"]
-    action_type = last_action["type"]
+def apply_action(image, action):
+    """
+    Applies an action of the stack to a tiled image. Only the tiles touched
+    by the selection of the action are recomputed.
+    :param image: The TiledImage the action is applied to
+    :param action: The action, as added by add_action_to_stack
+    :return: A new TiledImage, sharing the untouched tiles with image
+    """
+    operation = action["operation"]
+    selected_data = action["selectedData"]
+    mask = None
 
     # Select using Lasso
     if selected_data and "lassoPoints" in selected_data:
-        selection_mode = "lasso"
-        selection_zone = utils.generate_lasso_mask(im_pil, selected_data)
+        mask = utils.generate_lasso_mask(image, selected_data)
+        zone = mask.getbbox()
+        if zone is None:
+            return image
     # Select using rectangular box
     elif selected_data and "range" in selected_data:
-        selection_mode = "select"
         lower, upper = map(int, selected_data["range"]["y"])
         left, right = map(int, selected_data["range"]["x"])
         # Adjust height difference
-        height = im_size[1]
+        height = image.size[1]
         upper = height - upper
         lower = height - lower
-        selection_zone = (left, upper, right, lower)
+        zone = (left, upper, right, lower)
     # Select the whole image
     else:
-        selection_mode = "select"
-        selection_zone = (0, 0) + im_size
-
-    # Apply the filters
-    if action_type == "filter":
-        utils.apply_filters(
-            image=im_pil, zone=selection_zone, filter=operation, mode=selection_mode
+        zone = (0, 0) + image.size
+
+    # Apply the filters. A rectangular selection is filtered on its own, a
+    # lasso one like the rest of the image
+    if action["type"] == "filter":
+        return image.apply(
+            zone,
+            lambda crop: utils.filter_image(crop, operation),
+            halo=HALO if mask is not None else 0,
+            mask=mask,
         )
-    elif action_type == "enhance":
+    elif action["type"] == "enhance":
         enhancement = operation["enhancement"]
         factor = operation["enhancement_factor"]
-
-        utils.apply_enhancements(
-            image=im_pil,
-            zone=selection_zone,
-            enhancement=enhancement,
-            enhancement_factor=factor,
-            mode=selection_mode,
+        # The contrast of a selection is relative to the whole image
+        mean = None
+        if enhancement == "contrast":
+            mean = utils.gray_mean(image.to_pil())
+
+        return image.apply(
+            zone,
+            lambda crop: utils.enhance_image(crop, enhancement, factor, mean),
+            halo=HALO,
+            mask=mask,
         )
+    return image
+
 
-    return im_pil
+# Retrieve the image after the action stack, replaying only the actions after
+# the longest prefix of the stack that has a checkpoint
+def apply_actions_on_image(session_id, action_stack, filename, image_signature):
+    keys = checkpoints.keys(session_id, image_signature, action_stack)
+    done, image = checkpoints.latest(keys)
+
+    # If we have to start from the original image
+    if image is None:
+        image_bytes = image_storage.read(session_id)
+        if DEBUG:
+            print("IMAGE LENGTH: " + str(len(image_bytes)))
+        im_pil = drc.bytes_to_pil(image_bytes)
+        image = TiledImage.from_pil(tile_store, im_pil)
+        checkpoints.put(keys[0], image)
+        done = 0
+
+    for action, key in zip(action_stack[done:], keys[done + 1 :]):
+        image = apply_action(image, action)
+        checkpoints.put(key, image)
+
+    return image
 
 
 @app.callback(
@@ -482,19 +436,24 @@ def update_graph_interactive_image(
         # Update the storage dict
         storage["filename"] = new_filename
 
-        # Parse the string and convert to pil
+        # Parse the string, and posts the image bytes into the image
+        # storage (SQLite locally, S3 otherwise)
         string = content.split(";base64,")[-1]
-        im_pil = drc.b64_to_pil(string)
+        store_image(b64_chunks(string), session_id)
+        if DEBUG:
+            print(new_filename, "added to the image storage.")
+
+        # Convert to pil
+        im_pil = drc.bytes_to_pil(image_storage.read(session_id))
 
         # Update the image signature, which is the first 200 b64 characters
         # of the string encoding
         storage["image_signature"] = string[:200]
 
-        # Posts the image string into the Bucketeer Storage (which is hosted
-        # on S3)
-        store_image_string(string, session_id)
-        if DEBUG:
-            print(new_filename, "added to Bucketeer S3.")
+        # Keep the decoded image as the checkpoint of the empty stack
+        image = TiledImage.from_pil(tile_store, im_pil)
+        key = checkpoints.keys(session_id, storage["image_signature"], [])[0]
+        checkpoints.put(key, image)
 
         # Resets the action stack
         storage["action_stack"] = []
@@ -516,8 +475,8 @@ def update_graph_interactive_image(
             }
             add_action_to_stack(storage["action_stack"], operation, type, selectedData)
 
-        # Apply the required actions to the picture, using memoized function
-        im_pil = apply_actions_on_image(
+        # Apply the required actions to the picture, from the checkpoints
+        image = apply_actions_on_image(
             session_id, storage["action_stack"], filename, image_signature
         )
 
@@ -528,7 +487,8 @@ def update_graph_interactive_image(
     return [
         drc.InteractiveImagePIL(
             image_id="interactive-image",
-            image=im_pil,
+            image=image.preview(),
+            size=image.size,
             enc_format=enc_format,
             dragmode=dragmode,
             verbose=DEBUG,
@@ -572,4 +532,8 @@ def reset_dropdown_enhance(_):
 
 # Running the server
 if __name__ == "__main__":
+    # Images of a previous run are only dropped when the app is run directly,
+    # the workers of a server import the app while others serve sessions
+    if LOCAL:
+        blob_storage.clear()
     app.run_server(debug=True)
@@ -71,6 +71,13 @@ def b64_to_pil(string):
     return im
 
 
+def bytes_to_pil(data):
+    buffer = _BytesIO(data)
+    im = Image.open(buffer)
+
+    return im
+
+
 def b64_to_numpy(string, to_scalar=True):
     im = b64_to_pil(string)
     np_array = np.asarray(im)
@@ -213,7 +220,13 @@ def NamedInlineRadioItems(name, short, options, val, **kwargs):
 
 # Custom Image Components
 def InteractiveImagePIL(
-    image_id, image, enc_format="png", dragmode="select", verbose=False, **kwargs
+    image_id,
+    image,
+    enc_format="png",
+    dragmode="select",
+    verbose=False,
+    size=None,
+    **kwargs,
 ):
     if enc_format == "jpeg":
         if image.mode == "RGBA":
@@ -224,7 +237,8 @@ def InteractiveImagePIL(
     else:
         encoded_image = pil_to_b64(image, enc_format=enc_format, verbose=verbose)
 
-    width, height = image.size
+    # Size of the image in the axes, larger than the image for a preview
+    width, height = size or image.size
 
     return dcc.Graph(
         id=image_id,
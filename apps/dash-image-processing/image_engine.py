@@ -0,0 +1,321 @@
+import hashlib
+import json
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Side of the square tiles images are split into, a multiple of every preview
+# downscale factor so that preview tiles line up with image tiles
+TILE_SIZE = 256
+# Margin read around a selection for operations that look at the neighbours of
+# a pixel, larger than the radius of the largest PIL filter kernel (5x5)
+HALO = 4
+# Largest side of the preview displayed in the graph
+PREVIEW_SIZE = 2048
+
+# Modes kept as they are, other images are converted to RGB(A)
+TILE_MODES = ["L", "RGB", "RGBA"]
+
+
+class TileStore:
+    """
+    Content-addressed store of image tiles.
+
+    A tile is a read-only NumPy array named after the hash of its content, so
+    checkpoints sharing pixels share the same arrays instead of copies. The
+    store only references tiles weakly: a tile is freed once no checkpoint
+    uses it anymore.
+    """
+
+    def __init__(self):
+        self._tiles = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(array):
+        digest = hashlib.sha1(str((array.shape, array.dtype.str)).encode())
+        digest.update(np.ascontiguousarray(array).data)
+        return digest.hexdigest()
+
+    def put(self, array):
+        """Return the key of a tile and the stored array with that content."""
+
+        key = self.key(array)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is None:
+                tile = np.array(array)
+                tile.flags.writeable = False
+                self._tiles[key] = tile
+        return key, tile
+
+    def __len__(self):
+        return len(self._tiles)
+
+
+def _clip(box, size):
+    left, upper, right, lower = box
+    width, height = size
+    return (
+        min(max(left, 0), width),
+        min(max(upper, 0), height),
+        min(max(right, 0), width),
+        min(max(lower, 0), height),
+    )
+
+
+def _is_empty(box):
+    return box[0] >= box[2] or box[1] >= box[3]
+
+
+class TiledImage:
+    """
+    Immutable image split into TILE_SIZE x TILE_SIZE tiles of a TileStore.
+
+    Editing a region returns a new TiledImage in which only the tiles that
+    intersect the region are new, all the others are shared with the image it
+    was derived from. Each image also keeps a downscaled preview, rebuilt tile
+    by tile for the tiles that changed.
+    """
+
+    def __init__(self, store, size, mode, keys, tiles, previews=None):
+        self.store = store
+        self.size = size
+        self.mode = mode
+        self.keys = keys  # grid of tile keys, one row of tiles per list
+        self.tiles = tiles  # grid of the read-only tile arrays
+        self._previews = previews or {}  # downscale factor -> grid of tiles
+        self._preview = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_array(cls, store, array, mode):
+        height, width = array.shape[:2]
+        keys, tiles = [], []
+        for y in range(0, height, TILE_SIZE):
+            row = [
+                store.put(array[y : y + TILE_SIZE, x : x + TILE_SIZE])
+                for x in range(0, width, TILE_SIZE)
+            ]
+            keys.append([key for key, _ in row])
+            tiles.append([tile for _, tile in row])
+        return cls(store, (width, height), mode, keys, tiles)
+
+    @classmethod
+    def from_pil(cls, store, image):
+        if image.mode not in TILE_MODES:
+            has_alpha = "A" in image.getbands() or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        return cls.from_array(store, np.asarray(image), image.mode)
+
+    def _tile_ranges(self, box):
+        # rows and columns of the tiles that intersect a box inside the image
+        left, upper, right, lower = box
+        rows = range(upper // TILE_SIZE, (lower - 1) // TILE_SIZE + 1)
+        cols = range(left // TILE_SIZE, (right - 1) // TILE_SIZE + 1)
+        return rows, cols
+
+    def array(self, box=None):
+        """Pixels of a box inside the image, a new array."""
+
+        box = (0, 0) + self.size if box is None else box
+        left, upper, right, lower = box
+        tile = self.tiles[0][0]
+        out = np.empty((lower - upper, right - left) + tile.shape[2:], tile.dtype)
+        if _is_empty(box):
+            return out
+        rows, cols = self._tile_ranges(box)
+        for i in rows:
+            for j in cols:
+                y0, x0 = i * TILE_SIZE, j * TILE_SIZE
+                tile = self.tiles[i][j]
+                top, bottom = max(upper, y0), min(lower, y0 + tile.shape[0])
+                start, end = max(left, x0), min(right, x0 + tile.shape[1])
+                out[top - upper : bottom - upper, start - left : end - left] = tile[
+                    top - y0 : bottom - y0, start - x0 : end - x0
+                ]
+        return out
+
+    def crop(self, box):
+        """
+        Region of the image as a PIL image, like PIL's Image.crop: pixels of
+        the box outside of the image are zeros.
+        """
+
+        clipped = _clip(box, self.size)
+        pixels = self.array(clipped)
+        if clipped != tuple(box):
+            left, upper, right, lower = box
+            padded = np.zeros(
+                (lower - upper, right - left) + pixels.shape[2:], pixels.dtype
+            )
+            x, y = clipped[0] - left, clipped[1] - upper
+            padded[y : y + pixels.shape[0], x : x + pixels.shape[1]] = pixels
+            pixels = padded
+        return Image.fromarray(pixels, self.mode)
+
+    def to_pil(self):
+        return Image.fromarray(self.array(), self.mode)
+
+    def paste(self, box, image):
+        """
+        New image with the pixels of a box inside the image replaced by the
+        ones of a PIL image of the size of the box.
+        """
+
+        if _is_empty(box):
+            return self
+        left, upper, right, lower = box
+        pixels = np.asarray(image.convert(self.mode))
+        keys = [list(row) for row in self.keys]
+        tiles = [list(row) for row in self.tiles]
+        previews = {
+            factor: [list(row) for row in grid]
+            for factor, grid in self._previews.items()
+        }
+
+        rows, cols = self._tile_ranges(box)
+        for i in rows:
+            for j in cols:
+                y0, x0 = i * TILE_SIZE, j * TILE_SIZE
+                tile = np.array(self.tiles[i][j])
+                top, bottom = max(upper, y0), min(lower, y0 + tile.shape[0])
+                start, end = max(left, x0), min(right, x0 + tile.shape[1])
+                tile[top - y0 : bottom - y0, start - x0 : end - x0] = pixels[
+                    top - upper : bottom - upper, start - left : end - left
+                ]
+                keys[i][j], tiles[i][j] = self.store.put(tile)
+                if keys[i][j] != self.keys[i][j]:
+                    for grid in previews.values():
+                        grid[i][j] = None
+
+        return TiledImage(self.store, self.size, self.mode, keys, tiles, previews)
+
+    def apply(self, box, operation, halo=0, mask=None):
+        """
+        New image with `operation`, a function of a PIL image returning an
+        image of the same size, applied to a box of the image.
+
+        Only the tiles that intersect the box are read and rewritten. With a
+        `halo`, the operation sees that many pixels around the box, clipped to
+        the image, and gives the same pixels as if applied to the whole image
+        when it only looks `halo` pixels away. Without it, the operation sees
+        the box alone, like on Image.crop(box). `mask` is a mode "L" image of
+        the size of the image, only its non zero pixels are changed.
+        """
+
+        target = _clip(box, self.size)
+        if _is_empty(target):
+            return self
+        if halo:
+            source = _clip(
+                (
+                    target[0] - halo,
+                    target[1] - halo,
+                    target[2] + halo,
+                    target[3] + halo,
+                ),
+                self.size,
+            )
+        else:
+            source = tuple(box)
+
+        result = operation(self.crop(source))
+        x, y = target[0] - source[0], target[1] - source[1]
+        result = result.crop(
+            (x, y, x + target[2] - target[0], y + target[3] - target[1])
+        )
+        if mask is not None:
+            region = self.crop(target)
+            region.paste(result, mask=mask.crop(target))
+            result = region
+        return self.paste(target, result)
+
+    def _preview_factor(self, max_size):
+        factor = 1
+        while max(self.size) > max_size * factor and factor < TILE_SIZE:
+            factor *= 2
+        return factor
+
+    def preview(self, max_size=PREVIEW_SIZE):
+        """
+        The image downscaled by a power of 2 to fit in `max_size`, the image
+        itself if it already fits. Preview tiles are only computed for tiles
+        that changed since the image this one was derived from.
+        """
+
+        with self._lock:
+            if self._preview is not None:
+                return self._preview
+
+            factor = self._preview_factor(max_size)
+            if factor == 1:
+                self._preview = self.to_pil()
+                return self._preview
+
+            grid = self._previews.setdefault(
+                factor, [[None] * len(row) for row in self.tiles]
+            )
+            for i, row in enumerate(self.tiles):
+                for j, tile in enumerate(row):
+                    if grid[i][j] is None:
+                        height, width = tile.shape[:2]
+                        size = (-(-width // factor), -(-height // factor))
+                        grid[i][j] = np.asarray(
+                            Image.fromarray(tile, self.mode).resize(size, Image.BOX)
+                        )
+            pixels = np.concatenate(
+                [np.concatenate(row, axis=1) for row in grid], axis=0
+            )
+            self._preview = Image.fromarray(pixels, self.mode)
+            return self._preview
+
+
+class CheckpointCache:
+    """
+    LRU cache of the images of sessions after each prefix of their action
+    stack. A checkpoint is named after its session, the original image and
+    the actions applied to it, so undoing an action is a lookup.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def keys(session_id, image_signature, action_stack):
+        """Keys of the checkpoints of every prefix of a stack, shortest first."""
+
+        digest = hashlib.sha1(json.dumps([session_id, image_signature]).encode())
+        keys = [digest.hexdigest()]
+        for action in action_stack:
+            digest.update(json.dumps(action, sort_keys=True).encode())
+            keys.append(digest.hexdigest())
+        return keys
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            self._images[key] = image
+            self._images.move_to_end(key)
+            if len(self._images) > self.max_size:
+                self._images.popitem(last=False)
+
+    def latest(self, keys):
+        """Index in `keys` of the last cached checkpoint and its image."""
+
+        for i in range(len(keys) - 1, -1, -1):
+            image = self.get(keys[i])
+            if image is not None:
+                return i, image
+        return -1, None
@@ -0,0 +1,182 @@
+import base64
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import requests
+
+# Size of the chunks blobs are written in
+CHUNK_SIZE = 1 << 20
+
+
+def b64_chunks(string, chunk_size=CHUNK_SIZE):
+    """
+    Decodes a base64 string chunk by chunk, without a decoded copy of the
+    whole string.
+    :param string: The base64 string
+    :param chunk_size: The size of the decoded chunks, rounded to a multiple of 3
+    :return: A generator of the decoded chunks
+    """
+    step = max(chunk_size // 3, 1) * 4
+    for start in range(0, len(string), step):
+        yield base64.b64decode(string[start : start + step])
+
+
+class BlobStorage:
+    """
+    Storage of the raw bytes of the images of the sessions, by key.
+
+    Backends implement `write`, which stores the chunks of an iterable as the
+    blob of a key, replacing any previous one, and `read`, which returns the
+    bytes of a key, or None if there are none.
+    """
+
+    def write(self, key, chunks):
+        raise NotImplementedError
+
+    def read(self, key):
+        raise NotImplementedError
+
+    def put(self, key, data):
+        self.write(
+            key, [data[i : i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+        )
+
+
+class SQLiteStorage(BlobStorage):
+    """
+    Blobs stored as chunks in a local SQLite database, which can be shared by
+    the workers of the app. A blob is replaced in a single transaction, so
+    readers never see a partially written one.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "key TEXT, position INTEGER, data BLOB, PRIMARY KEY (key, position))"
+            )
+
+    def _connect(self):
+        # SQLite connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def write(self, key, chunks):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM chunks WHERE key = ?", (key,))
+            connection.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?)",
+                ((key, i, chunk) for i, chunk in enumerate(chunks)),
+            )
+
+    def clear(self):
+        """Removes the blobs of all the keys."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM chunks")
+
+    def read(self, key):
+        rows = (
+            self._connect()
+            .execute("SELECT data FROM chunks WHERE key = ? ORDER BY position", (key,))
+            .fetchall()
+        )
+        if not rows:
+            return None
+        return b"".join(data for data, in rows)
+
+
+class S3Storage(BlobStorage):
+    """
+    Blobs stored in an S3 compatible bucket through presigned URLs.
+    """
+
+    def __init__(self, client, bucket_name):
+        self.client = client
+        self.bucket_name = bucket_name
+
+    def write(self, key, chunks):
+        # The whole blob is joined in memory, the presigned POST takes a file
+        # Generate the POST attributes
+        post = self.client.generate_presigned_post(Bucket=self.bucket_name, Key=key)
+
+        files = {"file": b"".join(chunks)}
+        # Post the file using requests
+        requests.post(post["url"], data=post["fields"], files=files)
+
+    def read(self, key):
+        url = self.client.generate_presigned_url(
+            ClientMethod="get_object", Params={"Bucket": self.bucket_name, "Key": key}
+        )
+
+        # A key replacement is required for URL pre-sign in gcp
+        url = url.replace("AWSAccessKeyId", "GoogleAccessId")
+
+        response = requests.get(url)
+        if response.status_code != 200:
+            return None
+        return response.content
+
+
+class CachedStorage(BlobStorage):
+    """
+    Storage with an LRU cache of the last blobs written or read, holding at
+    most `max_bytes` bytes, in front of another storage.
+    """
+
+    def __init__(self, storage, max_bytes=256 << 20):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._blobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Caches the blob of a key, or only drops the previous one if it is None
+    def _cache(self, key, data):
+        with self._lock:
+            if key in self._blobs:
+                self.size -= len(self._blobs.pop(key))
+            if data is None or len(data) > self.max_bytes:
+                return
+            self._blobs[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._blobs.popitem(last=False)
+                self.size -= len(evicted)
+
+    def write(self, key, chunks):
+        # the chunks are consumed once, by the storage, and kept for the cache
+        # until the blob is too large to be cached
+        kept = []
+        size = 0
+
+        def consume():
+            nonlocal kept, size
+            for chunk in chunks:
+                size += len(chunk)
+                if kept is not None:
+                    kept.append(chunk)
+                    if size > self.max_bytes:
+                        kept = None
+                yield chunk
+
+        self.storage.write(key, consume())
+        self._cache(key, None if kept is None else b"".join(kept))
+
+    def read(self, key):
+        with self._lock:
+            data = self._blobs.get(key)
+            if data is not None:
+                self._blobs.move_to_end(key)
+                return data
+
+        data = self.storage.read(key)
+        if data is not None:
+            self._cache(key, data)
+        return data
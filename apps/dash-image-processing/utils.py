@@ -4,9 +4,8 @@ import json
 
 import dash_core_components as dcc
 import plotly.graph_objs as go
-import dash_reusable_components as drc
 
-from PIL import Image, ImageFilter, ImageDraw, ImageEnhance
+from PIL import Image, ImageFilter, ImageDraw, ImageEnhance, ImageStat
 
 #
 APP_PATH = str(pathlib.Path(__file__).parent.resolve())
@@ -16,10 +15,9 @@ STORAGE_PLACEHOLDER = json.dumps(
     {"filename": None, "image_signature": None, "action_stack": []}
 )
 
-IMAGE_STRING_PLACEHOLDER = drc.pil_to_b64(
-    Image.open(os.path.join(APP_PATH, os.path.join("images", "default.jpg"))).copy(),
-    enc_format="jpeg",
-)
+# Bytes of the default image, shown until an image is uploaded
+with open(os.path.join(APP_PATH, os.path.join("images", "default.jpg")), "rb") as f:
+    IMAGE_PLACEHOLDER = f.read()
 
 GRAPH_PLACEHOLDER = dcc.Graph(
     id="interactive-image",
@@ -104,31 +102,30 @@ def generate_lasso_mask(image, selectedData):
     return mask
 
 
-def apply_filters(image, zone, filter, mode):
-    filter_selected = FILTERS_DICT[filter]
-
-    if mode == "select":
-        crop = image.crop(zone)
-        crop_mod = crop.filter(filter_selected)
-        image.paste(crop_mod, zone)
+def filter_image(image, filter):
+    return image.filter(FILTERS_DICT[filter])
 
-    elif mode == "lasso":
-        im_filtered = image.filter(filter_selected)
-        image.paste(im_filtered, mask=zone)
 
+def gray_mean(image):
+    # Mean used by the contrast enhancement, see ImageEnhance.Contrast
+    return int(ImageStat.Stat(image.convert("L")).mean[0] + 0.5)
 
-def apply_enhancements(image, zone, enhancement, enhancement_factor, mode):
-    enhancement_selected = ENHANCEMENT_DICT[enhancement]
-    enhancer = enhancement_selected(image)
 
-    im_enhanced = enhancer.enhance(enhancement_factor)
+def enhance_image(image, enhancement, enhancement_factor, mean=None):
+    """
+    Applies an enhancement to an image, which can be a part of a larger image
+    :param mean: The gray_mean of the whole image, the contrast is changed
+    relative to it when given rather than to the mean of the part
+    :return: The enhanced image
+    """
+    enhancer = ENHANCEMENT_DICT[enhancement](image)
 
-    if mode == "select":
-        crop = im_enhanced.crop(zone)
-        image.paste(crop, box=zone)
+    if enhancement == "contrast" and mean is not None:
+        enhancer.degenerate = Image.new("L", image.size, mean).convert(image.mode)
+        if "A" in image.getbands():
+            enhancer.degenerate.putalpha(image.getchannel("A"))
 
-    elif mode == "lasso":
-        image.paste(im_enhanced, mask=zone)
+    return enhancer.enhance(enhancement_factor)
 
 
 def show_histogram(image):
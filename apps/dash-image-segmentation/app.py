@@ -11,17 +11,15 @@ from shapes_to_segmentations import (
     blend_image_and_classified_regions_pil,
 )
 from skimage import io as skio
-from trainable_segmentation import multiscale_basic_features
+from feature_cache import FeatureCache, image_key
 import io
 import base64
 import PIL.Image
 import pickle
 from time import time
-from joblib import Memory
 
-memory = Memory("./joblib_cache", bytes_limit=3000000000, verbose=3)
-
-compute_features = memory.cache(multiscale_basic_features)
+# feature stacks of the images, memory-mapped from ./feature_cache
+feature_cache = FeatureCache("./feature_cache", bytes_limit=3000000000)
 
 DEFAULT_STROKE_WIDTH = 3  # gives line width of 2^3 = 8
 
@@ -51,6 +49,7 @@ def color_to_class(c):
 
 
 img = skio.imread(DEFAULT_IMAGE_PATH)
+img_key = image_key(img)
 features_dict = {}
 
 external_stylesheets = [dbc.themes.BOOTSTRAP, "assets/segmentation-style.css"]
@@ -448,7 +447,9 @@ def save_img_classifier(clf, label_to_colors_args, segmenter_args):
     }
 
 
-def show_segmentation(image_path, mask_shapes, features, segmenter_args):
+def show_segmentation(
+    image_path, mask_shapes, features, segmenter_args, features_key=None
+):
     """ adds an image showing segmentations to a figure's layout """
     # add 1 because classifier takes 0 to mean no mask
     shape_layers = [color_to_class(shape["line"]["color"]) + 1 for shape in mask_shapes]
@@ -462,6 +463,7 @@ def show_segmentation(image_path, mask_shapes, features, segmenter_args):
         shape_layers=shape_layers,
         label_to_colors_args=label_to_colors_args,
         features=features,
+        features_key=features_key,
     )
     # get the classifier that we can later store in the Store
     classifier = save_img_classifier(clf, label_to_colors_args, segmenter_args)
@@ -517,13 +519,14 @@ def annotation_react(
         }
         for feat in segmentation_features_value:
             segmentation_features_dict[feat] = True
-        t1 = time()
-        features = compute_features(
-            img,
-            **segmentation_features_dict,
+        feature_params = dict(
+            segmentation_features_dict,
             sigma_min=sigma_range_slider_value[0],
             sigma_max=sigma_range_slider_value[1],
         )
+        t1 = time()
+        features = feature_cache.get(img, img_key, **feature_params)
+        features_key = feature_cache.key(img_key, **feature_params)
         t2 = time()
         print(t2 - t1)
     if cbcontext == "graph.relayoutData":
@@ -556,7 +559,11 @@ def annotation_react(
             feature_opts["sigma_min"] = sigma_range_slider_value[0]
             feature_opts["sigma_max"] = sigma_range_slider_value[1]
             segimgpng, clf = show_segmentation(
-                DEFAULT_IMAGE_PATH, masks_data["shapes"], features, feature_opts
+                DEFAULT_IMAGE_PATH,
+                masks_data["shapes"],
+                features,
+                feature_opts,
+                features_key=features_key,
             )
             if cbcontext == "download-button.n_clicks":
                 classifier_store_data = clf
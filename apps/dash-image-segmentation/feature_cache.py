@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from trainable_segmentation import multiscale_basic_features
+
+
+def image_key(img):
+    """ Returns a digest of the pixels of an image """
+    digest = hashlib.sha1(str((img.shape, img.dtype.str)).encode())
+    digest.update(np.ascontiguousarray(img).data)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    Feature stacks of images, cached on disk as float32 .npy files that are
+    memory-mapped when used.
+
+    Stacks are keyed by image, feature set and sigma range, and have the shape
+    ``(n_features,) + image.shape[:2]`` of multiscale_basic_features. The least
+    recently used files are removed when the files take more than
+    ``bytes_limit`` bytes.
+
+    Threads missing on the same key wait for a single computation, and files
+    are written under a unique temporary name, then renamed, so a stack is
+    never read while it is written.
+    """
+
+    def __init__(self, directory, bytes_limit=3000000000, max_open=8):
+        self.directory = directory
+        self.bytes_limit = bytes_limit
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+        # computation locks, a key uses the one of its hash
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, img_key, intensity=True, edges=True, texture=True, **sigmas):
+        params = dict(intensity=intensity, edges=edges, texture=texture, **sigmas)
+        return hashlib.sha1(
+            json.dumps([img_key, params], sort_keys=True).encode()
+        ).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def _compute(self, img, path, **params):
+        features = multiscale_basic_features(img, **params)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, features)
+            # mapped before the rename, the stack stays readable if the file
+            # is pruned right after
+            stack = np.load(tmp_path, mmap_mode="r")
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._prune()
+        return stack
+
+    def _load(self, path):
+        # Returns the mapped stack of a file, None if there is none. A file
+        # pruned after it is mapped stays readable through the map.
+        try:
+            # the modification time orders the files for pruning
+            os.utime(path)
+            return np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            return None
+
+    def _prune(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # pruned by another process
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        size = sum(file_size for _, file_size, _ in files)
+        # The newest file is kept even if it is larger than the limit
+        for _, file_size, path in files[:-1]:
+            if size <= self.bytes_limit:
+                break
+            size -= file_size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, img, img_key=None, **params):
+        """
+        Returns the read-only feature stack of an image for the parameters of
+        multiscale_basic_features, computing it on a miss. ``img_key`` is
+        the image_key of img, computed if not given.
+        """
+        if img_key is None:
+            img_key = image_key(img)
+        key = self.key(img_key, **params)
+        with self._lock:
+            if key in self._open:
+                self._open.move_to_end(key)
+                return self._open[key]
+
+        with self._key_locks[hash(key) % len(self._key_locks)]:
+            with self._lock:
+                # computed by a thread this one waited for
+                if key in self._open:
+                    self._open.move_to_end(key)
+                    return self._open[key]
+
+            path = self._path(key)
+            stack = self._load(path)
+            if stack is None:
+                stack = self._compute(img, path, **params)
+
+        with self._lock:
+            self._open[key] = stack
+            if len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return stack
@@ -1,3 +1,8 @@
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
 import PIL.Image
 import numpy as np
 import skimage
@@ -5,7 +10,7 @@ import skimage.util
 import skimage.io
 import skimage.color
 import shape_utils
-from trainable_segmentation import fit_segmenter
+from trainable_segmentation import TrainingSet, predict_segmenter_blocks
 import plotly.express as px
 from sklearn.ensemble import RandomForestClassifier
 from time import time
@@ -61,32 +66,73 @@ def grey_labels(img):
     return img
 
 
+@lru_cache(maxsize=1024)
+def _shape_pixels(shape_key, width, height):
+    # flat indices of the pixels covered by a shape, rendered once per shape
+    shape_args = [{"width": width, "height": height, "shape": json.loads(shape_key)}]
+    return np.flatnonzero(shape_utils.shapes_to_mask(shape_args, 1))
+
+
+def shapes_to_labels(shapes, shape_layers, shape):
+    """
+    Returns the same mask as shape_utils.shapes_to_mask for an image of shape
+    `shape`, only rendering the shapes that were not rendered before.
+    """
+    height, width = shape
+    labels = np.zeros(height * width, dtype=np.uint8)
+    for s, layer in zip(shapes, shape_layers):
+        labels[_shape_pixels(json.dumps(s, sort_keys=True), width, height)] = layer
+    return labels.reshape(shape)
+
+
+# training sets of the last feature stacks used, by key
+_training_sets = OrderedDict()
+_training_sets_lock = threading.Lock()
+
+
+def _training_set(features_key, features, max_size=8):
+    with _training_sets_lock:
+        if features_key not in _training_sets:
+            _training_sets[features_key] = TrainingSet(features)
+            if len(_training_sets) > max_size:
+                _training_sets.popitem(last=False)
+        _training_sets.move_to_end(features_key)
+        return _training_sets[features_key]
+
+
 def compute_segmentations(
     shapes,
     img_path="assets/segmentation_img.jpg",
     features=None,
     shape_layers=None,
     label_to_colors_args={},
+    features_key=None,
 ):
-
-    # load original image
-    img = img_to_ubyte_array(img_path)
+    """
+    features is the feature stack of the image, of shape
+    (n_features,) + image.shape[:2], see FeatureCache. If features_key is
+    given, the features of the labelled pixels are gathered once and reused
+    by the next calls with the same key.
+    """
 
     # convert shapes to mask
-    shape_args = [
-        {"width": img.shape[1], "height": img.shape[0], "shape": shape}
-        for shape in shapes
-    ]
     if (shape_layers is None) or (len(shape_layers) != len(shapes)):
         shape_layers = [(n + 1) for n, _ in enumerate(shapes)]
-    mask = shape_utils.shapes_to_mask(shape_args, shape_layers)
+    mask = shapes_to_labels(shapes, shape_layers, features.shape[1:])
 
     # do segmentation and return this
     t1 = time()
+    if features_key is None:
+        training_set = TrainingSet(features)
+    else:
+        training_set = _training_set(features_key, features)
+    training_data, training_labels = training_set.samples(mask)
     clf = RandomForestClassifier(
         n_estimators=50, n_jobs=-1, max_depth=8, max_samples=0.05
     )
-    seg, clf = fit_segmenter(mask, features, clf)
+    clf.fit(training_data, training_labels)
+    seg = predict_segmenter_blocks(features, clf)
+    seg[mask > 0] = mask[mask > 0]
     t2 = time()
     print(t2 - t1)
     color_seg = label_to_colors(seg, **label_to_colors_args)
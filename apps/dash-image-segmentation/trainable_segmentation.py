@@ -1,5 +1,6 @@
 from itertools import combinations_with_replacement
 import itertools
+import threading
 import numpy as np
 from skimage import filters, feature
 from skimage import img_as_float32
@@ -204,3 +205,108 @@ def predict_segmenter(features, clf):
         )
     output = predicted_labels.reshape(sh[1:])
     return output
+
+
+class TrainingSet:
+    """
+    Training samples of a feature stack, gathered once per labelled pixel.
+
+    Each call of ``samples`` only reads from the stack the features of the
+    pixels that were not labelled in a previous call, and appends them to the
+    samples already gathered.
+
+    Parameters
+    ----------
+    features : ndarray
+        Array of features, with the first dimension corresponding to the number
+        of features, and the other dimensions to the shape of the image, for
+        example a memory-mapped stack of a FeatureCache.
+    """
+
+    def __init__(self, features):
+        self.features = features.reshape((features.shape[0], -1))
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.rows = np.zeros((0, self.features.shape[0]), dtype=np.float32)
+        self.lock = threading.Lock()
+
+    def samples(self, labels):
+        """
+        Returns the features and labels of the labelled pixels.
+
+        Parameters
+        ----------
+        labels : ndarray of ints
+            Image of labels, 0 for unlabelled pixels.
+
+        Returns
+        -------
+        training_data : ndarray
+            Array of shape ``(n_labelled, n_features)``, the same as
+            ``features[:, labels > 0].T``.
+        training_labels : ndarray
+            Array of shape ``(n_labelled,)``.
+        """
+        labels = labels.ravel()
+        indices = np.flatnonzero(labels)
+        with self.lock:
+            new = indices[~np.isin(indices, self.indices, assume_unique=True)]
+            if len(new):
+                rows = np.concatenate([self.rows, self.features[:, new].T])
+                all_indices = np.concatenate([self.indices, new])
+                order = np.argsort(all_indices, kind="mergesort")
+                self.indices, self.rows = all_indices[order], rows[order]
+            positions = np.searchsorted(self.indices, indices)
+            return self.rows[positions], labels[indices]
+
+
+def predict_segmenter_blocks(features, clf, block_size=1 << 16, n_jobs=-1):
+    """
+    Segmentation of images using a pretrained classifier, predicted by blocks
+    of rows of the image in parallel. Gives the same output as
+    :func:`predict_segmenter` without a transposed copy of all the features.
+
+    Parameters
+    ----------
+    features : ndarray
+        Array of features, with the first dimension corresponding to the number
+        of features, and the other dimensions to the shape of the image, for
+        example a memory-mapped stack of a FeatureCache.
+    clf : classifier object
+        trained classifier object, exposing a ``predict`` method as in
+        scikit-learn's API.
+    block_size : int, optional
+        Approximate number of pixels of a block.
+    n_jobs : int, optional
+        Number of blocks predicted at the same time, -1 for all the CPUs.
+
+    Returns
+    -------
+    output : ndarray
+        Labeled array, built from the prediction of the classifier.
+    """
+    n_features, height = features.shape[:2]
+    rows = max(block_size // int(np.prod(features.shape[2:])), 1)
+
+    def predict_block(start):
+        block = features[:, start : start + rows]
+        # a view, samples along the first axis
+        data = block.reshape((n_features, -1)).T
+        return clf.predict(data).reshape(block.shape[1:])
+
+    # blocks are the unit of parallelism, not the trees of a forest
+    clf_n_jobs = getattr(clf, "n_jobs", None)
+    if clf_n_jobs is not None:
+        clf.n_jobs = 1
+    try:
+        blocks = Parallel(n_jobs=n_jobs, prefer="threads")(
+            delayed(predict_block)(start) for start in range(0, height, rows)
+        )
+    except NotFittedError:
+        raise NotFittedError(
+            "You must train the classifier `clf` first"
+            "for example with the `fit_segmenter` function."
+        )
+    finally:
+        if clf_n_jobs is not None:
+            clf.n_jobs = clf_n_jobs
+    return np.concatenate(blocks)
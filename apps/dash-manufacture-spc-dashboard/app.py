@@ -9,8 +9,12 @@ import dash_table
 import plotly.graph_objs as go
 import dash_daq as daq
 
+import numpy as np
 import pandas as pd
 
+from rules import violated_rules
+from spc import SPCEngine
+
 app = dash.Dash(
     __name__,
     meta_tags=[{"name": "viewport", "content": "width=device-width, initial-scale=1"}],
@@ -113,7 +117,6 @@ def init_df():
                     "lsl": round(lsl, 3),
                     "min": stats["min"].tolist(),
                     "max": stats["max"].tolist(),
-                    "ooc": populate_ooc(data, ucl, lcl),
                 }
             }
         )
@@ -121,25 +124,31 @@ def init_df():
     return ret
 
 
-def populate_ooc(data, ucl, lcl):
-    ooc_count = 0
-    ret = []
-    for i in range(len(data)):
-        if data[i] >= ucl or data[i] <= lcl:
-            ooc_count += 1
-            ret.append(ooc_count / (i + 1))
-        else:
-            ret.append(ooc_count / (i + 1))
-    return ret
+state_dict = init_df()
 
+# Streaming SPC of the parameters, fed with batches as the interval reaches them
+spc = SPCEngine(
+    params[1:],
+    ucl=[state_dict[param]["ucl"] for param in params[1:]],
+    lcl=[state_dict[param]["lcl"] for param in params[1:]],
+    capacity=max_length,
+)
+batch_values = df["Batch"].values
+param_values = df[params[1:]].values
 
-state_dict = init_df()
+
+def stream_batches(interval):
+    stop = min(interval, max_length)
+    start = min(spc.n, stop)
+    spc.extend(batch_values[start:stop], param_values[start:stop], start=start)
 
 
 def init_value_setter_store():
-    # Initialize store data
-    state_dict = init_df()
-    return state_dict
+    # Initialize store data, only the specs: the data and OOC stay on the server
+    return {
+        param: {spec: state_dict[param][spec] for spec in ["usl", "lsl", "ucl", "lcl"]}
+        for param in params[1:]
+    }
 
 
 def build_tab_1():
@@ -580,16 +589,12 @@ def build_chart_panel():
 
 def generate_graph(interval, specs_dict, col):
     stats = state_dict[col]
-    col_data = stats["data"]
     mean = stats["mean"]
     ucl = specs_dict[col]["ucl"]
     lcl = specs_dict[col]["lcl"]
     usl = specs_dict[col]["usl"]
     lsl = specs_dict[col]["lsl"]
 
-    x_array = state_dict["Batch"]["data"].tolist()
-    y_array = col_data.tolist()
-
     total_count = 0
 
     if interval > max_length:
@@ -597,22 +602,37 @@ def generate_graph(interval, specs_dict, col):
     elif interval > 0:
         total_count = interval
 
+    stream_batches(total_count)
+    x_array = spc.batches[:total_count]
+    y_array = spc.values(col, total_count)
+    ooc_index = spc.ooc_indices(col, total_count, ucl, lcl)
+    violations = spc.rule_violations(col, total_count, ucl, lcl)
+    # points beyond the control limits are already in the OOC trace
+    rule_index = np.flatnonzero(violations >> 1)
+
     ooc_trace = {
-        "x": [],
-        "y": [],
+        "x": ooc_index + 1,
+        "y": y_array[ooc_index],
         "name": "Out of Control",
         "mode": "markers",
         "marker": dict(color="rgba(210, 77, 87, 0.7)", symbol="square", size=11),
     }
 
-    for index, data in enumerate(y_array[:total_count]):
-        if data >= ucl or data <= lcl:
-            ooc_trace["x"].append(index + 1)
-            ooc_trace["y"].append(data)
+    rule_trace = {
+        "x": rule_index + 1,
+        "y": y_array[rule_index],
+        "text": [
+            "Rules " + ", ".join(str(rule.number) for rule in violated_rules(v))
+            for v in violations[rule_index]
+        ],
+        "name": "Run Rule Violation",
+        "mode": "markers",
+        "marker": dict(color="rgba(244, 212, 77, 0.7)", symbol="diamond", size=9),
+    }
 
     histo_trace = {
-        "x": x_array[:total_count],
-        "y": y_array[:total_count],
+        "x": x_array,
+        "y": y_array,
         "type": "histogram",
         "orientation": "h",
         "name": "Distribution",
@@ -624,13 +644,14 @@ def generate_graph(interval, specs_dict, col):
     fig = {
         "data": [
             {
-                "x": x_array[:total_count],
-                "y": y_array[:total_count],
+                "x": x_array,
+                "y": y_array,
                 "mode": "lines+markers",
                 "name": col,
                 "line": {"color": "#f4d44d"},
             },
             ooc_trace,
+            rule_trace,
             histo_trace,
         ]
     }
@@ -780,9 +801,6 @@ def generate_graph(interval, specs_dict, col):
 
 
 def update_sparkline(interval, param):
-    x_array = state_dict["Batch"]["data"].tolist()
-    y_array = state_dict[param]["data"].tolist()
-
     if interval == 0:
         x_new = y_new = None
 
@@ -791,8 +809,9 @@ def update_sparkline(interval, param):
             total_count = max_length
         else:
             total_count = interval
-        x_new = x_array[:total_count][-1]
-        y_new = y_array[:total_count][-1]
+        stream_batches(total_count)
+        x_new = spc.batches[total_count - 1].item()
+        y_new = spc.values(param, total_count)[-1].item()
 
     return dict(x=[[x_new]], y=[[y_new]]), [0]
 
@@ -808,7 +827,11 @@ def update_count(interval, col, data):
         else:
             total_count = interval - 1
 
-        ooc_percentage_f = data[col]["ooc"][total_count] * 100
+        stream_batches(total_count + 1)
+        ooc_percentage_f = (
+            spc.ooc_ratio(col, total_count + 1, data[col]["ucl"], data[col]["lcl"])
+            * 100
+        )
         ooc_percentage_str = "%.2f" % ooc_percentage_f + "%"
 
         # Set maximum ooc to 15 for better grad bar display
@@ -820,10 +843,14 @@ def update_count(interval, col, data):
         else:
             ooc_grad_val = float(ooc_percentage_f)
 
-        # Set indicator theme according to threshold 5%
-        if 0 <= ooc_grad_val <= 5:
+        # Set indicator theme according to threshold 5%, warn if the latest
+        # point breaks a run rule
+        latest_violations = spc.rule_violations(
+            col, total_count + 1, data[col]["ucl"], data[col]["lcl"], total_count
+        )
+        if 0 <= ooc_grad_val <= 5 and not latest_violations.any():
             color = "#92e0d3"
-        elif 5 < ooc_grad_val < 7:
+        elif 0 <= ooc_grad_val < 7:
             color = "#f4d44d"
         else:
             color = "#FF0000"
@@ -1014,9 +1041,6 @@ def set_value_setter_store(set_btn, param, data, usl, lsl, ucl, lcl):
         data[param]["lsl"] = lsl
         data[param]["ucl"] = ucl
         data[param]["lcl"] = lcl
-
-        # Recalculate ooc in case of param updates
-        data[param]["ooc"] = populate_ooc(df[param], ucl, lcl)
         return data
 
 
@@ -1165,10 +1189,14 @@ def update_piechart(interval, stored_data):
     else:
         total_count = interval - 1
 
+    stream_batches(total_count + 1)
     values = []
     colors = []
     for param in params[1:]:
-        ooc_param = (stored_data[param]["ooc"][total_count] * 100) + 1
+        specs = stored_data[param]
+        ooc_param = (
+            spc.ooc_ratio(param, total_count + 1, specs["ucl"], specs["lcl"]) * 100
+        ) + 1
         values.append(ooc_param)
         if ooc_param > 6:
             colors.append("#f45060")
@@ -0,0 +1,93 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+# Western Electric / Nelson run rules. Zones are measured in sigmas from the
+# center line, sigma being a third of the distance from the center line to the
+# control limits. A point violating a rule has bit `number - 1` set.
+Rule = namedtuple("Rule", ["number", "description"])
+
+RULES = [
+    Rule(1, "1 point beyond the control limits"),
+    Rule(2, "2 of 3 points beyond 2 sigma on one side"),
+    Rule(3, "4 of 5 points beyond 1 sigma on one side"),
+    Rule(4, "8 points in a row on one side of the center line"),
+    Rule(5, "6 points in a row increasing or decreasing"),
+    Rule(6, "14 points in a row alternating up and down"),
+    Rule(7, "15 points in a row within 1 sigma"),
+    Rule(8, "8 points in a row beyond 1 sigma on both sides"),
+]
+
+# Number of points the rules look at, the point evaluated included
+WINDOW = 15
+
+
+def _window_counts(flags, width):
+    # number of flagged points among the `width` points ending at each point,
+    # 0 until there are `width` points
+    cumsum = np.zeros((len(flags) + 1,) + flags.shape[1:], dtype=np.int32)
+    np.cumsum(flags, axis=0, out=cumsum[1:])
+    counts = np.zeros(flags.shape, dtype=np.int32)
+    if len(flags) >= width:
+        counts[width - 1 :] = cumsum[width:] - cumsum[:-width]
+    return counts
+
+
+# Returns the bits of the rules violated by each point of `values`, a
+# (point, series) array or one series, given control limits of each series.
+# A point is only checked against the rules whose window of points is complete.
+def evaluate(values, ucl, lcl):
+    values = np.asarray(values, dtype=float)
+    squeeze = values.ndim == 1
+    if squeeze:
+        values = values[:, None]
+    ucl = np.asarray(ucl, dtype=float)
+    lcl = np.asarray(lcl, dtype=float)
+    center = (ucl + lcl) / 2
+    sigma = (ucl - lcl) / 6
+    z = (values - center) / sigma
+
+    above = [z > k for k in range(3)]
+    below = [z < -k for k in range(3)]
+    within_1 = ~(above[1] | below[1])
+
+    violations = np.zeros(values.shape, dtype=np.uint8)
+    violations |= ((values >= ucl) | (values <= lcl)).astype(np.uint8)
+
+    def set_rule(number, flags):
+        violations[...] |= flags.astype(np.uint8) << (number - 1)
+
+    def on_one_side(n, width, k):
+        # at least n of `width` points beyond k sigma on the same side
+        return (_window_counts(above[k], width) >= n) | (
+            _window_counts(below[k], width) >= n
+        )
+
+    set_rule(2, on_one_side(2, 3, 2))
+    set_rule(3, on_one_side(4, 5, 1))
+    set_rule(4, on_one_side(8, 8, 0))
+    set_rule(7, _window_counts(within_1, 15) == 15)
+    set_rule(
+        8,
+        (_window_counts(~within_1, 8) == 8)
+        & (_window_counts(above[1], 8) > 0)
+        & (_window_counts(below[1], 8) > 0),
+    )
+
+    if len(values) > 2:
+        # point i + 1 ends the i-th step
+        steps = np.sign(np.diff(values, axis=0))
+        rising = _window_counts(steps > 0, 5) == 5
+        falling = _window_counts(steps < 0, 5) == 5
+        set_rule(5, np.concatenate([np.zeros_like(rising[:1]), rising | falling]))
+        # point i + 2 ends the i-th change of direction
+        alternating = _window_counts(steps[1:] * steps[:-1] < 0, 12) == 12
+        set_rule(6, np.concatenate([np.zeros_like(rising[:2]), alternating]))
+
+    return violations[:, 0] if squeeze else violations
+
+
+# Returns the rules violated according to `violations` bits
+def violated_rules(violations):
+    return [rule for rule in RULES if int(violations) >> (rule.number - 1) & 1]
@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import rules
+
+
+# Streaming statistical process control of many parameters.
+#
+# Batches are ingested one row (one value per parameter) at a time, or several
+# rows at once when catching up. Each ingest updates, for all parameters at
+# once, the count, the cumulative number of out of control (OOC) points and the
+# run rules violated by the new points, all kept in preallocated buffers that
+# double in size when full. Reading the OOC ratio or rule violations of the
+# first k batches is then a buffer lookup. The control limits are fixed when
+# the engine is made, like the ones init_df computes over the whole dataset.
+class SPCEngine:
+    def __init__(self, params, ucl, lcl, capacity=1024, cache_size=64):
+        self.params = list(params)
+        self.index = {param: j for j, param in enumerate(self.params)}
+        self.ucl = np.asarray(ucl, dtype=float)
+        self.lcl = np.asarray(lcl, dtype=float)
+        self.n = 0
+
+        n_params = len(self.params)
+        self.batches = np.zeros(capacity, dtype=np.int64)
+        self.data = np.zeros((capacity, n_params))
+        self.ooc = np.zeros((capacity, n_params), dtype=bool)
+        # number of OOC points among the first i + 1 batches
+        self.ooc_counts = np.zeros((capacity, n_params), dtype=np.int64)
+        # bits of the run rules violated by each point, see rules.py
+        self.violations = np.zeros((capacity, n_params), dtype=np.uint8)
+
+        # cumulative OOC counts for limits other than ucl and lcl
+        self._cache_size = cache_size
+        self._custom_counts = OrderedDict()
+        self.lock = threading.RLock()
+
+    def _grow(self, size):
+        capacity = len(self.batches)
+        while capacity < size:
+            capacity *= 2
+        if capacity == len(self.batches):
+            return
+        for name in ["batches", "data", "ooc", "ooc_counts", "violations"]:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self.n] = old[: self.n]
+            setattr(self, name, new)
+
+    # Adds rows of values of all parameters. `start` is the position of the
+    # first row in the stream, rows that were already ingested are skipped.
+    def extend(self, batches, rows, start=None):
+        batches = np.asarray(batches, dtype=np.int64).reshape(-1)
+        rows = np.asarray(rows, dtype=float).reshape(len(batches), len(self.params))
+
+        with self.lock:
+            if start is not None:
+                skip = max(self.n - start, 0)
+                batches, rows = batches[skip:], rows[skip:]
+            k = len(rows)
+            if not k:
+                return
+            self._grow(self.n + k)
+            i0, i1 = self.n, self.n + k
+
+            self.batches[i0:i1] = batches
+            self.data[i0:i1] = rows
+            ooc = (rows >= self.ucl) | (rows <= self.lcl)
+            self.ooc[i0:i1] = ooc
+            previous = self.ooc_counts[i0 - 1] if i0 else 0
+            self.ooc_counts[i0:i1] = previous + np.cumsum(ooc, axis=0)
+            # new points are checked with the points before them in the window
+            lookback = max(i0 - rules.WINDOW + 1, 0)
+            self.violations[i0:i1] = rules.evaluate(
+                self.data[lookback:i1], self.ucl, self.lcl
+            )[i0 - lookback :]
+            self.n = i1
+
+    def ingest(self, batch, row):
+        self.extend([batch], [row])
+
+    # Returns the values of a parameter in the first `stop` batches
+    def values(self, param, stop=None):
+        stop = self.n if stop is None else min(stop, self.n)
+        return self.data[:stop, self.index[param]]
+
+    def _counts(self, j, ucl, lcl):
+        if ucl == self.ucl[j] and lcl == self.lcl[j]:
+            return self.ooc_counts[: self.n, j]
+
+        key = (j, ucl, lcl)
+        with self.lock:
+            counts = self._custom_counts.pop(key, np.zeros(0, dtype=np.int64))
+            if len(counts) < self.n:
+                values = self.data[len(counts) : self.n, j]
+                previous = counts[-1] if len(counts) else 0
+                counts = np.concatenate(
+                    [counts, previous + np.cumsum((values >= ucl) | (values <= lcl))]
+                )
+            self._custom_counts[key] = counts
+            if len(self._custom_counts) > self._cache_size:
+                self._custom_counts.popitem(last=False)
+            return counts
+
+    def _limits(self, j, ucl, lcl):
+        return (
+            self.ucl[j] if ucl is None else ucl,
+            self.lcl[j] if lcl is None else lcl,
+        )
+
+    # Returns the positions of the OOC points of a parameter in the first `stop`
+    # batches, against the engine limits or the given ones
+    def ooc_indices(self, param, stop, ucl=None, lcl=None):
+        j = self.index[param]
+        stop = min(stop, self.n)
+        ucl, lcl = self._limits(j, ucl, lcl)
+        if ucl == self.ucl[j] and lcl == self.lcl[j]:
+            return np.flatnonzero(self.ooc[:stop, j])
+        values = self.data[:stop, j]
+        return np.flatnonzero((values >= ucl) | (values <= lcl))
+
+    # Returns the ratio of OOC points of a parameter in the first `stop` batches
+    def ooc_ratio(self, param, stop, ucl=None, lcl=None):
+        j = self.index[param]
+        stop = min(stop, self.n)
+        if stop <= 0:
+            return 0.0
+        ucl, lcl = self._limits(j, ucl, lcl)
+        return float(self._counts(j, ucl, lcl)[stop - 1]) / stop
+
+    # Returns the bits of the run rules violated by the points of a parameter
+    # in batches [start, stop), against the engine limits or the given ones
+    def rule_violations(self, param, stop, ucl=None, lcl=None, start=0):
+        j = self.index[param]
+        stop = min(stop, self.n)
+        start = min(start, stop)
+        ucl, lcl = self._limits(j, ucl, lcl)
+        if ucl == self.ucl[j] and lcl == self.lcl[j]:
+            return self.violations[start:stop, j]
+        lookback = max(start - rules.WINDOW + 1, 0)
+        values = self.data[lookback:stop, j]
+        return rules.evaluate(values, ucl, lcl)[start - lookback :]
@@ -1,16 +1,27 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from textwrap import dedent
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_player as player
 import numpy as np
-import pandas as pd
 import plotly.graph_objs as go
 from dash.dependencies import Input, Output, State
 import pathlib
 
+from detections import DetectionStore
+
+START_TIME = time.perf_counter()
+
 FRAMERATE = 24.0
 
+# Number of footage kept in memory by each worker
+MAX_LOADED_FOOTAGE = 3
+
 app = dash.Dash(
     __name__,
     meta_tags=[{"name": "viewport", "content": "width=device-width, initial-scale=1"}],
@@ -24,15 +35,18 @@ DATA_PATH = BASE_PATH.joinpath("data").resolve()
 
 def load_data(path):
     """Load data about a specific footage (given by the path). It returns a dictionary of useful variables such as
-    the dataframe containing all the detection and bounds localization, the number of classes inside that footage,
+    the store of all the detections and bounds localization sorted by frame, the number of classes inside that footage,
     the matrix of all the classes in string, the given class with padding, and the root of the number of classes,
     rounded."""
 
-    # Load the dataframe containing all the processed object detections inside the video
-    video_info_df = pd.read_csv(DATA_PATH.joinpath(path))
+    start = time.perf_counter()
 
-    # The list of classes, and the number of classes
-    classes_list = video_info_df["class_str"].value_counts().index.tolist()
+    # Load the store containing all the processed object detections inside the video,
+    # from its binary cache after the first time
+    detections = DetectionStore.cached(DATA_PATH.joinpath(path))
+
+    # The list of classes, most detected first, and the number of classes
+    classes_list = detections.classes
     n_classes = len(classes_list)
 
     # Gets the smallest value needed to add to the end of the classes list to get a square matrix
@@ -48,7 +62,7 @@ def load_data(path):
     classes_matrix = np.flip(classes_matrix, axis=0)
 
     data_dict = {
-        "video_info_df": video_info_df,
+        "detections": detections,
         "n_classes": n_classes,
         "classes_matrix": classes_matrix,
         "classes_padded": classes_padded,
@@ -56,11 +70,20 @@ def load_data(path):
     }
 
     if True:
-        print(f"{path} loaded.")
+        print(f"{path} loaded in {time.perf_counter() - start:.3f}s.")
 
     return data_dict
 
 
+def memory_usage():
+    """Resident set size of the worker in MB, None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
 def markdown_popup():
     return html.Div(
         id="markdown",
@@ -293,47 +316,70 @@ app.layout = html.Div(
 
 
 # Data Loading
-@app.server.before_first_request
-def load_all_footage():
-    global data_dict, url_dict
-
-    # Load the dictionary containing all the variables needed for analysis
-    data_dict = {
-        "james_bond": load_data("james_bond_object_data.csv"),
-        "zebra": load_data("Zebra_object_data.csv"),
-        "car_show_drone": load_data("CarShowDrone_object_data.csv"),
-        "car_footage": load_data("CarFootage_object_data.csv"),
-        "DroneCanalFestival": load_data("DroneCanalFestivalDetectionData.csv"),
-        "DroneCarFestival2": load_data("DroneCarFestival2DetectionData.csv"),
-        "FarmDrone": load_data("FarmDroneDetectionData.csv"),
-        "ManCCTV": load_data("ManCCTVDetectionData.csv"),
-        "RestaurantHoldup": load_data("RestaurantHoldupDetectionData.csv"),
-    }
-
-    url_dict = {
-        "regular": {
-            "james_bond": "https://www.youtube.com/watch?v=g9S5GndUhko",
-            "zebra": "https://www.youtube.com/watch?v=TVvtD3AVt10",
-            "car_show_drone": "https://www.youtube.com/watch?v=gPtn6hD7o8g",
-            "car_footage": "https://www.youtube.com/watch?v=qX3bDxHuq6I",
-            "DroneCanalFestival": "https://youtu.be/0oucTt2OW7M",
-            "DroneCarFestival2": "https://youtu.be/vhJ7MHsJvwY",
-            "FarmDrone": "https://youtu.be/aXfKuaP8v_A",
-            "ManCCTV": "https://youtu.be/BYZORBIxgbc",
-            "RestaurantHoldup": "https://youtu.be/WDin4qqgpac",
-        },
-        "bounding_box": {
-            "james_bond": "https://www.youtube.com/watch?v=g9S5GndUhko",
-            "zebra": "https://www.youtube.com/watch?v=G2pbZgyWQ5E",
-            "car_show_drone": "https://www.youtube.com/watch?v=9F5FdcVmLOY",
-            "car_footage": "https://www.youtube.com/watch?v=EhnNosq1Lrc",
-            "DroneCanalFestival": "https://youtu.be/6ZZmsnwk2HQ",
-            "DroneCarFestival2": "https://youtu.be/2Gr4RQ-JHIs",
-            "FarmDrone": "https://youtu.be/pvvW5yZlpyc",
-            "ManCCTV": "https://youtu.be/1oMrHLrtOZw",
-            "RestaurantHoldup": "https://youtu.be/HOIKOwixYEY",
-        },
-    }
+FOOTAGE_FILES = {
+    "james_bond": "james_bond_object_data.csv",
+    "zebra": "Zebra_object_data.csv",
+    "car_show_drone": "CarShowDrone_object_data.csv",
+    "car_footage": "CarFootage_object_data.csv",
+    "DroneCanalFestival": "DroneCanalFestivalDetectionData.csv",
+    "DroneCarFestival2": "DroneCarFestival2DetectionData.csv",
+    "FarmDrone": "FarmDroneDetectionData.csv",
+    "ManCCTV": "ManCCTVDetectionData.csv",
+    "RestaurantHoldup": "RestaurantHoldupDetectionData.csv",
+}
+
+# The dictionaries of variables needed for analysis of the footage used last
+loaded_footage = OrderedDict()
+loaded_footage_lock = threading.Lock()
+
+
+def footage_data(footage):
+    """Dictionary of variables of a footage, loaded on first use. Only the
+    MAX_LOADED_FOOTAGE footage used last are kept in memory."""
+
+    with loaded_footage_lock:
+        if footage in loaded_footage:
+            loaded_footage.move_to_end(footage)
+            return loaded_footage[footage]
+
+    data = load_data(FOOTAGE_FILES[footage])
+    with loaded_footage_lock:
+        loaded_footage[footage] = data
+        while len(loaded_footage) > MAX_LOADED_FOOTAGE:
+            loaded_footage.popitem(last=False)
+    return data
+
+
+url_dict = {
+    "regular": {
+        "james_bond": "https://www.youtube.com/watch?v=g9S5GndUhko",
+        "zebra": "https://www.youtube.com/watch?v=TVvtD3AVt10",
+        "car_show_drone": "https://www.youtube.com/watch?v=gPtn6hD7o8g",
+        "car_footage": "https://www.youtube.com/watch?v=qX3bDxHuq6I",
+        "DroneCanalFestival": "https://youtu.be/0oucTt2OW7M",
+        "DroneCarFestival2": "https://youtu.be/vhJ7MHsJvwY",
+        "FarmDrone": "https://youtu.be/aXfKuaP8v_A",
+        "ManCCTV": "https://youtu.be/BYZORBIxgbc",
+        "RestaurantHoldup": "https://youtu.be/WDin4qqgpac",
+    },
+    "bounding_box": {
+        "james_bond": "https://www.youtube.com/watch?v=g9S5GndUhko",
+        "zebra": "https://www.youtube.com/watch?v=G2pbZgyWQ5E",
+        "car_show_drone": "https://www.youtube.com/watch?v=9F5FdcVmLOY",
+        "car_footage": "https://www.youtube.com/watch?v=EhnNosq1Lrc",
+        "DroneCanalFestival": "https://youtu.be/6ZZmsnwk2HQ",
+        "DroneCarFestival2": "https://youtu.be/2Gr4RQ-JHIs",
+        "FarmDrone": "https://youtu.be/pvvW5yZlpyc",
+        "ManCCTV": "https://youtu.be/1oMrHLrtOZw",
+        "RestaurantHoldup": "https://youtu.be/HOIKOwixYEY",
+    },
+}
+
+
+# Detections above the threshold (in percent) in a frame, shared by the graphs
+@lru_cache(maxsize=256)
+def frame_detections(footage, frame, threshold):
+    return footage_data(footage)["detections"].detections(frame, threshold / 100)
 
 
 # Footage Selection
@@ -447,20 +493,14 @@ def update_score_bar(n, current_time, footage, threshold):
         current_frame = round(current_time * FRAMERATE)
 
         if n > 0 and current_frame > 0:
-            video_info_df = data_dict[footage]["video_info_df"]
-
-            # Select the subset of the dataset that correspond to the current frame
-            frame_df = video_info_df[video_info_df["frame"] == current_frame]
-
-            # Select only the frames above the threshold
-            threshold_dec = threshold / 100  # Threshold in decimal
-            frame_df = frame_df[frame_df["score"] > threshold_dec]
+            # Select the detections of the current frame above the threshold
+            frame = frame_detections(footage, current_frame, threshold)
 
             # Select up to 8 frames with the highest scores
-            frame_df = frame_df[: min(8, frame_df.shape[0])]
+            objects = frame.classes[:8]
+            scores = frame.scores[:8]
 
             # Add count to object names (e.g. person --> person 1, person --> person 2)
-            objects = frame_df["class_str"].tolist()
             object_count_dict = {
                 x: 0 for x in set(objects)
             }  # Keeps count of the objects
@@ -472,10 +512,7 @@ def update_score_bar(n, current_time, footage, threshold):
             colors = list("rgb(250,79,86)" for i in range(len(objects_wc)))
 
             # Add text information
-            y_text = [
-                f"{round(value * 100)}% confidence"
-                for value in frame_df["score"].tolist()
-            ]
+            y_text = [f"{round(value * 100)}% confidence" for value in scores]
 
             figure = go.Figure(
                 {
@@ -487,7 +524,7 @@ def update_score_bar(n, current_time, footage, threshold):
                             "type": "bar",
                             "x": objects_wc,
                             "marker": {"color": colors},
-                            "y": frame_df["score"].tolist(),
+                            "y": scores,
                         }
                     ],
                     "layout": {
@@ -531,20 +568,12 @@ def update_object_count_pie(n, current_time, footage, threshold):
         current_frame = round(current_time * FRAMERATE)
 
         if n > 0 and current_frame > 0:
-            video_info_df = data_dict[footage]["video_info_df"]
-
-            # Select the subset of the dataset that correspond to the current frame
-            frame_df = video_info_df[video_info_df["frame"] == current_frame]
-
-            # Select only the frames above the threshold
-            threshold_dec = threshold / 100  # Threshold in decimal
-            frame_df = frame_df[frame_df["score"] > threshold_dec]
+            # Select the detections of the current frame above the threshold
+            frame = frame_detections(footage, current_frame, threshold)
 
             # Get the count of each object class
-            class_counts = frame_df["class_str"].value_counts()
-
-            classes = class_counts.index.tolist()  # List of each class
-            counts = class_counts.tolist()  # List of each count
+            classes = [c for c, count in frame.class_counts]  # List of each class
+            counts = [count for c, count in frame.class_counts]  # List of each count
 
             text = [f"{count} detected" for count in counts]
 
@@ -598,36 +627,24 @@ def update_heatmap_confidence(n, current_time, footage, threshold):
 
         if n > 0 and current_frame > 0:
             # Load variables from the data dictionary
-            video_info_df = data_dict[footage]["video_info_df"]
-            classes_padded = data_dict[footage]["classes_padded"]
-            root_round = data_dict[footage]["root_round"]
-            classes_matrix = data_dict[footage]["classes_matrix"]
-
-            # Select the subset of the dataset that correspond to the current frame
-            frame_df = video_info_df[video_info_df["frame"] == current_frame]
-
-            # Select only the frames above the threshold
-            threshold_dec = threshold / 100
-            frame_df = frame_df[frame_df["score"] > threshold_dec]
-
-            # Remove duplicate, keep the top result
-            frame_no_dup = frame_df[["class_str", "score"]].drop_duplicates("class_str")
-            frame_no_dup.set_index("class_str", inplace=True)
-
-            # The list of scores
-            score_list = []
-            for el in classes_padded:
-                if el in frame_no_dup.index.values:
-                    score_list.append(frame_no_dup.loc[el][0])
-                else:
-                    score_list.append(0)
+            data_dict = footage_data(footage)
+            classes_padded = data_dict["classes_padded"]
+            root_round = data_dict["root_round"]
+            classes_matrix = data_dict["classes_matrix"]
+
+            # Select the detections of the current frame above the threshold
+            frame = frame_detections(footage, current_frame, threshold)
+
+            # The list of scores, the top result of each class, 0 for the padding
+            score_list = frame.class_scores.tolist()
+            score_list += [0] * (len(classes_padded) - len(score_list))
 
             # Generate the score matrix, and flip it for visual
             score_matrix = np.reshape(score_list, (-1, int(root_round)))
             score_matrix = np.flip(score_matrix, axis=0)
 
-            # We set the color scale to white if there's nothing in the frame_no_dup
-            if frame_no_dup.shape != (0, 1):
+            # We set the color scale to white if there's nothing in the frame
+            if frame.classes:
                 colorscale = [[0, "#f9f9f9"], [1, "#fa4f56"]]
             else:
                 colorscale = [[0, "#f9f9f9"], [1, "#f9f9f9"]]
@@ -710,6 +727,14 @@ def update_heatmap_confidence(n, current_time, footage, threshold):
     return go.Figure(data=[go.Pie()], layout=layout)
 
 
+# Cold start of the worker, footage are loaded later on first use
+rss = memory_usage()
+print(
+    f"App ready in {time.perf_counter() - START_TIME:.2f}s, "
+    f"{'?' if rss is None else round(rss)} MB resident."
+)
+
+
 # Running the server
 if __name__ == "__main__":
     app.run_server(debug=True, port=8053)
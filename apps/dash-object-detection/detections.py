@@ -0,0 +1,122 @@
+import os
+import pathlib
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+BOX_COLUMNS = ["y", "x", "bottom", "right"]
+
+# Detections of a frame with a score above a threshold, in the order of the data.
+# `class_scores` is the score of the first of these detections of each class,
+# 0 for classes not detected, and `class_counts` the number of detections of
+# each detected class, most detected first.
+FrameDetections = namedtuple(
+    "FrameDetections", ["classes", "scores", "class_scores", "class_counts"]
+)
+
+
+class DetectionStore:
+    """
+    Object detections of a footage, as columns sorted by frame.
+
+    Detections of frame f are rows offsets[f]:offsets[f + 1], so the detections
+    of any frame are read without scanning the others. Classes are stored as
+    codes into `classes`, the classes sorted from the most detected one.
+    """
+
+    def __init__(self, frame, score, class_code, boxes, classes):
+        self.frame = frame  # int32
+        self.score = score  # float32
+        self.class_code = class_code  # int16
+        self.boxes = boxes  # float32, one row of BOX_COLUMNS per detection
+        self.classes = classes
+        n_frames = int(frame[-1]) + 1 if len(frame) else 0
+        self.offsets = np.searchsorted(frame, np.arange(n_frames + 1))
+
+    @classmethod
+    def from_csv(cls, path):
+        df = pd.read_csv(path)
+        classes = df["class_str"].value_counts().index.tolist()
+        codes = pd.Categorical(df["class_str"], categories=classes).codes
+
+        # stable, detections of a frame stay in the order of the file
+        order = np.argsort(df["frame"].values, kind="mergesort")
+        return cls(
+            df["frame"].values[order].astype(np.int32),
+            df["score"].values[order].astype(np.float32),
+            codes[order].astype(np.int16),
+            df[BOX_COLUMNS].values[order].astype(np.float32),
+            classes,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(str(path)) as data:
+            return cls(
+                data["frame"],
+                data["score"],
+                data["class_code"],
+                data["boxes"],
+                data["classes"].tolist(),
+            )
+
+    # Saves the store, other workers never see a partially written file
+    def save(self, path):
+        path = pathlib.Path(path)
+        tmp_path = path.with_name(path.name + ".{}.tmp".format(os.getpid()))
+        with open(str(tmp_path), "wb") as f:
+            np.savez(
+                f,
+                frame=self.frame,
+                score=self.score,
+                class_code=self.class_code,
+                boxes=self.boxes,
+                classes=np.array(self.classes, dtype=str),
+            )
+        os.replace(str(tmp_path), str(path))
+
+    # Returns the store of a csv file from its .npz cache next to it, building
+    # the cache first if it is missing or older than the csv file
+    @classmethod
+    def cached(cls, csv_path):
+        csv_path = pathlib.Path(csv_path)
+        cache_path = csv_path.with_suffix(".npz")
+        if (
+            cache_path.exists()
+            and cache_path.stat().st_mtime >= csv_path.stat().st_mtime
+        ):
+            return cls.load(cache_path)
+        store = cls.from_csv(csv_path)
+        store.save(cache_path)
+        return store
+
+    def __len__(self):
+        return len(self.frame)
+
+    def rows(self, frame):
+        if not 0 <= frame < len(self.offsets) - 1:
+            return slice(0, 0)
+        return slice(self.offsets[frame], self.offsets[frame + 1])
+
+    def detections(self, frame, threshold):
+        rows = self.rows(frame)
+        score = self.score[rows]
+        above = score > threshold
+        codes = self.class_code[rows][above]
+        score = score[above]
+
+        detected, first, counts = np.unique(
+            codes, return_index=True, return_counts=True
+        )
+        class_scores = np.zeros(len(self.classes))
+        class_scores[detected] = score[first]
+        # most detected first, ties in order of first detection
+        order = np.lexsort((first, -counts))
+
+        return FrameDetections(
+            [self.classes[code] for code in codes],
+            score.tolist(),
+            class_scores,
+            [(self.classes[detected[i]], int(counts[i])) for i in order],
+        )
@@ -13,6 +13,8 @@ import dash_html_components as html
 
 # Multi-dropdown options
 from controls import COUNTIES, WELL_STATUSES, WELL_TYPES, WELL_COLORS
+from filters import FilterCache
+from production import ProductionTensor
 
 
 # get relative data folder
@@ -41,11 +43,16 @@ well_type_options = [
 
 
 # Download pickle file
-urllib.request.urlretrieve(
-    "https://raw.githubusercontent.com/plotly/datasets/master/dash-sample-apps/dash-oil-and-gas/data/points.pkl",
-    DATA_PATH.joinpath("points.pkl"),
-)
-points = pickle.load(open(DATA_PATH.joinpath("points.pkl"), "rb"))
+def load_points():
+    urllib.request.urlretrieve(
+        "https://raw.githubusercontent.com/plotly/datasets/master/dash-sample-apps/dash-oil-and-gas/data/points.pkl",
+        DATA_PATH.joinpath("points.pkl"),
+    )
+    return pickle.load(open(DATA_PATH.joinpath("points.pkl"), "rb"))
+
+
+# Production of each well and year, converted from the pickle file on first run
+production = ProductionTensor.cached(DATA_PATH.joinpath("production"), load_points)
 
 
 # Load data
@@ -56,6 +63,9 @@ df = pd.read_csv(
 df["Date_Well_Completed"] = pd.to_datetime(df["Date_Well_Completed"])
 df = df[df["Date_Well_Completed"] > dt.datetime(1960, 1, 1)]
 
+# Filtered wells, shared by the callbacks
+well_filter = FilterCache(df)
+
 trim = df[["API_WellNo", "Well_Type", "Well_Name"]]
 trim.index = trim["API_WellNo"]
 dataset = trim.to_dict(orient="index")
@@ -280,75 +290,16 @@ def human_format(num):
     return mantissa + ["", "K", "M", "G", "T", "P"][magnitude]
 
 
-def filter_dataframe(df, well_statuses, well_types, year_slider):
-    dff = df[
-        df["Well_Status"].isin(well_statuses)
-        & df["Well_Type"].isin(well_types)
-        & (df["Date_Well_Completed"] > dt.datetime(year_slider[0], 1, 1))
-        & (df["Date_Well_Completed"] < dt.datetime(year_slider[1], 1, 1))
-    ]
-    return dff
+def filter_dataframe(well_statuses, well_types, year_slider):
+    return well_filter.filter(well_statuses, well_types, year_slider)
 
 
 def produce_individual(api_well_num):
-    try:
-        points[api_well_num]
-    except:
-        return None, None, None, None
-
-    index = list(
-        range(min(points[api_well_num].keys()), max(points[api_well_num].keys()) + 1)
-    )
-    gas = []
-    oil = []
-    water = []
-
-    for year in index:
-        try:
-            gas.append(points[api_well_num][year]["Gas Produced, MCF"])
-        except:
-            gas.append(0)
-        try:
-            oil.append(points[api_well_num][year]["Oil Produced, bbl"])
-        except:
-            oil.append(0)
-        try:
-            water.append(points[api_well_num][year]["Water Produced, bbl"])
-        except:
-            water.append(0)
-
-    return index, gas, oil, water
+    return production.individual(api_well_num)
 
 
 def produce_aggregate(selected, year_slider):
-
-    index = list(range(max(year_slider[0], 1985), 2016))
-    gas = []
-    oil = []
-    water = []
-
-    for year in index:
-        count_gas = 0
-        count_oil = 0
-        count_water = 0
-        for api_well_num in selected:
-            try:
-                count_gas += points[api_well_num][year]["Gas Produced, MCF"]
-            except:
-                pass
-            try:
-                count_oil += points[api_well_num][year]["Oil Produced, bbl"]
-            except:
-                pass
-            try:
-                count_water += points[api_well_num][year]["Water Produced, bbl"]
-            except:
-                pass
-        gas.append(count_gas)
-        oil.append(count_oil)
-        water.append(count_water)
-
-    return index, gas, oil, water
+    return production.aggregate(selected, year_slider)
 
 
 # Create callbacks
@@ -369,7 +320,7 @@ app.clientside_callback(
 )
 def update_production_text(well_statuses, well_types, year_slider):
 
-    dff = filter_dataframe(df, well_statuses, well_types, year_slider)
+    dff = filter_dataframe(well_statuses, well_types, year_slider)
     selected = dff["API_WellNo"].values
     index, gas, oil, water = produce_aggregate(selected, year_slider)
     return [human_format(sum(gas)), human_format(sum(oil)), human_format(sum(water))]
@@ -419,7 +370,7 @@ def update_year_slider(count_graph_selected):
 )
 def update_well_text(well_statuses, well_types, year_slider):
 
-    dff = filter_dataframe(df, well_statuses, well_types, year_slider)
+    dff = filter_dataframe(well_statuses, well_types, year_slider)
     return dff.shape[0]
 
 
@@ -449,7 +400,7 @@ def make_main_figure(
     well_statuses, well_types, year_slider, selector, main_graph_layout
 ):
 
-    dff = filter_dataframe(df, well_statuses, well_types, year_slider)
+    dff = filter_dataframe(well_statuses, well_types, year_slider)
 
     traces = []
     for well_type, dfff in dff.groupby("Well_Type"):
@@ -565,7 +516,7 @@ def make_aggregate_figure(well_statuses, well_types, year_slider, main_graph_hov
 
     chosen = [point["customdata"] for point in main_graph_hover["points"]]
     well_type = dataset[chosen[0]]["Well_Type"]
-    dff = filter_dataframe(df, well_statuses, well_types, year_slider)
+    dff = filter_dataframe(well_statuses, well_types, year_slider)
 
     selected = dff[dff["Well_Type"] == well_type]["API_WellNo"].values
     index, gas, oil, water = produce_aggregate(selected, year_slider)
@@ -615,7 +566,7 @@ def make_pie_figure(well_statuses, well_types, year_slider):
 
     layout_pie = copy.deepcopy(layout)
 
-    dff = filter_dataframe(df, well_statuses, well_types, year_slider)
+    dff = filter_dataframe(well_statuses, well_types, year_slider)
 
     selected = dff["API_WellNo"].values
     index, gas, oil, water = produce_aggregate(selected, year_slider)
@@ -676,7 +627,7 @@ def make_count_figure(well_statuses, well_types, year_slider):
 
     layout_count = copy.deepcopy(layout)
 
-    dff = filter_dataframe(df, well_statuses, well_types, [1960, 2017])
+    dff = filter_dataframe(well_statuses, well_types, [1960, 2017])
     g = dff[["API_WellNo", "Date_Well_Completed"]]
     g.index = g["Date_Well_Completed"]
     g = g.resample("A").count()
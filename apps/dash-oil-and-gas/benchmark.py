@@ -0,0 +1,148 @@
+# Benchmark of the production queries of the individual and aggregate graphs.
+#
+# Compares the loops over the points pickle (previous produce_individual and
+# produce_aggregate) with the production tensor, selecting all the wells.
+#
+# Uses data/points.pkl if the app downloaded it, otherwise generated points with
+# about as many wells.
+#
+# Usage: python benchmark.py
+import pathlib
+import pickle
+import tempfile
+import timeit
+
+import numpy as np
+
+from production import METRICS, ProductionTensor
+
+PATH = pathlib.Path(__file__).parent
+DATA_PATH = PATH.joinpath("data").resolve()
+
+N_WELLS = 15000
+N_REPEAT = 5
+
+
+# Returns the points pickle, or generated points of wells producing for a few
+# years each, some metrics missing
+def load_points(path=DATA_PATH.joinpath("points.pkl")):
+    if path.exists():
+        with open(str(path), "rb") as f:
+            return pickle.load(f)
+
+    rng = np.random.RandomState(0)
+    wells = 31000000000000 + np.unique(rng.randint(0, 10 ** 6, N_WELLS)) * 10000
+    points = {}
+    for well in wells.tolist():
+        first = int(rng.randint(1980, 2016))
+        last = int(rng.randint(first, 2017))
+        points[well] = {
+            year: {metric: float(rng.uniform(0, 1e5)) for metric in METRICS[:-1]}
+            if rng.uniform() < 0.7
+            else {METRICS[-1]: float(rng.uniform(0, 1e3))}
+            for year in range(first, last + 1)
+            if rng.uniform() < 0.9
+        }
+        if not points[well]:
+            points[well] = {first: {}}
+    return points
+
+
+def loop_individual(points, api_well_num):
+    try:
+        points[api_well_num]
+    except:
+        return None, None, None, None
+
+    index = list(
+        range(min(points[api_well_num].keys()), max(points[api_well_num].keys()) + 1)
+    )
+    values = [[], [], []]
+    for year in index:
+        for column, metric in enumerate(METRICS):
+            try:
+                values[column].append(points[api_well_num][year][metric])
+            except:
+                values[column].append(0)
+    return (index,) + tuple(values)
+
+
+def loop_aggregate(points, selected, year_slider):
+    index = list(range(max(year_slider[0], 1985), 2016))
+    values = [[], [], []]
+    for year in index:
+        counts = [0, 0, 0]
+        for api_well_num in selected:
+            for column, metric in enumerate(METRICS):
+                try:
+                    counts[column] += points[api_well_num][year][metric]
+                except:
+                    pass
+        for column in range(3):
+            values[column].append(counts[column])
+    return (index,) + tuple(values)
+
+
+# Returns the average time in ms of `func()`
+def time_call(func, n=N_REPEAT):
+    start = timeit.default_timer()
+    for _ in range(n):
+        func()
+    return 1000 * (timeit.default_timer() - start) / n
+
+
+def main():
+    points = load_points()
+    selected = np.array(list(points), dtype=np.int64)
+    year_slider = [1960, 2017]
+
+    start = timeit.default_timer()
+    with tempfile.TemporaryDirectory() as cache_path:
+        ProductionTensor.from_points(points).save(cache_path)
+        built = timeit.default_timer() - start
+        production = ProductionTensor.load(cache_path)
+        print(
+            "{} wells, {} years, tensor built in {:.1f}s".format(
+                *production.values.shape[:2], built
+            )
+        )
+
+        aggregate = production.aggregate(selected, year_slider)
+        expected = loop_aggregate(points, selected, year_slider)
+        error = max(
+            abs(a - b) / max(abs(b), 1)
+            for column in range(1, 4)
+            for a, b in zip(aggregate[column], expected[column])
+        )
+        print("largest relative difference of the aggregate: {:.1e}".format(error))
+
+        wells = selected[:: max(len(selected) // 1000, 1)]
+        rows = [
+            (
+                "aggregate, all wells",
+                lambda: loop_aggregate(points, selected, year_slider),
+                lambda: production.aggregate(selected, year_slider),
+            ),
+            (
+                "individual, 1000 wells",
+                lambda: [loop_individual(points, w) for w in wells.tolist()],
+                lambda: [production.individual(w) for w in wells],
+            ),
+        ]
+        print(
+            "{:<26}{:>12}{:>12}{:>10}".format(
+                "query", "loops ms", "tensor ms", "speedup"
+            )
+        )
+        for name, loop, tensor in rows:
+            loop_ms = time_call(loop)
+            tensor_ms = time_call(tensor)
+            print(
+                "{:<26}{:>12.1f}{:>12.2f}{:>9.0f}x".format(
+                    name, loop_ms, tensor_ms, loop_ms / tensor_ms
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
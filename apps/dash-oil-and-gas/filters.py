@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "max_size", "size"])
+
+
+# Wells matching the status, type and completion year filters, shared by the
+# callbacks that fire on the same filter change.
+#
+# Each status and type has a precomputed boolean mask over the wells, so a
+# filter ORs a few masks and compares completion dates. Filtered frames are
+# kept in an LRU cache keyed by the normalized filters.
+class FilterCache:
+    def __init__(self, df, max_size=64):
+        self.df = df
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+
+        self.completed = df["Date_Well_Completed"].values
+        self.status_masks = self._masks(df["Well_Status"].values)
+        self.type_masks = self._masks(df["Well_Type"].values)
+
+    @staticmethod
+    def _masks(column):
+        codes, values = pd.factorize(column)
+        return {value: codes == i for i, value in enumerate(values)}
+
+    @staticmethod
+    def key(well_statuses, well_types, year_slider):
+        return (
+            frozenset(well_statuses or ()),
+            frozenset(well_types or ()),
+            (int(year_slider[0]), int(year_slider[1])),
+        )
+
+    def _any(self, masks, values):
+        mask = np.zeros(len(self.df), dtype=bool)
+        for value in values:
+            if value in masks:
+                mask |= masks[value]
+        return mask
+
+    def mask(self, well_statuses, well_types, year_slider):
+        well_statuses, well_types, (first, last) = self.key(
+            well_statuses, well_types, year_slider
+        )
+        mask = self._any(self.status_masks, well_statuses)
+        mask &= self._any(self.type_masks, well_types)
+        mask &= self.completed > np.datetime64(pd.Timestamp(first, 1, 1))
+        mask &= self.completed < np.datetime64(pd.Timestamp(last, 1, 1))
+        return mask
+
+    # Returns the wells matching the filters, which must not be modified
+    def filter(self, well_statuses, well_types, year_slider):
+        key = self.key(well_statuses, well_types, year_slider)
+        with self.lock:
+            if key in self._frames:
+                self.hits += 1
+                self._frames.move_to_end(key)
+                return self._frames[key]
+            self.misses += 1
+
+        dff = self.df[self.mask(*key)]
+        with self.lock:
+            self._frames[key] = dff
+            if len(self._frames) > self.max_size:
+                self._frames.popitem(last=False)
+        return dff
+
+    def cache_info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.max_size, len(self._frames))
@@ -0,0 +1,120 @@
+import os
+import pathlib
+
+import numpy as np
+
+
+METRICS = ["Gas Produced, MCF", "Oil Produced, bbl", "Water Produced, bbl"]
+
+# Years shown by the aggregate graph
+AGGREGATE_YEARS = (1985, 2016)
+
+
+# Dense (well, year, metric) array of the yearly production of every well.
+#
+# Wells are sorted by API well number, so the rows of selected wells are found
+# with a binary search and the production of any selection is one fancy index
+# and sum. Years and metrics missing from the source count as 0.
+class ProductionTensor:
+    def __init__(self, wells, years, values):
+        self.wells = wells  # int64 API well numbers, sorted
+        self.years = years  # int16 first and last year with data of each well
+        self.values = values  # float32 (well, year, metric)
+        self.first_year = int(years[:, 0].min()) if len(years) else 0
+        self.row_of = dict(zip(wells.tolist(), range(len(wells))))
+
+    # Builds the tensor from the points pickle,
+    # {api_well_num: {year: {metric: value}}}
+    @classmethod
+    def from_points(cls, points):
+        points = {well: years for well, years in points.items() if years}
+        wells = np.array(sorted(points), dtype=np.int64)
+        years = np.array(
+            [(min(points[w]), max(points[w])) for w in wells], dtype=np.int16
+        ).reshape(-1, 2)
+        first_year = years[:, 0].min() if len(years) else 0
+        n_years = int(years[:, 1].max() - first_year + 1) if len(years) else 0
+
+        values = np.zeros((len(wells), n_years, len(METRICS)), dtype=np.float32)
+        for row, well in enumerate(wells):
+            for year, production in points[well].items():
+                for column, metric in enumerate(METRICS):
+                    if metric in production:
+                        values[row, year - first_year, column] = production[metric]
+        return cls(wells, years, values)
+
+    # Loads the tensor, with values memory-mapped from disk by default
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        path = pathlib.Path(path)
+        return cls(
+            np.load(str(path.joinpath("wells.npy"))),
+            np.load(str(path.joinpath("years.npy"))),
+            np.load(str(path.joinpath("values.npy")), mmap_mode=mmap_mode),
+        )
+
+    # Saves the tensor in the `path` folder. Each file is replaced atomically and
+    # values are written last, so a folder with values.npy is complete.
+    def save(self, path):
+        path = pathlib.Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, array in [
+            ("wells", self.wells),
+            ("years", self.years),
+            ("values", np.ascontiguousarray(self.values)),
+        ]:
+            target = path.joinpath(name + ".npy")
+            tmp_path = path.joinpath("{}.{}.tmp".format(name, os.getpid()))
+            with open(str(tmp_path), "wb") as f:
+                np.save(f, array)
+            os.replace(str(tmp_path), str(target))
+
+    # Returns the tensor cached in `cache_path`, building and caching it first
+    # from `load_points()` if needed
+    @classmethod
+    def cached(cls, cache_path, load_points):
+        cache_path = pathlib.Path(cache_path)
+        if cache_path.joinpath("values.npy").exists():
+            return cls.load(cache_path)
+        tensor = cls.from_points(load_points())
+        tensor.save(cache_path)
+        return cls.load(cache_path)
+
+    # Returns rows of the given wells, wells without production are left out
+    def rows(self, api_well_nums):
+        api_well_nums = np.asarray(api_well_nums, dtype=np.int64)
+        if not len(self.wells):
+            return np.zeros(0, dtype=np.intp)
+        rows = np.searchsorted(self.wells, api_well_nums)
+        rows[rows == len(self.wells)] = 0
+        return rows[self.wells[rows] == api_well_nums]
+
+    # Returns years and yearly production of each metric of a well, from its
+    # first to its last year with data, or None's if the well has no data
+    def individual(self, api_well_num):
+        row = self.row_of.get(api_well_num)
+        if row is None:
+            return None, None, None, None
+
+        first, last = self.years[row].tolist()
+        values = self.values[row, first - self.first_year : last - self.first_year + 1]
+        return (list(range(first, last + 1)),) + tuple(values.T.tolist())
+
+    # Returns years and yearly production of each metric summed over the
+    # selected wells, from the first slider year (1985 at the earliest) to 2015
+    def aggregate(self, api_well_nums, year_slider):
+        first = max(year_slider[0], AGGREGATE_YEARS[0])
+        index = list(range(first, AGGREGATE_YEARS[1]))
+        totals = np.zeros((len(index), len(METRICS)))
+
+        # years of the index that are in the tensor
+        start = max(first - self.first_year, 0)
+        stop = min(AGGREGATE_YEARS[1] - self.first_year, self.values.shape[1])
+        if stop > start:
+            rows = np.sort(self.rows(api_well_nums))
+            offset = start + self.first_year - first
+            totals[offset : offset + stop - start] = self.values[rows, start:stop].sum(
+                axis=0, dtype=np.float64
+            )
+
+        return (index,) + tuple(totals[:, column].tolist() for column in range(3))
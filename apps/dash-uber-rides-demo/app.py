@@ -9,6 +9,8 @@ from plotly import graph_objs as go
 from plotly.graph_objs import *
 from datetime import datetime as dt
 
+from rides import RideStore
+
 
 app = dash.Dash(
     __name__, meta_tags=[{"name": "viewport", "content": "width=device-width"}]
@@ -32,30 +34,9 @@ list_of_locations = {
     "United Nations HQ": {"lat": 40.7489, "lon": -73.9680},
 }
 
-# Initialize data frame
-df1 = pd.read_csv(
-    "https://raw.githubusercontent.com/plotly/datasets/master/uber-rides-data1.csv",
-    dtype=object,
-)
-df2 = pd.read_csv(
-    "https://raw.githubusercontent.com/plotly/datasets/master/uber-rides-data2.csv",
-    dtype=object,
-)
-df3 = pd.read_csv(
-    "https://raw.githubusercontent.com/plotly/datasets/master/uber-rides-data3.csv",
-    dtype=object,
-)
-df = pd.concat([df1, df2, df3], axis=0)
-df["Date/Time"] = pd.to_datetime(df["Date/Time"], format="%Y-%m-%d %H:%M")
-df.index = df["Date/Time"]
-df.drop("Date/Time", 1, inplace=True)
-totalList = []
-for month in df.groupby(df.index.month):
-    dailyList = []
-    for day in month[1].groupby(month[1].index.day):
-        dailyList.append(day[1])
-    totalList.append(dailyList)
-totalList = np.array(totalList)
+# Initialize ride store, the csv files are only downloaded and parsed the first
+# time, then loaded from a local binary cache
+rides = RideStore.cached()
 
 # Layout of Dash App
 app.layout = html.Div(
@@ -168,7 +149,6 @@ monthIndex = pd.Index(["Apr", "May", "June", "July", "Aug", "Sept"])
 # if the hours are selected
 def get_selection(month, day, selection):
     xVal = []
-    yVal = []
     xSelected = []
     colorVal = [
         "#F4EC15",
@@ -200,13 +180,14 @@ def get_selection(month, day, selection):
     # Put selected times into a list of numbers xSelected
     xSelected.extend([int(x) for x in selection])
 
+    # Get the number of rides at each hour
+    yVal = rides.counts[month, day]
+
     for i in range(24):
         # If bar is selected then color it white
         if i in xSelected and len(xSelected) < 24:
             colorVal[i] = "#FFFFFF"
         xVal.append(i)
-        # Get the number of rides at a particular time
-        yVal.append(len(totalList[month][day][totalList[month][day].index.hour == i]))
     return [np.array(xVal), np.array(yVal), np.array(colorVal)]
 
 
@@ -237,7 +218,7 @@ def update_selected_data(clickData):
 def update_total_rides(datePicked):
     date_picked = dt.strptime(datePicked, "%Y-%m-%d")
     return "Total Number of rides: {:,d}".format(
-        len(totalList[date_picked.month - 4][date_picked.day - 1])
+        rides.count(date_picked.month - 4, date_picked.day - 1)
     )
 
 
@@ -251,14 +232,9 @@ def update_total_rides_selection(datePicked, selection):
 
     if selection is not None or len(selection) is not 0:
         date_picked = dt.strptime(datePicked, "%Y-%m-%d")
-        totalInSelection = 0
-        for x in selection:
-            totalInSelection += len(
-                totalList[date_picked.month - 4][date_picked.day - 1][
-                    totalList[date_picked.month - 4][date_picked.day - 1].index.hour
-                    == int(x)
-                ]
-            )
+        totalInSelection = rides.count(
+            date_picked.month - 4, date_picked.day - 1, selection
+        )
         firstOutput = "Total rides in selection: {:,d}".format(totalInSelection)
 
     if (
@@ -357,18 +333,8 @@ def update_histogram(datePicked, selection):
 
 # Get the Coordinates of the chosen months, dates and times
 def getLatLonColor(selectedData, month, day):
-    listCoords = totalList[month][day]
-
     # No times selected, output all times for chosen month and date
-    if selectedData is None or len(selectedData) is 0:
-        return listCoords
-    listStr = "listCoords["
-    for time in selectedData:
-        if selectedData.index(time) is not len(selectedData) - 1:
-            listStr += "(totalList[month][day].index.hour==" + str(int(time)) + ") | "
-        else:
-            listStr += "(totalList[month][day].index.hour==" + str(int(time)) + ")]"
-    return eval(listStr)
+    return rides.select(month, day, selectedData)
 
 
 # Update Map Graph based on date-picker, selected data on histogram and location dropdown
@@ -404,10 +370,10 @@ def update_graph(datePicked, selectedData, selectedLocation):
                 lon=listCoords["Lon"],
                 mode="markers",
                 hoverinfo="lat+lon+text",
-                text=listCoords.index.hour,
+                text=listCoords["Hour"],
                 marker=dict(
                     showscale=True,
-                    color=np.append(np.insert(listCoords.index.hour, 0, 0), 23),
+                    color=np.append(np.insert(listCoords["Hour"], 0, 0), 23),
                     opacity=0.5,
                     size=5,
                     colorscale=[
@@ -0,0 +1,64 @@
+# Benchmark of the ride count lookups done by the histogram and totals callbacks.
+#
+# Uses the local ride cache if it exists, otherwise a generated store with the
+# same number of rides.
+#
+# Usage: python benchmark.py
+import timeit
+
+import numpy as np
+
+from rides import CACHE_PATH, N_DAYS, N_HOURS, N_MONTHS, RideStore
+
+N_RIDES = 4534327
+N_REQUESTS = 20000
+
+
+def generated_store(n=N_RIDES):
+    rng = np.random.RandomState(0)
+    key = np.sort(rng.randint(0, N_MONTHS * N_DAYS * N_HOURS, n))
+    counts = np.bincount(key, minlength=N_MONTHS * N_DAYS * N_HOURS)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    lat = rng.uniform(40.5, 41, n).astype(np.float32)
+    lon = rng.uniform(-74.2, -73.7, n).astype(np.float32)
+    hour = (key % N_HOURS).astype(np.uint8)
+    return RideStore(lat, lon, hour, offsets)
+
+
+def main():
+    if CACHE_PATH.exists():
+        rides = RideStore.load(CACHE_PATH)
+        print("{:,d} rides from {}".format(len(rides.lat), CACHE_PATH.name))
+    else:
+        rides = generated_store()
+        print("{:,d} generated rides".format(len(rides.lat)))
+
+    rng = np.random.RandomState(1)
+    months = rng.randint(0, N_MONTHS, N_REQUESTS)
+    days = rng.randint(0, 30, N_REQUESTS)
+    selections = [
+        [str(h) for h in rng.choice(N_HOURS, rng.randint(1, 8), replace=False)]
+        for _ in range(N_REQUESTS)
+    ]
+
+    requests = {
+        # get_selection / update_histogram
+        "hourly histogram": lambda i: rides.counts[months[i], days[i]],
+        # update_total_rides
+        "total rides": lambda i: rides.count(months[i], days[i]),
+        # update_total_rides_selection
+        "rides in selection": lambda i: rides.count(months[i], days[i], selections[i]),
+        "weekday x hour": lambda i: rides.weekday_hour_counts(),
+    }
+
+    print("{:<22}{:>14}{:>16}".format("lookup", "us/request", "requests/s"))
+    for name, request in requests.items():
+        start = timeit.default_timer()
+        for i in range(N_REQUESTS):
+            request(i)
+        elapsed = (timeit.default_timer() - start) / N_REQUESTS
+        print("{:<22}{:>14.2f}{:>16,.0f}".format(name, 1e6 * elapsed, 1 / elapsed))
+
+
+if __name__ == "__main__":
+    main()
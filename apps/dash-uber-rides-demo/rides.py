@@ -0,0 +1,145 @@
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+
+# Rides are indexed by (month, day, hour), months starting in April 2014
+N_MONTHS = 6
+N_DAYS = 31
+N_HOURS = 24
+FIRST_MONTH = 4
+
+CACHE_PATH = pathlib.Path(__file__).parent.joinpath("uber-rides.npz")
+
+DATA_URLS = [
+    "https://raw.githubusercontent.com/plotly/datasets/master/uber-rides-data1.csv",
+    "https://raw.githubusercontent.com/plotly/datasets/master/uber-rides-data2.csv",
+    "https://raw.githubusercontent.com/plotly/datasets/master/uber-rides-data3.csv",
+]
+
+
+# Typed columnar store of the rides, sorted by (month, day, hour) so the rides
+# of any hour of a day are a contiguous slice of the columns
+class RideStore:
+    def __init__(self, lat, lon, hour, offsets):
+        self.lat = lat  # float32
+        self.lon = lon  # float32
+        self.hour = hour  # uint8
+        # rides of (month, day, hour) are rows offsets[k]:offsets[k + 1]
+        # where k is the flat index of (month, day, hour)
+        self.offsets = offsets
+        # number of rides of each (month, day, hour)
+        self.counts = (
+            np.diff(offsets).astype(np.uint32).reshape(N_MONTHS, N_DAYS, N_HOURS)
+        )
+
+    # Builds the store from csv files with "Date/Time", "Lat" and "Lon" columns
+    @classmethod
+    def from_csv(cls, paths):
+        df = pd.concat(
+            [
+                pd.read_csv(
+                    path,
+                    usecols=["Date/Time", "Lat", "Lon"],
+                    dtype={"Lat": np.float32, "Lon": np.float32},
+                )
+                for path in paths
+            ],
+            axis=0,
+        )
+        time = pd.to_datetime(df["Date/Time"], format="%Y-%m-%d %H:%M")
+        month = (time.dt.month.values - FIRST_MONTH).astype(np.uint8)
+        day = (time.dt.day.values - 1).astype(np.uint8)
+        hour = time.dt.hour.values.astype(np.uint8)
+
+        key = np.ravel_multi_index(
+            (month, day, hour), (N_MONTHS, N_DAYS, N_HOURS)
+        ).astype(np.int32)
+        order = np.argsort(key, kind="mergesort")
+        counts = np.bincount(key, minlength=N_MONTHS * N_DAYS * N_HOURS)
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        return cls(
+            df["Lat"].values[order], df["Lon"].values[order], hour[order], offsets
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(str(path)) as data:
+            return cls(data["lat"], data["lon"], data["hour"], data["offsets"])
+
+    # Saves the store, other workers never see a partially written file
+    def save(self, path):
+        path = pathlib.Path(path)
+        tmp_path = path.with_name(path.name + ".{}.tmp".format(os.getpid()))
+        with open(str(tmp_path), "wb") as f:
+            np.savez(
+                f, lat=self.lat, lon=self.lon, hour=self.hour, offsets=self.offsets
+            )
+        os.replace(str(tmp_path), str(path))
+
+    # Returns the store cached at `cache_path`, building and caching it first
+    # from the csv files if needed
+    @classmethod
+    def cached(cls, cache_path=CACHE_PATH, paths=DATA_URLS):
+        cache_path = pathlib.Path(cache_path)
+        if cache_path.exists():
+            return cls.load(cache_path)
+        store = cls.from_csv(paths)
+        store.save(cache_path)
+        return store
+
+    # Returns (start, stop) rows of each hour of a day, month 0 being April
+    def hour_bounds(self, month, day):
+        first = np.ravel_multi_index((month, day, 0), (N_MONTHS, N_DAYS, N_HOURS))
+        bounds = self.offsets[first : first + N_HOURS + 1]
+        return bounds[:-1], bounds[1:]
+
+    # Returns number of rides of a day within the given hours (all hours if None)
+    def count(self, month, day, hours=None):
+        if hours is None:
+            return int(self.counts[month, day].sum())
+        hours = np.unique(np.asarray(hours, dtype=np.intp))
+        return int(self.counts[month, day, hours].sum())
+
+    # Returns number of rides of each weekday (Monday first) and hour
+    def weekday_hour_counts(self):
+        days = pd.date_range(
+            "2014-{:02d}-01".format(FIRST_MONTH), periods=N_MONTHS, freq="MS"
+        )
+        weekdays = np.full((N_MONTHS, N_DAYS), -1)
+        for month, first in enumerate(days):
+            n_days = first.days_in_month
+            weekdays[month, :n_days] = (first.weekday() + np.arange(n_days)) % 7
+
+        counts = np.zeros((7, N_HOURS), dtype=np.uint64)
+        valid = weekdays >= 0
+        np.add.at(counts, weekdays[valid], self.counts[valid])
+        return counts
+
+    # Returns rows of a day within the given hours (all hours if empty)
+    def select(self, month, day, hours=None):
+        starts, stops = self.hour_bounds(month, day)
+        if not hours:
+            rows = [slice(starts[0], stops[-1])]
+        else:
+            # hours next to each other are merged into one slice
+            rows = []
+            for h in sorted(set(int(h) for h in hours)):
+                if rows and rows[-1].stop == starts[h]:
+                    rows[-1] = slice(rows[-1].start, stops[h])
+                else:
+                    rows.append(slice(starts[h], stops[h]))
+
+        def column(values):
+            if len(rows) == 1:
+                return values[rows[0]]
+            return np.concatenate([values[r] for r in rows])
+
+        return {
+            "Lat": column(self.lat),
+            "Lon": column(self.lon),
+            "Hour": column(self.hour),
+        }
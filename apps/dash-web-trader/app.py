@@ -2,6 +2,7 @@
 import json
 import base64
 import datetime
+import uuid
 import requests
 import pathlib
 import math
@@ -10,12 +11,19 @@ import flask
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
+import dash_table
 import plotly.plotly as py
 import plotly.graph_objs as go
 
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
 from plotly import tools
 
+from ohlc import OHLCAggregator
+from orders import OrderStore
+from quotes import QuoteSnapshot
+from studies import IndicatorCache, studies as study_registry
+
 
 app = dash.Dash(
     __name__, meta_tags=[{"name": "viewport", "content": "width=device-width"}]
@@ -42,9 +50,37 @@ currency_pair_data = {
     ),
 }
 
+# Tick lookups rely on sorted tick times
+for pair, data in currency_pair_data.items():
+    if not data.index.is_monotonic_increasing:
+        currency_pair_data[pair] = data.sort_index(kind="mergesort")
+
+# Current quote of each currency pair, shared by all sessions
+quote_snapshot = QuoteSnapshot(currency_pair_data)
+
 # Currency pairs
 currencies = ["EURUSD", "USDCHF", "USDJPY", "GBPUSD"]
 
+# Orders of each session, kept on the server
+order_store = OrderStore(currencies)
+
+# OHLC bars for each (currency pair, period), shared by all sessions
+ohlc_aggregators = {}
+
+# Study values for each (currency pair, period, last tick), shared by all sessions
+indicator_cache = IndicatorCache()
+
+
+# Returns OHLC aggregator for currency pair and chart period
+def get_aggregator(currency_pair, period):
+    key = (currency_pair, period)
+    if key not in ohlc_aggregators:
+        ohlc_aggregators[key] = OHLCAggregator(
+            currency_pair_data[currency_pair]["Bid"], period
+        )
+    return ohlc_aggregators[key]
+
+
 # API Requests for news div
 news_requests = requests.get(
     "https://newsapi.org/v2/top-headlines?sources=bbc-news&apiKey=da8e2e705b914f9f86ed2e9692e66012"
@@ -91,12 +127,8 @@ def update_news():
 # Returns dataset for currency pair with nearest datetime to current time
 def first_ask_bid(currency_pair, t):
     t = t.replace(year=2016, month=1, day=5)
-    items = currency_pair_data[currency_pair]
-    dates = items.index.to_pydatetime()
-    index = min(dates, key=lambda x: abs(x - t))
-    df_row = items.loc[index]
-    int_index = items.index.get_loc(index)
-    return [df_row, int_index]  # returns dataset row and index of row
+    # returns dataset row and index of row
+    return quote_snapshot.get(currency_pair, t)
 
 
 # Creates HTML Bid and Ask (Buy/Sell buttons)
@@ -189,11 +221,10 @@ def get_color(a, b):
 # Replace ask_bid row for currency pair with colored values
 def replace_row(currency_pair, index, bid, ask):
     index = index + 1  # index of new data row
-    new_row = (
-        currency_pair_data[currency_pair].iloc[index]
-        if index != len(currency_pair_data[currency_pair])
-        else first_ask_bid(currency_pair, datetime.datetime.now())
-    )  # if not the end of the dataset we retrieve next dataset row
+    if index < len(currency_pair_data[currency_pair]):
+        new_row = currency_pair_data[currency_pair].iloc[index]
+    else:  # end of the dataset, go back to the row nearest to current time
+        new_row, index = first_ask_bid(currency_pair, datetime.datetime.now())
 
     return [
         html.P(
@@ -262,122 +293,24 @@ def get_top_bar(
 
 ####### STUDIES TRACES ######
 
-# Moving average
-def moving_average_trace(df, fig):
-    df2 = df.rolling(window=5).mean()
-    trace = go.Scatter(
-        x=df2.index, y=df2["close"], mode="lines", showlegend=False, name="MA"
-    )
-    fig.append_trace(trace, 1, 1)  # plot in first row
-    return fig
-
-
-# Exponential moving average
-def e_moving_average_trace(df, fig):
-    df2 = df.rolling(window=20).mean()
-    trace = go.Scatter(
-        x=df2.index, y=df2["close"], mode="lines", showlegend=False, name="EMA"
-    )
-    fig.append_trace(trace, 1, 1)  # plot in first row
-    return fig
-
-
-# Bollinger Bands
-def bollinger_trace(df, fig, window_size=10, num_of_std=5):
-    price = df["close"]
-    rolling_mean = price.rolling(window=window_size).mean()
-    rolling_std = price.rolling(window=window_size).std()
-    upper_band = rolling_mean + (rolling_std * num_of_std)
-    lower_band = rolling_mean - (rolling_std * num_of_std)
-
-    trace = go.Scatter(
-        x=df.index, y=upper_band, mode="lines", showlegend=False, name="BB_upper"
-    )
-
-    trace2 = go.Scatter(
-        x=df.index, y=rolling_mean, mode="lines", showlegend=False, name="BB_mean"
-    )
-
-    trace3 = go.Scatter(
-        x=df.index, y=lower_band, mode="lines", showlegend=False, name="BB_lower"
-    )
-
-    fig.append_trace(trace, 1, 1)  # plot in first row
-    fig.append_trace(trace2, 1, 1)  # plot in first row
-    fig.append_trace(trace3, 1, 1)  # plot in first row
-    return fig
-
-
-# Accumulation Distribution
-def accumulation_trace(df):
-    df["volume"] = ((df["close"] - df["low"]) - (df["high"] - df["close"])) / (
-        df["high"] - df["low"]
-    )
-    trace = go.Scatter(
-        x=df.index, y=df["volume"], mode="lines", showlegend=False, name="Accumulation"
-    )
-    return trace
+# Returns one line trace per column of the study values
+def study_lines(values):
+    return [
+        go.Scatter(
+            x=values.index, y=values[name], mode="lines", showlegend=False, name=name
+        )
+        for name in values.columns
+    ]
 
 
-# Commodity Channel Index
-def cci_trace(df, ndays=5):
-    TP = (df["high"] + df["low"] + df["close"]) / 3
-    CCI = pd.Series(
-        (TP - TP.rolling(window=10, center=False).mean())
-        / (0.015 * TP.rolling(window=10, center=False).std()),
-        name="cci",
+# Returns values of a study for currency pair and chart period
+def get_study_values(currency_pair, period, name):
+    aggregator = get_aggregator(currency_pair, period)
+    study = study_registry[name]
+    key = (currency_pair, period, aggregator.stamp, name, study.params)
+    return indicator_cache.get(
+        key, lambda: aggregator.study(name, study.compute, study.lookback)
     )
-    trace = go.Scatter(x=df.index, y=CCI, mode="lines", showlegend=False, name="CCI")
-    return trace
-
-
-# Price Rate of Change
-def roc_trace(df, ndays=5):
-    N = df["close"].diff(ndays)
-    D = df["close"].shift(ndays)
-    ROC = pd.Series(N / D, name="roc")
-    trace = go.Scatter(x=df.index, y=ROC, mode="lines", showlegend=False, name="ROC")
-    return trace
-
-
-# Stochastic oscillator %K
-def stoc_trace(df):
-    SOk = pd.Series((df["close"] - df["low"]) / (df["high"] - df["low"]), name="SO%k")
-    trace = go.Scatter(x=df.index, y=SOk, mode="lines", showlegend=False, name="SO%k")
-    return trace
-
-
-# Momentum
-def mom_trace(df, n=5):
-    M = pd.Series(df["close"].diff(n), name="Momentum_" + str(n))
-    trace = go.Scatter(x=df.index, y=M, mode="lines", showlegend=False, name="MOM")
-    return trace
-
-
-# Pivot points
-def pp_trace(df, fig):
-    PP = pd.Series((df["high"] + df["low"] + df["close"]) / 3)
-    R1 = pd.Series(2 * PP - df["low"])
-    S1 = pd.Series(2 * PP - df["high"])
-    R2 = pd.Series(PP + df["high"] - df["low"])
-    S2 = pd.Series(PP - df["high"] + df["low"])
-    R3 = pd.Series(df["high"] + 2 * (PP - df["low"]))
-    S3 = pd.Series(df["low"] - 2 * (df["high"] - PP))
-    trace = go.Scatter(x=df.index, y=PP, mode="lines", showlegend=False, name="PP")
-    trace1 = go.Scatter(x=df.index, y=R1, mode="lines", showlegend=False, name="R1")
-    trace2 = go.Scatter(x=df.index, y=S1, mode="lines", showlegend=False, name="S1")
-    trace3 = go.Scatter(x=df.index, y=R2, mode="lines", showlegend=False, name="R2")
-    trace4 = go.Scatter(x=df.index, y=S2, mode="lines", showlegend=False, name="S2")
-    trace5 = go.Scatter(x=df.index, y=R3, mode="lines", showlegend=False, name="R3")
-    trace6 = go.Scatter(x=df.index, y=S3, mode="lines", showlegend=False, name="S3")
-    fig.append_trace(trace, 1, 1)
-    fig.append_trace(trace1, 1, 1)
-    fig.append_trace(trace2, 1, 1)
-    fig.append_trace(trace3, 1, 1)
-    fig.append_trace(trace4, 1, 1)
-    fig.append_trace(trace5, 1, 1)
-    fig.append_trace(trace6, 1, 1)
-    return fig
 
 
 # MAIN CHART TRACES (STYLE tab)
@@ -435,6 +368,16 @@ def candlestick_trace(df):
     )
 
 
+# Main chart traces, by name (value of the chart type radio items)
+chart_styles = {
+    "line_trace": line_trace,
+    "area_trace": area_trace,
+    "bar_trace": bar_trace,
+    "colored_bar_trace": colored_bar_trace,
+    "candlestick_trace": candlestick_trace,
+}
+
+
 # For buy/sell modal
 def ask_modal_trace(currency_pair, index):
     df = currency_pair_data[currency_pair].iloc[index - 10 : index]  # returns ten rows
@@ -469,31 +412,19 @@ def get_modal_fig(currency_pair, index):
 
 # Returns graph figure
 def get_fig(currency_pair, ask, bid, type_trace, studies, period):
-    # Get OHLC data
-    data_frame = currency_pair_data[currency_pair]
-    t = datetime.datetime.now()
-    data = data_frame.loc[
-        : t.strftime(
-            "2016-01-05 %H:%M:%S"
-        )  # all the data from the beginning until current time
-    ]
-    data_bid = data["Bid"]
-    df = data_bid.resample(period).ohlc()
-
-    subplot_traces = [  # first row traces
-        "accumulation_trace",
-        "cci_trace",
-        "roc_trace",
-        "stoc_trace",
-        "mom_trace",
-    ]
+    # Get OHLC data, all the data from the beginning until current time
+    aggregator = get_aggregator(currency_pair, period)
+    t = pd.Timestamp(datetime.datetime.now().strftime("2016-01-05 %H:%M:%S"))
+    stop = aggregator.ticks.index.searchsorted(t + pd.Timedelta(seconds=1))
+    df = aggregator.update(stop)
+
     selected_subplots_studies = []
     selected_first_row_studies = []
     row = 1  # number of subplots
 
     if studies:
         for study in studies:
-            if study in subplot_traces:
+            if study_registry[study].subplot:
                 row += 1  # increment number of rows only if the study needs a subplot
                 selected_subplots_studies.append(study)
             else:
@@ -509,17 +440,20 @@ def get_fig(currency_pair, ask, bid, type_trace, studies, period):
     )
 
     # Add main trace (style) to figure
-    fig.append_trace(eval(type_trace)(df), 1, 1)
+    fig.append_trace(chart_styles[type_trace](df), 1, 1)
 
     # Add trace(s) on fig's first row
     for study in selected_first_row_studies:
-        fig = eval(study)(df, fig)
+        values = get_study_values(currency_pair, period, study)
+        for trace in study_lines(values):
+            fig.append_trace(trace, 1, 1)
 
     row = 1
     # Plot trace on new row
     for study in selected_subplots_studies:
         row += 1
-        fig.append_trace(eval(study)(df), row, 1)
+        values = get_study_values(currency_pair, period, study)
+        fig.append_trace(study_lines(values)[0], row, 1)
 
     fig["layout"][
         "uirevision"
@@ -774,135 +708,207 @@ def modal(pair):
     )
 
 
-# Dash App Layout
-app.layout = html.Div(
-    className="row",
-    children=[
-        # Interval component for live clock
-        dcc.Interval(id="interval", interval=1 * 1000, n_intervals=0),
-        # Interval component for ask bid updates
-        dcc.Interval(id="i_bis", interval=1 * 2000, n_intervals=0),
-        # Interval component for graph updates
-        dcc.Interval(id="i_tris", interval=1 * 5000, n_intervals=0),
-        # Interval component for graph updates
-        dcc.Interval(id="i_news", interval=1 * 60000, n_intervals=0),
-        # Left Panel Div
-        html.Div(
-            className="three columns div-left-panel",
-            children=[
-                # Div for Left Panel App Info
-                html.Div(
-                    className="div-info",
-                    children=[
-                        html.Img(
-                            className="logo", src=app.get_asset_url("dash-logo-new.png")
-                        ),
-                        html.H6(className="title-header", children="FOREX TRADER"),
-                        html.P(
-                            """
-                            This app continually queries csv files and updates Ask and Bid prices
-                            for major currency pairs as well as Stock Charts. You can also virtually
-                            buy and sell stocks and see the profit updates.
-                            """
-                        ),
-                    ],
-                ),
-                # Ask Bid Currency Div
-                html.Div(
-                    className="div-currency-toggles",
-                    children=[
-                        html.P(
-                            id="live_clock",
-                            className="three-col",
-                            children=datetime.datetime.now().strftime("%H:%M:%S"),
-                        ),
-                        html.P(className="three-col", children="Bid"),
-                        html.P(className="three-col", children="Ask"),
-                        html.Div(
-                            id="pairs",
-                            className="div-bid-ask",
-                            children=[
-                                get_row(first_ask_bid(pair, datetime.datetime.now()))
-                                for pair in currencies
-                            ],
-                        ),
-                    ],
-                ),
-                # Div for News Headlines
-                html.Div(
-                    className="div-news",
-                    children=[html.Div(id="news", children=update_news())],
-                ),
-            ],
-        ),
-        # Right Panel Div
-        html.Div(
-            className="nine columns div-right-panel",
-            children=[
-                # Top Bar Div - Displays Balance, Equity, ... , Open P/L
-                html.Div(
-                    id="top_bar", className="row div-top-bar", children=get_top_bar()
-                ),
-                # Charts Div
-                html.Div(
-                    id="charts",
-                    className="row",
-                    children=[chart_div(pair) for pair in currencies],
-                ),
-                # Panel for orders
-                html.Div(
-                    id="bottom_panel",
-                    className="row div-bottom-panel",
-                    children=[
-                        html.Div(
-                            className="display-inlineblock",
-                            children=[
-                                dcc.Dropdown(
-                                    id="dropdown_positions",
-                                    className="bottom-dropdown",
-                                    options=[
-                                        {"label": "Open Positions", "value": "open"},
-                                        {
-                                            "label": "Closed Positions",
-                                            "value": "closed",
-                                        },
-                                    ],
-                                    value="open",
-                                    clearable=False,
-                                    style={"border": "0px solid black"},
-                                )
-                            ],
-                        ),
-                        html.Div(
-                            className="display-inlineblock float-right",
-                            children=[
-                                dcc.Dropdown(
-                                    id="closable_orders",
-                                    className="bottom-dropdown",
-                                    placeholder="Close order",
-                                )
-                            ],
-                        ),
-                        html.Div(id="orders_table", className="row table-orders"),
-                    ],
-                ),
-            ],
-        ),
-        # Hidden div that stores all clicked charts (EURUSD, USDCHF, etc.)
-        html.Div(id="charts_clicked", style={"display": "none"}),
-        # Hidden div for each pair that stores orders
-        html.Div(
-            children=[
-                html.Div(id=pair + "orders", style={"display": "none"})
-                for pair in currencies
-            ]
-        ),
-        html.Div([modal(pair) for pair in currencies]),
-        # Hidden Div that stores all orders
-        html.Div(id="orders", style={"display": "none"}),
+PROFIT_GRADIENT = "to bottom, rgba(0,255,0,0), rgba(0,255,0,1)"
+LOSS_GRADIENT = "to bottom, rgba(255,0,0,0), rgba(255,0,0,1)"
+
+# Orders Table, its rows are updated in the browser with the changed orders
+orders_table = dash_table.DataTable(
+    id="orders_table",
+    columns=[
+        {"name": name, "id": column}
+        for name, column in [
+            ("Order Id", "id"),
+            ("Time", "time"),
+            ("Type", "type"),
+            ("Volume", "volume"),
+            ("Symbol", "symbol"),
+            ("TP", "tp"),
+            ("SL", "sl"),
+            ("Price", "price"),
+            ("Profit", "profit"),
+            ("Status", "status"),
+            ("Close Time", "close Time"),
+            ("Close Price", "close Price"),
+        ]
+    ],
+    data=[],
+    style_as_list_view=True,
+    style_header={"backgroundColor": "#22252b", "fontWeight": "bold"},
+    style_cell={
+        "backgroundColor": "#22252b",
+        "color": "#686868",
+        "textAlign": "left",
+        "padding": "12px",
+    },
+    # Color row based on profitability of order, as the profit and no-profit
+    # classes of style.css
+    style_data={"background": "linear-gradient(%s)" % PROFIT_GRADIENT},
+    style_data_conditional=[
+        {
+            "if": {"filter_query": '{profit} contains "-"'},
+            "background": "linear-gradient(%s)" % LOSS_GRADIENT,
+        }
     ],
 )
 
+
+# Dash App Layout
+def serve_layout():
+    # Generates a session ID
+    session_id = str(uuid.uuid4())
+
+    return html.Div(
+        className="row",
+        children=[
+            # Interval component for live clock
+            dcc.Interval(id="interval", interval=1 * 1000, n_intervals=0),
+            # Interval component for ask bid updates
+            dcc.Interval(id="i_bis", interval=1 * 2000, n_intervals=0),
+            # Interval component for graph updates
+            dcc.Interval(id="i_tris", interval=1 * 5000, n_intervals=0),
+            # Interval component for graph updates
+            dcc.Interval(id="i_news", interval=1 * 60000, n_intervals=0),
+            # Left Panel Div
+            html.Div(
+                className="three columns div-left-panel",
+                children=[
+                    # Div for Left Panel App Info
+                    html.Div(
+                        className="div-info",
+                        children=[
+                            html.Img(
+                                className="logo",
+                                src=app.get_asset_url("dash-logo-new.png"),
+                            ),
+                            html.H6(className="title-header", children="FOREX TRADER"),
+                            html.P(
+                                """
+                                This app continually queries csv files and updates Ask and Bid prices
+                                for major currency pairs as well as Stock Charts. You can also virtually
+                                buy and sell stocks and see the profit updates.
+                                """
+                            ),
+                        ],
+                    ),
+                    # Ask Bid Currency Div
+                    html.Div(
+                        className="div-currency-toggles",
+                        children=[
+                            html.P(
+                                id="live_clock",
+                                className="three-col",
+                                children=datetime.datetime.now().strftime("%H:%M:%S"),
+                            ),
+                            html.P(className="three-col", children="Bid"),
+                            html.P(className="three-col", children="Ask"),
+                            html.Div(
+                                id="pairs",
+                                className="div-bid-ask",
+                                children=[
+                                    get_row(
+                                        first_ask_bid(pair, datetime.datetime.now())
+                                    )
+                                    for pair in currencies
+                                ],
+                            ),
+                        ],
+                    ),
+                    # Div for News Headlines
+                    html.Div(
+                        className="div-news",
+                        children=[html.Div(id="news", children=update_news())],
+                    ),
+                ],
+            ),
+            # Right Panel Div
+            html.Div(
+                className="nine columns div-right-panel",
+                children=[
+                    # Top Bar Div - Displays Balance, Equity, ... , Open P/L
+                    html.Div(
+                        id="top_bar",
+                        className="row div-top-bar",
+                        children=get_top_bar(),
+                    ),
+                    # Charts Div
+                    html.Div(
+                        id="charts",
+                        className="row",
+                        children=[chart_div(pair) for pair in currencies],
+                    ),
+                    # Panel for orders
+                    html.Div(
+                        id="bottom_panel",
+                        className="row div-bottom-panel",
+                        children=[
+                            html.Div(
+                                className="display-inlineblock",
+                                children=[
+                                    dcc.Dropdown(
+                                        id="dropdown_positions",
+                                        className="bottom-dropdown",
+                                        options=[
+                                            {
+                                                "label": "Open Positions",
+                                                "value": "open",
+                                            },
+                                            {
+                                                "label": "Closed Positions",
+                                                "value": "closed",
+                                            },
+                                        ],
+                                        value="open",
+                                        clearable=False,
+                                        style={"border": "0px solid black"},
+                                    )
+                                ],
+                            ),
+                            html.Div(
+                                className="display-inlineblock float-right",
+                                children=[
+                                    dcc.Dropdown(
+                                        id="closable_orders",
+                                        className="bottom-dropdown",
+                                        placeholder="Close order",
+                                    )
+                                ],
+                            ),
+                            html.Div(
+                                className="row table-orders",
+                                children=[
+                                    orders_table,
+                                    html.Div(
+                                        id="orders_table_empty",
+                                        className="text-center table-orders-empty",
+                                    ),
+                                ],
+                            ),
+                        ],
+                    ),
+                ],
+            ),
+            # Hidden div that stores all clicked charts (EURUSD, USDCHF, etc.)
+            html.Div(id="charts_clicked", style={"display": "none"}),
+            # Hidden div for each pair that stores id of its last order
+            html.Div(
+                children=[
+                    html.Div(id=pair + "orders", style={"display": "none"})
+                    for pair in currencies
+                ]
+            ),
+            html.Div([modal(pair) for pair in currencies]),
+            # Hidden Div that stores the orders changed since the table version
+            html.Div(id="orders", style={"display": "none"}),
+            # Version of the order book and status of the orders in the table
+            dcc.Store(id="orders_table_version"),
+            # Session ID, orders are stored on the server for each session
+            html.Div(session_id, id="session-id", style={"display": "none"}),
+        ],
+    )
+
+
+app.layout = serve_layout
+
 # Dynamic Callbacks
 
 # Replace currency pair row
@@ -1050,123 +1056,56 @@ def generate_modal_figure_callback(pair):
     return figure_modal
 
 
-# Function updates the pair orders div
+# Function adds an order to the session order book and updates the pair orders div
 def generate_order_button_callback(pair):
-    def order_callback(n, vol, type_order, sl, tp, pair_orders, ask, bid):
+    def order_callback(n, vol, type_order, sl, tp, ask, bid, session_id):
         if n > 0:
             t = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            l = [] if pair_orders is None else json.loads(pair_orders)
             price = bid if type_order == "sell" else ask
 
-            if tp != 0:
-                tp = (
-                    price + tp * 0.001
-                    if tp != 0 and pair[3:] == "JPY"
-                    else price + tp * 0.00001
-                )
+            if tp:
+                tp = price + tp * 0.001 if pair[3:] == "JPY" else price + tp * 0.00001
 
-            if sl != 0:
+            if sl:
                 sl = price - sl * 0.001 if pair[3:] == "JPY" else price + sl * 0.00001
 
-            order = {
-                "id": pair + str(len(l)),
-                "time": t,
-                "type": type_order,
-                "volume": vol,
-                "symbol": pair,
-                "tp": tp,
-                "sl": sl,
-                "price": price,
-                "profit": 0.00,
-                "status": "open",
-            }
-            l.append(order)
+            book = order_store.get(session_id)
+            return book.add(t, type_order, vol, pair, tp, sl, price)
 
-            return json.dumps(l)
-
-        return json.dumps([])
+        return None
 
     return order_callback
 
 
-# Function to update orders
-def update_orders(orders, current_bids, current_asks, id_to_close):
-    for order in orders:
-        if order["status"] == "open":
-            type_order = order["type"]
-            current_bid = current_bids[currencies.index(order["symbol"])]
-            current_ask = current_asks[currencies.index(order["symbol"])]
-
-            profit = (
-                order["volume"]
-                * 100000
-                * ((current_bid - order["price"]) / order["price"])
-                if type_order == "buy"
-                else (
-                    order["volume"]
-                    * 100000
-                    * ((order["price"] - current_ask) / order["price"])
-                )
-            )
-
-            order["profit"] = "%.2f" % profit
-            price = current_bid if order["type"] == "buy" else current_ask
-
-            if order["id"] == id_to_close:
-                order["status"] = "closed"
-                order["close Time"] = datetime.datetime.now().strftime(
-                    "%Y-%m-%d %H:%M:%S"
-                )
-                order["close Price"] = price
-
-            if order["tp"] != 0 and price >= order["tp"]:
-                order["status"] = "closed"
-                order["close Time"] = datetime.datetime.now().strftime(
-                    "%Y-%m-%d %H:%M:%S"
-                )
-                order["close Price"] = price
-
-            if order["sl"] != 0 and order["sl"] >= price:
-                order["status"] = "closed"
-                order["close Time"] = datetime.datetime.now().strftime(
-                    "%Y-%m-%d %H:%M:%S"
-                )
-                order["close Price"] = price
-    return orders
-
-
-# Function to update orders div
+# Function to update orders div with the rows of the orders changed since the
+# version of the order book the table shows, or all the rows of the status shown
+# if the table shows another status. The table merges them in the browser, so a
+# missed update is caught up by the next one.
 def generate_update_orders_div_callback():
     def update_orders_callback(*args):
-        orders = []
-        current_orders = args[-1]
-        close_id = args[-2]
-        args = args[:-2]  # contains list of orders for each pair + asks + bids
-        len_args = len(args)
-        current_bids = args[len_args // 3 : 2 * len_args]
-        current_asks = args[2 * len_args // 3 : len_args]
-        args = args[: len_args // 3]
-        ids = []
-
-        if current_orders is not None:
-            orders = json.loads(current_orders)
-            for order in orders:
-                ids.append(
-                    order["id"]  # ids that allready have been added to current orders
-                )
+        session_id = args[-1]
+        table_version = args[-2]
+        position = args[-3]
+        close_id = args[-4]
+        n = len(currencies)
+        current_bids = args[n : 2 * n]
+        current_asks = args[2 * n : 3 * n]
 
-        for list_order in args:  # each currency pair has its list of orders
-            if list_order != "[]":
-                list_order = json.loads(list_order)
-                for order in list_order:
-                    if order["id"] not in ids:  # only add new orders
-                        orders.append(order)
-        if len(orders) == 0:
-            return None
+        book = order_store.get(session_id)
 
         # we update status and profit of orders
-        orders = update_orders(orders, current_bids, current_asks, close_id)
-        return json.dumps(orders)
+        t = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        book.update(current_bids, current_asks, t, close_id)
+
+        if table_version is None or table_version["status"] != position:
+            full, rows = True, book.rows(position)
+        elif table_version["version"] == book.version:
+            raise PreventUpdate
+        else:
+            full, rows = False, book.rows_since(table_version["version"])
+        return json.dumps(
+            {"version": book.version, "status": position, "full": full, "rows": rows}
+        )
 
     return update_orders_callback
 
@@ -1323,9 +1262,9 @@ for pair in currencies:
             State(pair + "trade_type", "value"),
             State(pair + "SL", "value"),
             State(pair + "TP", "value"),
-            State(pair + "orders", "children"),
             State(pair + "ask", "children"),
             State(pair + "bid", "children"),
+            State("session-id", "children"),
         ],
     )(generate_order_button_callback(pair))
 
@@ -1342,69 +1281,33 @@ app.callback(
     [Input(pair + "orders", "children") for pair in currencies]
     + [Input(pair + "bid", "children") for pair in currencies]
     + [Input(pair + "ask", "children") for pair in currencies]
-    + [Input("closable_orders", "value")],
-    [State("orders", "children")],
+    + [Input("closable_orders", "value"), Input("dropdown_positions", "value")],
+    [State("orders_table_version", "data"), State("session-id", "children")],
 )(generate_update_orders_div_callback())
 
-# Callback to update Orders Table
-@app.callback(
-    Output("orders_table", "children"),
-    [Input("orders", "children"), Input("dropdown_positions", "value")],
+# Merges the changed orders into the Orders Table, in the browser
+app.clientside_callback(
+    ClientsideFunction(namespace="orders", function_name="update_table"),
+    [
+        Output("orders_table", "data"),
+        Output("orders_table_version", "data"),
+        Output("orders_table_empty", "children"),
+    ],
+    [Input("orders", "children")],
+    [State("orders_table", "data")],
 )
-def update_order_table(orders, position):
-    headers = [
-        "Order Id",
-        "Time",
-        "Type",
-        "Volume",
-        "Symbol",
-        "TP",
-        "SL",
-        "Price",
-        "Profit",
-        "Status",
-        "Close Time",
-        "Close Price",
-    ]
-
-    # If there are no orders
-    if orders is None or orders is "[]":
-        return [
-            html.Table(html.Tr(children=[html.Th(title) for title in headers])),
-            html.Div(
-                className="text-center table-orders-empty",
-                children=[html.P("No " + position + " positions data row")],
-            ),
-        ]
-
-    rows = []
-    list_order = json.loads(orders)
-    for order in list_order:
-        tr_childs = []
-        for attr in order:
-            if str(order["status"]) == position:
-                tr_childs.append(html.Td(order[attr]))
-        # Color row based on profitability of order
-        if float(order["profit"]) >= 0:
-            rows.append(html.Tr(className="profit", children=tr_childs))
-        else:
-            rows.append(html.Tr(className="no-profit", children=tr_childs))
-
-    return html.Table(children=[html.Tr([html.Th(title) for title in headers])] + rows)
 
 
 # Update Options in dropdown for Open and Close positions
-@app.callback(Output("dropdown_positions", "options"), [Input("orders", "children")])
-def update_positions_dropdown(orders):
-    closeOrders = 0
-    openOrders = 0
-    if orders is not None:
-        orders = json.loads(orders)
-        for order in orders:
-            if order["status"] == "closed":
-                closeOrders += 1
-            if order["status"] == "open":
-                openOrders += 1
+@app.callback(
+    Output("dropdown_positions", "options"),
+    [Input("orders", "children")],
+    [State("session-id", "children")],
+)
+def update_positions_dropdown(orders, session_id):
+    book = order_store.get(session_id)
+    closeOrders = book.count("closed")
+    openOrders = book.count("open")
     return [
         {"label": "Open positions (" + str(openOrders) + ")", "value": "open"},
         {"label": "Closed positions (" + str(closeOrders) + ")", "value": "closed"},
@@ -1412,38 +1315,28 @@ def update_positions_dropdown(orders):
 
 
 # Callback to close orders from dropdown options
-@app.callback(Output("closable_orders", "options"), [Input("orders", "children")])
-def update_close_dropdown(orders):
-    options = []
-    if orders is not None:
-        orders = json.loads(orders)
-        for order in orders:
-            if order["status"] == "open":
-                options.append({"label": order["id"], "value": order["id"]})
-    return options
+@app.callback(
+    Output("closable_orders", "options"),
+    [Input("orders", "children")],
+    [State("session-id", "children")],
+)
+def update_close_dropdown(orders, session_id):
+    open_ids = order_store.get(session_id).ids_by_status("open")
+    return [{"label": order_id, "value": order_id} for order_id in open_ids]
 
 
 # Callback to update Top Bar values
-@app.callback(Output("top_bar", "children"), [Input("orders", "children")])
-def update_top_bar(orders):
-    if orders is None or orders is "[]":
+@app.callback(
+    Output("top_bar", "children"),
+    [Input("orders", "children")],
+    [State("session-id", "children")],
+)
+def update_top_bar(orders, session_id):
+    book = order_store.get(session_id)
+    if book.size == 0:
         return get_top_bar()
 
-    orders = json.loads(orders)
-    open_pl = 0
-    balance = 50000
-    free_margin = 50000
-    margin = 0
-
-    for order in orders:
-        if order["status"] == "open":
-            open_pl += float(order["profit"])
-            conversion_price = (
-                1 if order["symbol"][:3] == "USD" else float(order["price"])
-            )
-            margin += (float(order["volume"]) * 100000) / (200 * conversion_price)
-        else:
-            balance += float(order["profit"])
+    balance, open_pl, margin = book.account()
 
     equity = balance - open_pl
     free_margin = equity - margin
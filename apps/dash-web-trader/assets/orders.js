@@ -0,0 +1,31 @@
+/* merge the orders changed on the server into the orders table */
+
+if(!window.dash_clientside) {window.dash_clientside = {};}
+window.dash_clientside.orders = {
+    update_table: function (orders, data) {
+        if (!orders) {
+            return [[], null, ""];
+        }
+        var update = JSON.parse(orders);
+        var rows = update.full ? [] : (data || []).slice();
+        var index = {};
+        rows.forEach(function (row, i) {
+            index[row.id] = i;
+        });
+        update.rows.forEach(function (row) {
+            if (row.id in index) {
+                rows[index[row.id]] = row;
+            } else {
+                index[row.id] = rows.length;
+                rows.push(row);
+            }
+        });
+        // orders that changed status leave the table
+        rows = rows.filter(function (row) {
+            return row.status === update.status;
+        });
+        var version = {version: update.version, status: update.status};
+        var empty = rows.length ? "" : "No " + update.status + " positions data row";
+        return [rows, version, empty];
+    }
+}
@@ -0,0 +1,108 @@
+# Micro-benchmark of the chart studies on a full trading day of ticks.
+#
+# For each study, compares the time of one chart refresh when resampling all
+# ticks since midnight (previous get_fig) with the incremental OHLC aggregator,
+# and with a hit in the indicator cache shared by sessions, for the same
+# refreshes computed beforehand.
+#
+# Usage: python benchmark.py [path/to/ticks.csv]
+import sys
+import pathlib
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from ohlc import OHLCAggregator
+from studies import IndicatorCache, studies
+
+PATH = pathlib.Path(__file__).parent
+DATA_PATH = PATH.joinpath("data").resolve()
+
+PERIODS = ["5Min", "15Min", "30Min"]
+REFRESH = pd.Timedelta(seconds=5)  # i_tris interval
+N_REFRESH = 100
+
+
+# Returns Bid ticks of a csv file, or a random walk with one tick every 0.5s
+def load_ticks(path=None):
+    if path is not None and pathlib.Path(path).exists():
+        df = pd.read_csv(path, index_col=1, parse_dates=["Date"])
+        return df["Bid"].sort_index(kind="mergesort")
+
+    n = 2 * 24 * 3600
+    rng = np.random.RandomState(0)
+    offsets = np.sort(rng.uniform(0, 24 * 3600, n))
+    index = pd.Timestamp("2016-01-05") + pd.to_timedelta(offsets, unit="s")
+    return pd.Series(1.08 + np.cumsum(rng.normal(0, 1e-5, n)), index=index)
+
+
+# Returns average time in ms of `func` called with each of `stops`
+def time_refreshes(func, stops):
+    start = timeit.default_timer()
+    for stop in stops:
+        func(stop)
+    return 1000 * (timeit.default_timer() - start) / len(stops)
+
+
+def main(path=None):
+    ticks = load_ticks(path or DATA_PATH.joinpath("EURUSD.csv"))
+    print("{} ticks from {} to {}".format(len(ticks), ticks.index[0], ticks.index[-1]))
+
+    # refreshes at the end of the trading day, every 5 seconds
+    end = ticks.index[-1]
+    times = [end - REFRESH * i for i in range(N_REFRESH, 0, -1)]
+    stops = ticks.index.searchsorted(times)
+
+    print(
+        "{:<24}{:>8}{:>14}{:>14}{:>14}".format(
+            "study", "period", "full (ms)", "incr. (ms)", "cached (ms)"
+        )
+    )
+    for period in PERIODS:
+        for name, study in studies.items():
+
+            def full(stop):
+                study.compute(ticks.iloc[:stop].resample(period).ohlc())
+
+            aggregator = OHLCAggregator(ticks, period)
+            aggregator.update(stops[0] - 1)
+            aggregator.study(name, study.compute, study.lookback)
+
+            def incremental(stop):
+                aggregator.update(stop)
+                aggregator.study(name, study.compute, study.lookback)
+
+            # refresh of a session for bars another session already advanced
+            # (key of get_study_values in app.py), the cache is warmed by a
+            # first pass over the refreshes
+            cache = IndicatorCache()
+            shared = OHLCAggregator(ticks, period)
+            shared.update(stops[0] - 1)
+
+            def compute(stop):
+                shared.update(stop)
+                return shared.study(name, study.compute, study.lookback)
+
+            def cached(stop):
+                # stamp of the bars with the ticks up to `stop`
+                key = (period, ticks.index[stop - 1], name, study.params)
+                cache.get(key, lambda: compute(stop))
+
+            time_refreshes(cached, stops)
+            warm_hits = cache.hits
+
+            print(
+                "{:<24}{:>8}{:>14.3f}{:>14.3f}{:>14.4f}".format(
+                    name,
+                    period,
+                    time_refreshes(full, stops),
+                    time_refreshes(incremental, stops),
+                    time_refreshes(cached, stops),
+                )
+            )
+            assert cache.hits - warm_hits == len(stops)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
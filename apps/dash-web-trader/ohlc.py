@@ -0,0 +1,84 @@
+import threading
+
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+
+# Incrementally resamples a tick series into OHLC bars.
+#
+# Finished bars are kept as they are; only the ticks belonging to the bar that
+# is still open are resampled again when new ticks arrive. Studies registered
+# with `study` keep their values for finished bars and only compute the tail.
+class OHLCAggregator:
+    def __init__(self, ticks, period):
+        self.ticks = ticks  # Bid series indexed by tick time
+        self.period = period
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._closed = self.ticks.iloc[:0].resample(self.period).ohlc()
+        self._bars = self._closed
+        self._open_start = 0  # position of first tick of the open bar
+        self._open_end = None  # end time of the open bar
+        self._pos = 0  # number of ticks folded into the bars
+        self._studies = {}
+
+    @property
+    def n_closed(self):
+        return len(self._closed)
+
+    # Timestamp of the last tick folded into the bars, identifies bar state
+    @property
+    def stamp(self):
+        if self._pos == 0:
+            return None
+        return self.ticks.index[self._pos - 1]
+
+    # Returns all bars with ticks up to position `stop` (exclusive)
+    def update(self, stop):
+        with self.lock:
+            if stop < self._open_start:
+                # clock went back past the open bar (new day), start over
+                self.reset()
+            if stop <= self._pos:
+                # a concurrent session already advanced the bars
+                return self._bars
+
+            new_ticks = self.ticks.iloc[self._pos : stop]
+            if self._open_end is not None and new_ticks.index[-1] < self._open_end:
+                # new ticks all fall in the open bar, only update its last row
+                prices = new_ticks.values
+                values = self._bars.values.copy()
+                values[-1, 1] = max(values[-1, 1], prices.max())
+                values[-1, 2] = min(values[-1, 2], prices.min())
+                values[-1, 3] = prices[-1]
+                self._bars = pd.DataFrame(
+                    values, index=self._bars.index, columns=self._bars.columns
+                )
+            else:
+                chunk = self.ticks.iloc[self._open_start : stop].resample(self.period)
+                chunk = chunk.ohlc()
+                self._closed = pd.concat([self._closed, chunk.iloc[:-1]])
+                self._bars = pd.concat([self._closed, chunk.iloc[-1:]])
+                self._open_start = self.ticks.index.searchsorted(chunk.index[-1])
+                self._open_end = chunk.index[-1] + to_offset(self.period)
+            self._pos = stop
+            return self._bars
+
+    # Returns the study computed by `func` over the current bars.
+    # `lookback` is the number of previous bars a value depends on.
+    def study(self, name, func, lookback):
+        with self.lock:
+            bars = self._bars
+            n_closed = len(self._closed)
+            values = self._studies.get(name)
+            done = 0 if values is None else len(values)
+
+            start = max(0, done - lookback)
+            tail = func(bars.iloc[start:]).iloc[done - start :]
+            result = tail if values is None else pd.concat([values, tail])
+
+            # values of finished bars won't change anymore
+            self._studies[name] = result.iloc[:n_closed]
+            return result
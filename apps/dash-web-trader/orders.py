@@ -0,0 +1,199 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+# Orders of one session held as columnar arrays.
+#
+# Profits and SL/TP triggers of all open orders are computed in a single NumPy
+# pass per quote update. `version` is incremented whenever displayed values
+# change, and each row records the version it last changed at, so the rows
+# changed since any version the browser has can be sent.
+class OrderBook:
+    def __init__(self, currencies, capacity=64):
+        self.currencies = currencies
+        self.lock = threading.Lock()
+        self.size = 0
+        self.version = 0  # incremented whenever displayed rows change
+        self.ids = []
+        self.times = []
+        self.close_times = {}  # row: close time
+        self.symbol = np.zeros(capacity, dtype=np.int8)  # index in currencies
+        self.side = np.zeros(capacity, dtype=np.int8)  # 1 buy, -1 sell
+        self.volume = np.zeros(capacity)
+        self.price = np.zeros(capacity)
+        self.sl = np.zeros(capacity)
+        self.tp = np.zeros(capacity)
+        self.profit = np.zeros(capacity)
+        self.open = np.zeros(capacity, dtype=bool)
+        self.close_price = np.full(capacity, np.nan)
+        self.changed_at = np.zeros(capacity, dtype=np.int64)  # version
+
+    def _grow(self):
+        for name in (
+            "symbol",
+            "side",
+            "volume",
+            "price",
+            "sl",
+            "tp",
+            "profit",
+            "open",
+            "close_price",
+            "changed_at",
+        ):
+            column = getattr(self, name)
+            extra = np.zeros_like(column)
+            if name == "close_price":
+                extra[:] = np.nan
+            setattr(self, name, np.concatenate([column, extra]))
+
+    # Adds an open order and returns its id
+    def add(self, time, type_order, volume, symbol, tp, sl, price):
+        with self.lock:
+            return self._add(time, type_order, volume, symbol, tp, sl, price)
+
+    def _add(self, time, type_order, volume, symbol, tp, sl, price):
+        if self.size == len(self.symbol):
+            self._grow()
+
+        i = self.size
+        symbol_code = self.currencies.index(symbol)
+        order_id = symbol + str(np.count_nonzero(self.symbol[:i] == symbol_code))
+        self.ids.append(order_id)
+        self.times.append(time)
+        self.symbol[i] = symbol_code
+        self.side[i] = 1 if type_order == "buy" else -1
+        self.volume[i] = volume or 0
+        self.price[i] = price
+        self.sl[i] = sl or 0
+        self.tp[i] = tp or 0
+        self.profit[i] = 0
+        self.open[i] = True
+        self.version += 1
+        self.changed_at[i] = self.version
+        self.size += 1
+        return order_id
+
+    # Updates open orders with current quotes and closes the ones hitting
+    # their SL/TP or `id_to_close`. Returns the number of changed orders, and
+    # bumps `version` if there are any.
+    def update(self, bids, asks, time, id_to_close=None):
+        with self.lock:
+            return self._update(bids, asks, time, id_to_close)
+
+    def _update(self, bids, asks, time, id_to_close):
+        n = self.size
+        is_open = self.open[:n].copy()
+        symbol = self.symbol[:n]
+        buy = self.side[:n] == 1
+        price = self.price[:n]
+
+        bids = np.asarray(bids, dtype=float)
+        asks = np.asarray(asks, dtype=float)
+        current_price = np.where(buy, bids[symbol], asks[symbol])
+        profit = self.volume[:n] * 100000 * self.side[:n] * (current_price - price)
+        profit /= price
+        old_profit = np.round(self.profit[:n], 2)
+        self.profit[:n] = np.where(is_open, profit, self.profit[:n])
+
+        closing = (self.tp[:n] != 0) & (current_price >= self.tp[:n])
+        closing |= (self.sl[:n] != 0) & (self.sl[:n] >= current_price)
+        if id_to_close in self.ids:
+            closing[self.ids.index(id_to_close)] = True
+        closing &= is_open
+
+        for i in np.flatnonzero(closing):
+            self.close_times[i] = time
+        self.close_price[:n][closing] = current_price[closing]
+        self.open[:n][closing] = False
+
+        changed = closing | is_open & (np.round(self.profit[:n], 2) != old_profit)
+        n_changed = int(np.count_nonzero(changed))
+        if n_changed:
+            self.version += 1
+            self.changed_at[:n][changed] = self.version
+        return n_changed
+
+    # Returns order at row i as a dict of displayed values
+    def row(self, i):
+        row = {
+            "id": self.ids[i],
+            "time": self.times[i],
+            "type": "buy" if self.side[i] == 1 else "sell",
+            "volume": self.volume[i],
+            "symbol": self.currencies[self.symbol[i]],
+            "tp": self.tp[i],
+            "sl": self.sl[i],
+            "price": self.price[i],
+            # + 0.0, losses under half a cent show as 0.00, not -0.00
+            "profit": "%.2f" % (round(self.profit[i], 2) + 0.0),
+            "status": "open" if self.open[i] else "closed",
+        }
+        if not self.open[i]:
+            row["close Time"] = self.close_times[i]
+            row["close Price"] = self.close_price[i]
+        return row
+
+    # Returns rows of orders with given status ("open" or "closed")
+    def rows(self, status):
+        mask = self.open[: self.size] == (status == "open")
+        return [self.row(i) for i in np.flatnonzero(mask)]
+
+    # Returns rows of orders whose displayed values changed after `version`
+    def rows_since(self, version):
+        changed = self.changed_at[: self.size] > version
+        return [self.row(i) for i in np.flatnonzero(changed)]
+
+    def ids_by_status(self, status):
+        mask = self.open[: self.size] == (status == "open")
+        return [self.ids[i] for i in np.flatnonzero(mask)]
+
+    def count(self, status):
+        return int(np.count_nonzero(self.open[: self.size] == (status == "open")))
+
+    # Returns balance, open P/L and margin of the account
+    def account(self, balance=50000):
+        n = self.size
+        is_open = self.open[:n]
+        usd_base = np.array([c[:3] == "USD" for c in self.currencies])[self.symbol[:n]]
+        conversion_price = np.where(usd_base, 1, self.price[:n])
+        margin = (self.volume[:n] * 100000) / (200 * conversion_price)
+        return (
+            balance + self.profit[:n][~is_open].sum(),
+            self.profit[:n][is_open].sum(),
+            margin[is_open].sum(),
+        )
+
+
+# Order books keyed by session id, least recently used sessions are dropped
+# once there are more than `max_sessions`. Orders only live in memory: the
+# open positions of a dropped session are lost, and a warning is logged.
+class OrderStore:
+    def __init__(self, currencies, max_sessions=1000):
+        self.currencies = currencies
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+        self._books = OrderedDict()
+
+    def get(self, session_id):
+        with self.lock:
+            book = self._books.get(session_id)
+            if book is None:
+                book = self._books[session_id] = OrderBook(self.currencies)
+                if len(self._books) > self.max_sessions:
+                    dropped_id, dropped = self._books.popitem(last=False)
+                    n_open = dropped.count("open")
+                    if n_open:
+                        logger.warning(
+                            "Dropped session %s with %d open orders",
+                            dropped_id,
+                            n_open,
+                        )
+            else:
+                self._books.move_to_end(session_id)
+            return book
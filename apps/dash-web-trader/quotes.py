@@ -0,0 +1,44 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+# Sorted tick times of a currency pair as int64 nanoseconds
+class TickIndex:
+    def __init__(self, index):
+        self.times = np.asarray(index.values, dtype="datetime64[ns]").view("int64")
+
+    # Returns position of the tick nearest to t
+    def nearest(self, t):
+        t = pd.Timestamp(t).value
+        i = int(np.searchsorted(self.times, t))
+        if i == 0:
+            return 0
+        if i == len(self.times):
+            return i - 1
+        # on a tie the earlier tick wins
+        return i - 1 if t - self.times[i - 1] <= self.times[i] - t else i
+
+
+# Current quote of each currency pair, looked up once per second and shared
+# by every session
+class QuoteSnapshot:
+    def __init__(self, data):
+        self.data = data
+        self.indexes = {pair: TickIndex(df.index) for pair, df in data.items()}
+        self.lock = threading.Lock()
+        self._quotes = {}  # pair: (second, [row, position])
+
+    # Returns [row, position] of the tick nearest to t for currency pair
+    def get(self, currency_pair, t):
+        second = pd.Timestamp(t).floor("s")
+        cached = self._quotes.get(currency_pair)
+        if cached is not None and cached[0] == second:
+            return cached[1]
+
+        with self.lock:
+            position = self.indexes[currency_pair].nearest(second)
+            quote = [self.data[currency_pair].iloc[position], position]
+            self._quotes[currency_pair] = (second, quote)
+        return quote
@@ -0,0 +1,132 @@
+import threading
+from collections import OrderedDict, namedtuple
+from functools import partial
+
+import pandas as pd
+
+
+# A study computed from the OHLC bars. `lookback` is the number of previous bars
+# a value depends on, `subplot` tells if the study is drawn on its own row.
+Study = namedtuple("Study", ["compute", "lookback", "subplot", "params"])
+
+# Registered studies, by name (value of the studies checklist)
+studies = {}
+
+
+# Registers decorated function as study `name`, called with `params`
+def register_study(name, lookback, subplot=False, **params):
+    def decorator(func):
+        studies[name] = Study(
+            partial(func, **params), lookback, subplot, tuple(sorted(params.items()))
+        )
+        return func
+
+    return decorator
+
+
+# Moving average
+@register_study("moving_average_trace", lookback=5, window=5)
+def moving_average(df, window):
+    return pd.DataFrame({"MA": df["close"].rolling(window=window).mean()})
+
+
+# Exponential moving average
+@register_study("e_moving_average_trace", lookback=20, window=20)
+def e_moving_average(df, window):
+    return pd.DataFrame({"EMA": df["close"].rolling(window=window).mean()})
+
+
+# Bollinger Bands
+@register_study("bollinger_trace", lookback=10, window_size=10, num_of_std=5)
+def bollinger(df, window_size, num_of_std):
+    price = df["close"]
+    rolling_mean = price.rolling(window=window_size).mean()
+    rolling_std = price.rolling(window=window_size).std()
+    upper_band = rolling_mean + (rolling_std * num_of_std)
+    lower_band = rolling_mean - (rolling_std * num_of_std)
+    return pd.DataFrame(
+        {"BB_upper": upper_band, "BB_mean": rolling_mean, "BB_lower": lower_band}
+    )
+
+
+# Accumulation Distribution
+@register_study("accumulation_trace", lookback=0, subplot=True)
+def accumulation(df):
+    volume = ((df["close"] - df["low"]) - (df["high"] - df["close"])) / (
+        df["high"] - df["low"]
+    )
+    return pd.DataFrame({"Accumulation": volume})
+
+
+# Commodity Channel Index
+@register_study("cci_trace", lookback=10, subplot=True, window=10)
+def cci(df, window):
+    TP = (df["high"] + df["low"] + df["close"]) / 3
+    CCI = (TP - TP.rolling(window=window, center=False).mean()) / (
+        0.015 * TP.rolling(window=window, center=False).std()
+    )
+    return pd.DataFrame({"CCI": CCI})
+
+
+# Price Rate of Change
+@register_study("roc_trace", lookback=5, subplot=True, ndays=5)
+def roc(df, ndays):
+    N = df["close"].diff(ndays)
+    D = df["close"].shift(ndays)
+    return pd.DataFrame({"ROC": N / D})
+
+
+# Stochastic oscillator %K
+@register_study("stoc_trace", lookback=0, subplot=True)
+def stoc(df):
+    SOk = (df["close"] - df["low"]) / (df["high"] - df["low"])
+    return pd.DataFrame({"SO%k": SOk})
+
+
+# Momentum
+@register_study("mom_trace", lookback=5, subplot=True, n=5)
+def mom(df, n):
+    return pd.DataFrame({"MOM": df["close"].diff(n)})
+
+
+# Pivot points
+@register_study("pp_trace", lookback=0)
+def pp(df):
+    PP = (df["high"] + df["low"] + df["close"]) / 3
+    return pd.DataFrame(
+        {
+            "PP": PP,
+            "R1": 2 * PP - df["low"],
+            "S1": 2 * PP - df["high"],
+            "R2": PP + df["high"] - df["low"],
+            "S2": PP - df["high"] + df["low"],
+            "R3": df["high"] + 2 * (PP - df["low"]),
+            "S3": df["low"] - 2 * (df["high"] - PP),
+        }
+    )
+
+
+# LRU cache of computed study values, shared by all sessions. Keys are
+# (pair, period, last tick time, study name, study parameters).
+class IndicatorCache:
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self._values:
+                self.hits += 1
+                self._values.move_to_end(key)
+                return self._values[key]
+            self.misses += 1
+
+        values = compute()
+        with self.lock:
+            self._values[key] = values
+            if len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+        return values
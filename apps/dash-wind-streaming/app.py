@@ -1,6 +1,5 @@
 import os
 import pathlib
-import numpy as np
 import datetime as dt
 import dash
 import dash_core_components as dcc
@@ -9,7 +8,7 @@ import dash_html_components as html
 from dash.exceptions import PreventUpdate
 from dash.dependencies import Input, Output, State
 from scipy.stats import rayleigh
-from db.api import get_wind_data, get_wind_data_by_id
+from db.api import wind_buffer
 
 
 GRAPH_INTERVAL = os.environ.get("GRAPH_INTERVAL", 5000)
@@ -189,7 +188,7 @@ def gen_wind_speed(interval):
     """
 
     total_time = get_current_time()
-    df = get_wind_data(total_time - 200, total_time)
+    df = wind_buffer.window(total_time)
 
     trace = dict(
         type="scatter",
@@ -248,7 +247,7 @@ def gen_wind_direction(interval):
     """
 
     total_time = get_current_time()
-    df = get_wind_data_by_id(total_time)
+    df = wind_buffer.latest(total_time)
     val = df["Speed"].iloc[-1]
     direction = [0, (df["Direction"][0] - 20), (df["Direction"][0] + 20), 0]
 
@@ -290,42 +289,30 @@ def gen_wind_direction(interval):
 
 @app.callback(
     Output("wind-histogram", "figure"),
-    [Input("wind-speed-update", "n_intervals")],
     [
-        State("wind-speed", "figure"),
-        State("bin-slider", "value"),
-        State("bin-auto", "value"),
+        Input("wind-speed-update", "n_intervals"),
+        Input("bin-slider", "value"),
+        Input("bin-auto", "value"),
     ],
 )
-def gen_wind_histogram(interval, wind_speed_figure, slider_value, auto_state):
+def gen_wind_histogram(interval, slider_value, auto_state):
     """
     Genererate wind histogram graph.
 
     :params interval: upadte the graph based on an interval
-    :params wind_speed_figure: current wind speed graph
     :params slider_value: current slider value
     :params auto_state: current auto state
     """
 
-    wind_val = []
-
+    bins = "auto" if "Auto" in auto_state else slider_value
     try:
-        # Check to see whether wind-speed has been plotted yet
-        if wind_speed_figure is not None:
-            wind_val = wind_speed_figure["data"][0]["y"]
-        if "Auto" in auto_state:
-            bin_val = np.histogram(
-                wind_val,
-                bins=range(int(round(min(wind_val))), int(round(max(wind_val)))),
-            )
-        else:
-            bin_val = np.histogram(wind_val, bins=slider_value)
+        # wind speeds are binned on the server as they arrive
+        bin_val, avg_val, median_val = wind_buffer.speed_histogram(
+            get_current_time(), bins
+        )
     except Exception as error:
         raise PreventUpdate
 
-    avg_val = float(sum(wind_val)) / len(wind_val)
-    median_val = np.median(wind_val)
-
     pdf_fitted = rayleigh.pdf(
         bin_val[1], loc=(avg_val) * 0.55, scale=(bin_val[1][-1] - bin_val[1][0]) / 3
     )
@@ -425,21 +412,15 @@ def gen_wind_histogram(interval, wind_speed_figure, slider_value, auto_state):
     return dict(data=[trace, scatter_data[0], scatter_data[1], trace3], layout=layout)
 
 
-@app.callback(
-    Output("bin-auto", "value"),
-    [Input("bin-slider", "value")],
-    [State("wind-speed", "figure")],
-)
-def deselect_auto(slider_value, wind_speed_figure):
+@app.callback(Output("bin-auto", "value"), [Input("bin-slider", "value")])
+def deselect_auto(slider_value):
     """ Toggle the auto checkbox. """
 
     # prevent update if graph has no data
-    if "data" not in wind_speed_figure:
-        raise PreventUpdate
-    if not len(wind_speed_figure["data"]):
+    if not len(wind_buffer):
         raise PreventUpdate
 
-    if wind_speed_figure is not None and len(wind_speed_figure["data"][0]["y"]) > 5:
+    if len(wind_buffer) > 5:
         return [""]
     return ["Auto"]
 
@@ -1,35 +1,190 @@
 import pathlib
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
 import pandas as pd
 
+from .stats import SlidingStats
 
 DB_FILE = pathlib.Path(__file__).resolve().parent.joinpath("wind-data.db").resolve()
 
+POOL_SIZE = 4
+WINDOW_SIZE = 200
+
+WIND_COLUMNS = ["Speed", "SpeedError", "Direction"]
+RANGE_STATEMENT = (
+    "SELECT rowid, Speed, SpeedError, Direction FROM Wind "
+    "WHERE rowid > ? AND rowid <= ? ORDER BY rowid;"
+)
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of read-only connections to the wind database.
+
+    Connections are opened lazily and reused, so the number of open file
+    descriptors never grows beyond `size`.
+    """
+
+    def __init__(self, db_file, size=POOL_SIZE):
+        self.uri = pathlib.Path(db_file).as_uri() + "?mode=ro"
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, waiting for one if all of them are in use."""
+
+        try:
+            con = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    con = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                con = self._idle.get()
+        try:
+            yield con
+        finally:
+            self._idle.put(con)
+
+    def close(self):
+        """Close the idle connections."""
+
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            con.close()
+            with self._lock:
+                self._opened -= 1
+
+
+pool = ConnectionPool(DB_FILE)
 
-def get_wind_data(start, end):
+
+def _query_range(start, end):
     """
-    Query wind data rows between two ranges
+    Query rows with rowid in (start, end] as a list of tuples
 
     :params start: start row id
     :params end: end row id
-    :returns: pandas dataframe object
+    :returns: list of (rowid, Speed, SpeedError, Direction) tuples
     """
 
-    con = sqlite3.connect(str(DB_FILE))
-    statement = f'SELECT Speed, SpeedError, Direction FROM Wind WHERE rowid > "{start}" AND rowid <= "{end}";'
-    df = pd.read_sql_query(statement, con)
-    return df
+    with pool.connection() as con:
+        return con.execute(RANGE_STATEMENT, (int(start), int(end))).fetchall()
 
 
-def get_wind_data_by_id(id):
+class WindBuffer:
     """
-    Query a row from the Wind Table
+    Ring buffer of the last `size` seconds of wind data, shared by all clients.
 
-    :params id: a row id
-    :returns: pandas dataframe object
+    The buffer is advanced at most once per second: only the rows added since
+    the last advance are queried, whatever the number of clients. A row id a
+    little older than the last one queried, from a client whose clock read the
+    previous second, is served from the rows already buffered; the buffer is
+    only reset when the row id goes back further, on a new day.
     """
 
-    con = sqlite3.connect(str(DB_FILE))
-    statement = f'SELECT * FROM Wind WHERE rowid = "{id}";'
-    df = pd.read_sql_query(statement, con)
-    return df
+    def __init__(self, size=WINDOW_SIZE):
+        self.size = size
+        self.rowids = np.zeros(size, dtype=np.int64)
+        self.values = np.zeros((size, len(WIND_COLUMNS)))
+        self.head = 0  # next slot to write
+        self.count = 0
+        self.end = None  # last queried row id
+        self.speed = SlidingStats(size)
+        self._lock = threading.Lock()
+
+    def _advance(self, end):
+        if self.end is not None and self.end - self.size < end <= self.end:
+            # already buffered
+            return
+        if self.end is None or end < self.end or end - self.end >= self.size:
+            # first query, new day or buffer entirely outdated
+            self.head = 0
+            self.count = 0
+            self.speed.clear()
+            start = end - self.size
+        else:
+            start = self.end
+
+        for rowid, *values in _query_range(start, end):
+            self.rowids[self.head] = rowid
+            self.values[self.head] = values
+            self.head = (self.head + 1) % self.size
+            self.count = min(self.count + 1, self.size)
+            self.speed.push(values[0])
+        self.end = end
+
+    def window(self, end):
+        """
+        Wind data of the last `size` seconds up to row id `end`
+
+        :params end: end row id
+        :returns: pandas dataframe object
+        """
+
+        with self._lock:
+            self._advance(end)
+            order = np.arange(self.head - self.count, self.head) % self.size
+            rowids = self.rowids[order]
+            order = order[(rowids > end - self.size) & (rowids <= end)]
+            return pd.DataFrame(self.values[order], columns=WIND_COLUMNS)
+
+    def latest(self, end):
+        """
+        Wind data of row id `end`
+
+        :params end: row id
+        :returns: pandas dataframe object, empty if there is no such row
+        """
+
+        with self._lock:
+            self._advance(end)
+            # the last row, or a previous one for an older row id
+            order = np.arange(self.head - self.count, self.head) % self.size
+            slots = order[self.rowids[order] == end]
+            return pd.DataFrame(self.values[slots[-1:]], columns=WIND_COLUMNS)
+
+    def speed_histogram(self, end, bins):
+        """
+        Histogram, mean and median of the wind speeds in the window, the
+        window of the last row id queried for an older `end`
+
+        :params end: end row id
+        :params bins: number of bins, or "auto" for one bin per mph
+        :returns: tuple of (counts, bin edges), mean and median
+        """
+
+        with self._lock:
+            self._advance(end)
+            if not len(self.speed):
+                raise ValueError("no wind data in the window")
+            if bins == "auto":
+                bins = range(int(round(self.speed.min)), int(round(self.speed.max)))
+            return self.speed.histogram(bins), self.speed.mean, self.speed.median
+
+    def __len__(self):
+        return self.count
+
+
+wind_buffer = WindBuffer()
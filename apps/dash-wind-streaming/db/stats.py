@@ -0,0 +1,98 @@
+import bisect
+from collections import deque
+
+import numpy as np
+
+
+class SlidingStats:
+    """
+    Statistics of the last `size` samples of a stream, updated as each sample
+    arrives.
+
+    Samples are also kept sorted, so the median and histograms with any number
+    of bins are read without going through the samples again.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self.samples = deque()
+        self.sorted = []
+        self.total = 0.0
+
+    def __len__(self):
+        return len(self.samples)
+
+    def push(self, value):
+        """
+        Add a sample, dropping the oldest one once there are `size` samples
+
+        :params value: new sample
+        """
+
+        if len(self.samples) == self.size:
+            oldest = self.samples.popleft()
+            del self.sorted[bisect.bisect_left(self.sorted, oldest)]
+            self.total -= oldest
+        self.samples.append(value)
+        bisect.insort(self.sorted, value)
+        self.total += value
+
+    @property
+    def mean(self):
+        return self.total / len(self.samples)
+
+    @property
+    def median(self):
+        n = len(self.sorted)
+        middle = n // 2
+        if n % 2:
+            return self.sorted[middle]
+        return (self.sorted[middle - 1] + self.sorted[middle]) / 2
+
+    @property
+    def min(self):
+        return self.sorted[0]
+
+    @property
+    def max(self):
+        return self.sorted[-1]
+
+    def quantile(self, q):
+        """
+        Quantile of the samples, with linear interpolation like np.quantile
+
+        :params q: quantile between 0 and 1
+        """
+
+        position = q * (len(self.sorted) - 1)
+        low = int(np.floor(position))
+        high = min(low + 1, len(self.sorted) - 1)
+        fraction = position - low
+        return self.sorted[low] + (self.sorted[high] - self.sorted[low]) * fraction
+
+    def histogram(self, bins):
+        """
+        Histogram of the samples, same as np.histogram(samples, bins)
+
+        :params bins: number of equal-width bins or sequence of bin edges
+        :returns: tuple of counts and bin edges
+        """
+
+        values = np.asarray(self.sorted)
+        if np.ndim(bins) == 0:
+            low, high = float(values[0]), float(values[-1])
+            if low == high:
+                low, high = low - 0.5, high + 0.5
+            edges = np.linspace(low, high, int(bins) + 1)
+        else:
+            edges = np.asarray(bins, dtype=float)
+            if len(edges) < 2:
+                raise ValueError("bins must have at least two edges")
+
+        # last bin includes its right edge
+        positions = np.searchsorted(values, edges, side="left")
+        positions[-1] = np.searchsorted(values, edges[-1], side="right")
+        return np.diff(positions), edges